@@ -2,22 +2,133 @@ from flask import Flask, request
 from flask_cors import CORS
 from config import Config
 from .models import db
+from .utils.cache import TTLLRUCache
+from .utils.read_replica import create_read_engine
+from .services.job_service import JobRunner, fail_interrupted_jobs
 from sqlalchemy.exc import OperationalError
-from sqlalchemy import text
+from sqlalchemy import event, text
 from flask import jsonify
 import os
 import sys
 
 
-def _optimize_sqlite_runtime(app):
+def _ensure_score_unique_index():
     """
-    对 SQLite 做运行时优化。
-    1) 设置并发友好的 PRAGMA
-    2) 为高频查询补齐索引（兼容已有库，无需迁移）
+    建立 scores(student_id, exam_task_id) 唯一索引（upsert_scores 的 ON CONFLICT 依赖它），
+    建立前清理历史重复成绩。唯一索引已存在时跳过。
+
+    旧版各写入路径都通过 .first() 修改同键下 id 最小的一条，因此保留 MIN(id)；
+    被删除的重复行先复制到 scores_dedupe_backup 备份表，便于人工核对。
     """
-    if db.engine.url.drivername != "sqlite":
+    exists = db.session.execute(
+        text(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='uq_scores_student_exam'"
+        )
+    ).first()
+    if exists:
         return
 
+    duplicate_filter = (
+        "student_id IS NOT NULL AND exam_task_id IS NOT NULL AND id NOT IN ("
+        " SELECT MIN(id) FROM scores"
+        " WHERE student_id IS NOT NULL AND exam_task_id IS NOT NULL"
+        " GROUP BY student_id, exam_task_id)"
+    )
+    db.session.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS scores_dedupe_backup AS"
+            " SELECT *, CURRENT_TIMESTAMP AS backup_time FROM scores WHERE 0"
+        )
+    )
+    db.session.execute(
+        text(
+            "INSERT INTO scores_dedupe_backup"
+            f" SELECT *, CURRENT_TIMESTAMP FROM scores WHERE {duplicate_filter}"
+        )
+    )
+    result = db.session.execute(text(f"DELETE FROM scores WHERE {duplicate_filter}"))
+    if result.rowcount:
+        print(
+            f">> [SQLite] 已清理重复成绩记录 {result.rowcount} 条"
+            "（保留各学生各考试 id 最小的一条，删除的记录已备份到 scores_dedupe_backup）"
+        )
+
+    # 唯一索引已覆盖 (student_id, exam_task_id)，旧的普通索引不再需要
+    db.session.execute(text("DROP INDEX IF EXISTS idx_scores_student_exam"))
+    db.session.execute(
+        text(
+            "CREATE UNIQUE INDEX uq_scores_student_exam ON scores(student_id, exam_task_id)"
+        )
+    )
+
+
+# 旧库中缺失的新增列：(表名, 列名, 列定义)。create_all 只建新表，不会给已有表加列
+_ADDED_COLUMNS = [
+    ("exam_tasks", "score_version", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def _add_missing_columns():
+    for table, column, definition in _ADDED_COLUMNS:
+        existing = {
+            row[1] for row in db.session.execute(text(f"PRAGMA table_info({table})"))
+        }
+        if column not in existing:
+            db.session.execute(
+                text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            )
+            print(f">> [SQLite] 已为 {table} 补充列 {column}")
+
+
+# 由触发器维护 data_versions 版本号的业务表（成绩变动通过 exam_tasks.score_version 体现）
+_VERSIONED_TABLES = ["classes", "course_assignments", "exam_tasks", "students", "subjects"]
+# 只在这些列变化时递增表版本号；exam_tasks.score_version 随每次成绩保存递增，
+# 不能波及按 exam_tasks 版本号计算 ETag 的任课/考试列表接口
+_VERSIONED_UPDATE_COLUMNS = {
+    "exam_tasks": [
+        "name",
+        "entry_year",
+        "academic_year",
+        "subject_id",
+        "full_score",
+        "is_active",
+        "create_time",
+    ],
+}
+
+
+def _install_version_triggers():
+    for table in _VERSIONED_TABLES:
+        db.session.execute(
+            text(
+                "INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (:t, 0)"
+            ),
+            {"t": table},
+        )
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            event = op
+            if op == "UPDATE" and table in _VERSIONED_UPDATE_COLUMNS:
+                event = f"UPDATE OF {', '.join(_VERSIONED_UPDATE_COLUMNS[table])}"
+                # 旧库中的触发器不限列，重建一次
+                db.session.execute(
+                    text(f"DROP TRIGGER IF EXISTS trg_{table}_version_update")
+                )
+            db.session.execute(
+                text(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{op.lower()} "
+                    f"AFTER {event} ON {table} BEGIN "
+                    f"UPDATE data_versions SET version = version + 1 "
+                    f"WHERE table_name = '{table}'; END;"
+                )
+            )
+
+
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+def _sqlite_pragma_profile(app):
+    """按配置生成每个连接需要设置的 PRAGMA（有序），非法取值回退为保守设置。"""
     allowed_journal_modes = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
     allowed_synchronous = {"OFF", "NORMAL", "FULL", "EXTRA"}
 
@@ -32,33 +143,155 @@ def _optimize_sqlite_runtime(app):
         print(f">> [SQLite] 无效 SQLITE_SYNCHRONOUS={synchronous}，回退 FULL")
         synchronous = "FULL"
 
-    pragma_sql = [
-        f"PRAGMA journal_mode={journal_mode};",
-        f"PRAGMA synchronous={synchronous};",
-        "PRAGMA temp_store=MEMORY;",
-        "PRAGMA foreign_keys=ON;",
-    ]
+    def int_config(key, default):
+        try:
+            return int(app.config.get(key, default))
+        except (TypeError, ValueError):
+            print(f">> [SQLite] 无效 {key}={app.config.get(key)}，回退 {default}")
+            return default
+
+    return {
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,
+        "cache_size": int_config("SQLITE_CACHE_SIZE", -2000),
+        "mmap_size": max(int_config("SQLITE_MMAP_SIZE", 0), 0),
+        "busy_timeout": max(int_config("SQLITE_BUSY_TIMEOUT", 30000), 0),
+        "wal_autocheckpoint": int_config("SQLITE_WAL_AUTOCHECKPOINT", 1000),
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    }
+
+
+def _read_sqlite_pragmas(cursor, names):
+    effective = {}
+    for name in names:
+        row = cursor.execute(f"PRAGMA {name}").fetchone()
+        value = row[0] if row else None
+        if name == "journal_mode" and value is not None:
+            value = str(value).upper()
+        elif name == "synchronous":
+            value = _SYNCHRONOUS_NAMES.get(value, value)
+        elif name == "temp_store":
+            value = _TEMP_STORE_NAMES.get(value, value)
+        elif name == "foreign_keys":
+            value = "ON" if value else "OFF"
+        effective[name] = value
+    return effective
+
+
+def _install_sqlite_pragma_hook(app):
+    """
+    在连接池每个新建连接上设置 PRAGMA。只在启动时执行一次 PRAGMA
+    只会作用于当时取到的那一个连接，池中其他连接仍是默认值。
+    首个连接输出完整的生效值，之后的连接只在生效值不一致时告警。
+    """
+    if db.engine.url.drivername != "sqlite":
+        return
+
+    profile = app.config.get("SQLITE_MODE_PROFILE", "conservative")
+    pragmas = _sqlite_pragma_profile(app)
+    reported = {}
+
+    @event.listens_for(db.engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            effective = _read_sqlite_pragmas(cursor, pragmas.keys())
+        finally:
+            cursor.close()
+
+        summary = ", ".join(f"{name}={value}" for name, value in effective.items())
+        if not reported:
+            reported.update(effective)
+            print(f">> [SQLite] 连接 PRAGMA 已应用（{profile}）: {summary}")
+        elif effective != reported:
+            print(f">> [SQLite] ⚠️ 新连接 PRAGMA 与首个连接不一致: {summary}")
+
+
+def _init_sqlite_read_engine(app):
+    """
+    创建报表查询使用的只读引擎（mode=ro）。仅在 WAL 模式下启用：
+    DELETE 等回滚日志模式下读事务同样会阻塞写入提交，只读连接没有收益。
+    """
+    app.extensions["sqlite_read_engine"] = None
+    if db.engine.url.drivername != "sqlite" or not app.config.get("SQLITE_READ_REPLICA", True):
+        return
+
+    database = db.engine.url.database
+    if not database or database == ":memory:" or database.startswith("file:"):
+        return
+
+    journal_mode = str(db.session.execute(text("PRAGMA journal_mode")).scalar() or "")
+    db.session.commit()
+    if journal_mode.upper() != "WAL":
+        print(
+            f">> [SQLite] ⚠️ 只读连接未启用：当前模式 {app.config.get('SQLITE_MODE_PROFILE')}"
+            f"（journal_mode={journal_mode}），统计报表与写入共用主连接。"
+            "请检查 SQLITE_JOURNAL_MODE 配置，或数据库是否位于不支持 WAL 的网络共享目录"
+        )
+        return
+
+    try:
+        engine = create_read_engine(database, _sqlite_pragma_profile(app))
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        print(f">> [SQLite] 只读连接初始化失败，报表查询继续使用主连接: {e}")
+        return
+
+    app.extensions["sqlite_read_engine"] = engine
+    print(">> [SQLite] 只读连接已启用：统计报表、导出与日志查询不占用写锁")
+
+
+def _optimize_sqlite_runtime(app):
+    """
+    对 SQLite 做运行时优化（PRAGMA 由 _install_sqlite_pragma_hook 在每个连接上设置）。
+    1) 为旧库补齐新增列（模型已映射这些列，失败则终止启动）
+    2) 清理重复成绩并建立成绩唯一索引（写入依赖它，失败则终止启动）
+    3) 为高频查询补齐索引（兼容已有库，无需迁移）
+    4) 安装数据版本触发器（供 ETag 使用）
+    """
+    if db.engine.url.drivername != "sqlite":
+        return
+
+    # 新增列单独一个事务：后续优化项失败回滚时不会连带撤销 ALTER TABLE
+    try:
+        _add_missing_columns()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise RuntimeError(f"数据库结构升级失败（补充新增列），无法启动: {e}") from e
+
+    # 成绩唯一索引是成绩写入（INSERT ... ON CONFLICT）的前提，同样单独提交、失败即终止启动
+    try:
+        _ensure_score_unique_index()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise RuntimeError(
+            f"数据库结构升级失败（成绩唯一索引），成绩无法保存，停止启动: {e}"
+        ) from e
 
     index_sql = [
         "CREATE INDEX IF NOT EXISTS idx_students_class_status ON students(class_id, status);",
         "CREATE INDEX IF NOT EXISTS idx_students_class_student_id ON students(class_id, student_id);",
         "CREATE INDEX IF NOT EXISTS idx_scores_exam_student ON scores(exam_task_id, student_id);",
-        "CREATE INDEX IF NOT EXISTS idx_scores_student_exam ON scores(student_id, exam_task_id);",
         "CREATE INDEX IF NOT EXISTS idx_scores_exam_class_snapshot ON scores(exam_task_id, class_id_snapshot);",
+        "CREATE INDEX IF NOT EXISTS idx_scores_term_student ON scores(term, student_id);",
         "CREATE INDEX IF NOT EXISTS idx_course_teacher_subject_year_class ON course_assignments(teacher_id, subject_id, academic_year, class_id);",
         "CREATE INDEX IF NOT EXISTS idx_course_class_subject_year ON course_assignments(class_id, subject_id, academic_year);",
         "CREATE INDEX IF NOT EXISTS idx_exam_task_filter_active ON exam_tasks(entry_year, subject_id, academic_year, is_active, create_time);",
     ]
 
     try:
-        for sql in pragma_sql:
-            db.session.execute(text(sql))
-
         for sql in index_sql:
             db.session.execute(text(sql))
 
+        _install_version_triggers()
+
         db.session.commit()
-        print(f">> [SQLite] PRAGMA 已应用: journal_mode={journal_mode}, synchronous={synchronous}")
     except Exception as e:
         db.session.rollback()
         print(f">> [SQLite] 性能优化项应用失败: {e}")
@@ -93,6 +326,20 @@ def create_app(config_class=Config):
     # 初始化插件
     CORS(app)
     db.init_app(app)
+    with app.app_context():
+        # 必须在首次建立连接（create_all）之前注册
+        _install_sqlite_pragma_hook(app)
+    app.extensions["stats_result_cache"] = TTLLRUCache(
+        maxsize=app.config.get("STATS_RESULT_CACHE_SIZE", 32),
+        ttl=app.config.get("STATS_RESULT_CACHE_TTL", 600),
+    )
+    app.extensions["identity_cache"] = TTLLRUCache(
+        maxsize=app.config.get("AUTH_IDENTITY_CACHE_SIZE", 1024),
+        ttl=app.config.get("AUTH_IDENTITY_CACHE_TTL", 60),
+    )
+    app.extensions["job_runner"] = JobRunner(
+        max_workers=app.config.get("BACKGROUND_JOB_WORKERS", 1)
+    )
 
     @app.errorhandler(413)
     def request_entity_too_large(error):
@@ -140,6 +387,8 @@ def create_app(config_class=Config):
     with app.app_context():
         db.create_all()
         _optimize_sqlite_runtime(app)
+        _init_sqlite_read_engine(app)
+        fail_interrupted_jobs()
 
         from .models import Subject
 
@@ -1,14 +1,25 @@
+from collections import namedtuple
 from functools import wraps
 import hashlib
 import hmac
+import time
 
 from flask import current_app, g, jsonify, request
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 
-from app.models import User
+from app.models import Teacher, User
+from app.utils.cache import get_identity_cache
 
 TOKEN_SALT = "student-sys-access-token-v1"
 
+# 已通过校验的登录身份；g.current_user 的轻量替身，只保留路由实际用到的字段
+AuthIdentity = namedtuple(
+    "AuthIdentity",
+    "id username real_name role must_change_password teacher",
+)
+# 教师档案引用（路由只用到 id）
+TeacherRef = namedtuple("TeacherRef", "id name")
+
 
 def _get_serializer():
     return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
@@ -54,46 +65,93 @@ def require_auth(required_roles=None, enforce_password_change=True):
     if not token:
         return jsonify({"msg": "未登录或登录已过期，请重新登录"}), 401
 
+    cache = get_identity_cache()
+    cached = cache.get(token) if cache is not None else None
+    if cached is not None:
+        identity, expires_at = cached
+        if time.time() > expires_at:
+            return jsonify({"msg": "登录状态已过期，请重新登录"}), 401
+    else:
+        generation = cache.generation() if cache is not None else None
+        identity, expires_at, auth_error = _authenticate_token(token)
+        if auth_error:
+            return auth_error
+        if cache is not None:
+            cache.set(
+                token,
+                (identity, expires_at),
+                tags=(identity.id,),
+                generation=generation,
+            )
+
+    if enforce_password_change and identity.must_change_password:
+        return jsonify({"msg": "为了账号安全，请先修改初始密码"}), 403
+
+    roles = set(required_roles or [])
+    if roles and identity.role not in roles:
+        return jsonify({"msg": "无权访问该接口"}), 403
+
+    g.current_user = identity
+    return None
+
+
+def _authenticate_token(token):
+    """
+    完整校验 token：签名与有效期、账号状态、角色、密码签名。
+    返回 (identity, token 过期时间戳, None)，失败时返回 (None, None, 错误响应)。
+    """
+    ttl = _get_token_ttl_seconds()
     try:
-        payload = _get_serializer().loads(
+        payload, issued_at = _get_serializer().loads(
             token,
             salt=TOKEN_SALT,
-            max_age=_get_token_ttl_seconds(),
+            max_age=ttl,
+            return_timestamp=True,
         )
     except SignatureExpired:
-        return jsonify({"msg": "登录状态已过期，请重新登录"}), 401
+        return None, None, (jsonify({"msg": "登录状态已过期，请重新登录"}), 401)
     except BadSignature:
-        return jsonify({"msg": "登录凭证无效，请重新登录"}), 401
+        return None, None, (jsonify({"msg": "登录凭证无效，请重新登录"}), 401)
 
     user_id = payload.get("uid")
     token_role = payload.get("role")
     token_pwd_sig = payload.get("pwd_sig")
 
     if not isinstance(user_id, int) or not token_role or not token_pwd_sig:
-        return jsonify({"msg": "登录凭证格式非法，请重新登录"}), 401
+        return None, None, (jsonify({"msg": "登录凭证格式非法，请重新登录"}), 401)
 
     user = User.query.get(user_id)
     if not user:
-        return jsonify({"msg": "账号不存在，请重新登录"}), 401
+        return None, None, (jsonify({"msg": "账号不存在，请重新登录"}), 401)
 
     if not user.is_approved:
-        return jsonify({"msg": "账号不可用，请联系管理员"}), 403
+        return None, None, (jsonify({"msg": "账号不可用，请联系管理员"}), 403)
 
     if user.role != token_role:
-        return jsonify({"msg": "账号权限已变更，请重新登录"}), 401
+        return None, None, (jsonify({"msg": "账号权限已变更，请重新登录"}), 401)
 
     if token_pwd_sig != _build_password_signature(user):
-        return jsonify({"msg": "登录状态已失效，请重新登录"}), 401
-
-    if enforce_password_change and user.must_change_password:
-        return jsonify({"msg": "为了账号安全，请先修改初始密码"}), 403
-
-    roles = set(required_roles or [])
-    if roles and user.role not in roles:
-        return jsonify({"msg": "无权访问该接口"}), 403
-
-    g.current_user = user
-    return None
+        return None, None, (jsonify({"msg": "登录状态已失效，请重新登录"}), 401)
+
+    teacher = None
+    if user.role == "teacher":
+        row = (
+            Teacher.query.with_entities(Teacher.id, Teacher.name)
+            .filter_by(user_id=user.id)
+            .first()
+        )
+        if row:
+            teacher = TeacherRef(row.id, row.name)
+
+    identity = AuthIdentity(
+        id=user.id,
+        username=user.username,
+        real_name=user.real_name,
+        role=user.role,
+        must_change_password=bool(user.must_change_password),
+        teacher=teacher,
+    )
+    return identity, issued_at.timestamp() + ttl, None
 
 
 def auth_required(required_roles=None, enforce_password_change=True):
@@ -3,7 +3,10 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import UniqueConstraint  # 引入联合唯一约束
 
-db = SQLAlchemy()
+from app.utils.read_replica import RoutingSession
+
+# 报表查询可路由到只读连接，见 app/utils/read_replica.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 # 注册状态表
@@ -104,6 +107,8 @@ class ExamTask(db.Model):
     full_score = db.Column(db.Float, default=100.0)
     is_active = db.Column(db.Boolean, default=True)
     create_time = db.Column(db.DateTime, default=datetime.now)
+    # 成绩版本号：该任务的成绩（或任务本身）每次变动递增，用于缓存键与 ETag
+    score_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     subject = db.relationship("Subject")
 
@@ -241,6 +246,13 @@ class Score(db.Model):
     create_time = db.Column(db.DateTime, default=datetime.now)
     update_time = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 同一学生同一考试任务只保留一条成绩，供 INSERT ... ON CONFLICT 批量写入使用
+    __table_args__ = (
+        db.Index(
+            "uq_scores_student_exam", "student_id", "exam_task_id", unique=True
+        ),
+    )
+
 
 class ImportBatch(db.Model):
     __tablename__ = "import_batches"
@@ -295,3 +307,84 @@ class AuditLog(db.Model):
 
     detail_text = db.Column(db.Text, nullable=False, default="")
     client_ip = db.Column(db.String(64), nullable=False, default="")
+
+
+class ExamResultSnapshot(db.Model):
+    """
+    已锁定考试的综合成绩物化结果（每个学生一行）。
+    以 年级 + 考试名 + 科目组合 为键，成绩变动时整体失效重建。
+    """
+
+    __tablename__ = "exam_result_snapshots"
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_year = db.Column(db.Integer, nullable=False)
+    exam_name = db.Column(db.String(50), nullable=False)
+    # 排序后的科目ID组合，如 "1,2,3"
+    subject_key = db.Column(db.String(128), nullable=False)
+
+    student_id = db.Column(db.Integer, db.ForeignKey("students.id"), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey("classes.id"), nullable=True)
+
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    # JSON 字符串: {科目名: 分数 或 "缺考"}
+    scores_json = db.Column(db.Text, nullable=False, default="{}")
+
+    grade_rank_skip = db.Column(db.Integer, nullable=False)
+    grade_rank_dense = db.Column(db.Integer, nullable=False)
+    class_rank_skip = db.Column(db.Integer, nullable=False)
+    class_rank_dense = db.Column(db.Integer, nullable=False)
+
+    create_time = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            "idx_exam_snapshot_key_rank",
+            "entry_year",
+            "exam_name",
+            "subject_key",
+            "grade_rank_dense",
+        ),
+    )
+
+
+class BackgroundJob(db.Model):
+    """
+    后台任务（Excel 导入等耗时操作）。上传接口立即返回任务ID，
+    前端轮询任务状态与结果；运行中的进度保存在内存，结束时写回本表。
+    导入在单个写事务内执行，期间无法另开连接节流写入进度，因此本表的
+    processed_rows/total_rows 在任务结束前不更新：进度只对本进程可见，重启后丢失（任务标记为失败）。
+    """
+
+    __tablename__ = "background_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 任务类型: student_import / teacher_import / course_assign_import / score_import / score_rollback
+    job_type = db.Column(db.String(32), nullable=False, index=True)
+    # 状态: pending / running / success / failed
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    source_filename = db.Column(db.String(255), default="")
+    created_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+
+    # JSON 字符串: 处理结果（与同步接口的响应体一致）；http_status 为对应状态码
+    result_json = db.Column(db.Text, nullable=False, default="{}")
+    http_status = db.Column(db.Integer, nullable=True)
+
+    create_time = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=True)
+    finish_time = db.Column(db.DateTime, nullable=True)
+
+
+class DataVersion(db.Model):
+    """
+    业务表的数据版本号，由 SQLite 触发器在增删改时递增（见 app/__init__.py）。
+    用于生成 ETag：版本号不变即可判定接口数据未变化，无需重新查询。
+    """
+
+    __tablename__ = "data_versions"
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
@@ -16,6 +16,7 @@ from . import (
     course_mgmt,
     exam_mgmt,
     import_api,
+    job_api,
     stats_api,
     student_mgmt,
     teacher_mgmt,
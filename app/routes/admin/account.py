@@ -1,6 +1,7 @@
 from flask import jsonify, request
 
 from app.models import SystemSetting, Teacher, User, db
+from app.services.invalidation_service import invalidate_user_identity
 
 from . import admin_bp
 
@@ -44,6 +45,7 @@ def approve_user(user_id):
         print(f">> [自动建档] 已为 {user.username} 创建教师档案")
 
     user.is_approved = True
+    invalidate_user_identity([user.id])
     db.session.commit()
     return jsonify({"msg": "审核已通过，教师档案已建立"})
 
@@ -55,6 +57,7 @@ def reject_user(user_id):
         if user.teacher_profile:
             db.session.delete(user.teacher_profile)
         db.session.delete(user)
+        invalidate_user_identity([user_id])
         db.session.commit()
     return jsonify({"msg": "申请已拒绝"})
 
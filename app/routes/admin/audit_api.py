@@ -4,6 +4,7 @@ from flask import g, jsonify, request
 from sqlalchemy import or_
 
 from app.models import AuditLog
+from app.utils.read_replica import use_read_replica
 
 from . import admin_bp
 
@@ -18,6 +19,7 @@ def _parse_date(date_text):
 
 
 @admin_bp.route("/audit_logs", methods=["GET"])
+@use_read_replica
 def get_audit_logs():
     current_user = g.current_user
     if not current_user or current_user.username != "adminwds":
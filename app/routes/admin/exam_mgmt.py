@@ -2,10 +2,17 @@ from datetime import datetime
 
 from flask import g, jsonify, request
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 
 from app.models import ClassInfo, ExamTask, Score, Student, Subject, db
-from app.services.audit_service import append_score_update_audit_log
-from app.services.progress_service import calc_exam_task_progress
+from app.services.audit_service import (
+    build_score_update_audit_row,
+    bulk_insert_audit_rows,
+)
+from app.services.invalidation_service import invalidate_exam_results
+from app.services.progress_service import calc_exam_tasks_progress
+from app.services.score_service import SCORE_FIELDS, prefetch_scores, upsert_scores
+from app.services.stats_service import build_exam_snapshot
 
 from . import admin_bp
 
@@ -23,7 +30,7 @@ def get_exam_tasks():
     page = max(page, 1)
     page_size = min(max(page_size, 1), 100)
 
-    query = ExamTask.query
+    query = ExamTask.query.options(joinedload(ExamTask.subject))
     if entry_year:
         query = query.filter_by(entry_year=entry_year)
     if subject_id:
@@ -39,9 +46,10 @@ def get_exam_tasks():
     else:
         tasks = query.all()
 
+    progress_map = calc_exam_tasks_progress(tasks)
     result = []
     for t in tasks:
-        progress = calc_exam_task_progress(t)
+        progress = progress_map[t.id]
         result.append(
             {
                 "id": t.id,
@@ -53,6 +61,7 @@ def get_exam_tasks():
                 "full_score": t.full_score,
                 "is_active": t.is_active,
                 "academic_year": t.academic_year,
+                "score_version": t.score_version,
                 "assigned_class_count": progress["assigned_class_count"],
                 "completed_class_count": progress["completed_class_count"],
                 "pending_class_count": progress["pending_class_count"],
@@ -97,6 +106,8 @@ def add_exam_task():
         is_active=data.get("is_active", True),
     )
     db.session.add(new_task)
+    db.session.flush()
+    invalidate_exam_results([new_task.id])
     db.session.commit()
     return jsonify({"msg": "发布成功"})
 
@@ -108,6 +119,8 @@ def update_exam_task(id):
         return jsonify({"msg": "任务不存在"}), 404
 
     data = request.get_json()
+    # 改名时旧考试名下的快照与缓存也需失效
+    old_exam_key = (task.entry_year, task.name)
     if "full_score" in data:
         task.full_score = data["full_score"]
     if "is_active" in data:
@@ -115,7 +128,18 @@ def update_exam_task(id):
     if "name" in data:
         task.name = data["name"]
 
+    db.session.flush()
+    invalidate_exam_results([task.id], extra_exam_keys=[old_exam_key])
     db.session.commit()
+
+    # 锁定后若该考试全部科目均已锁定，预先物化排名结果
+    if not task.is_active:
+        try:
+            if build_exam_snapshot(task.entry_year, task.name):
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ 考试锁定后生成成绩快照失败: {e}")
     return jsonify({"msg": "更新成功"})
 
 
@@ -126,6 +150,7 @@ def delete_exam_task(id):
         return jsonify({"msg": "任务不存在"}), 404
 
     try:
+        invalidate_exam_results([id])
         Score.query.filter_by(exam_task_id=id).delete()
         db.session.delete(task)
         db.session.commit()
@@ -246,6 +271,18 @@ def save_admin_scores():
     if len(student_map) != len(set(student_ids)):
         return jsonify({"msg": "提交数据中包含不存在的学生"}), 400
 
+    # 一次性预取已有成绩与班级名称，内存比对后通过 UPSERT 批量写入
+    current_state = {
+        sid: state
+        for (sid, _), state in prefetch_scores([task.id], student_map.keys()).items()
+    }
+    class_name_map = {
+        c.id: c.full_name
+        for c in ClassInfo.query.filter(
+            ClassInfo.id.in_({stu.class_id for stu in students})
+        ).all()
+    }
+
     missing_count = 0
     invalid_count = 0
     updated_count = 0
@@ -255,6 +292,9 @@ def save_admin_scores():
     if "," in client_ip:
         client_ip = client_ip.split(",")[0].strip()
 
+    pending_rows = {}
+    audit_rows = []
+
     for item in scores_data:
         student_obj = student_map[item["student_id"]]
         raw_val = item["score"]
@@ -279,47 +319,60 @@ def save_admin_scores():
                 invalid_count += 1
                 continue
 
-        existing_score = Score.query.filter_by(
-            student_id=item["student_id"], exam_task_id=exam_task_id
-        ).first()
+        existing_score = current_state.get(student_obj.id)
 
         if existing_score:
-            old_score = existing_score.score
-            old_remark = existing_score.remark
-            existing_score.score = final_score
-            existing_score.remark = final_remark
-            existing_score.class_id_snapshot = student_obj.class_id
+            old_score = existing_score["score"]
+            old_remark = existing_score["remark"]
+            if (
+                old_score != final_score
+                or old_remark != final_remark
+                or existing_score["class_id_snapshot"] != student_obj.class_id
+            ):
+                existing_score["score"] = final_score
+                existing_score["remark"] = final_remark
+                existing_score["class_id_snapshot"] = student_obj.class_id
+                pending_rows[student_obj.id] = existing_score
             if old_score != final_score or old_remark != final_remark:
-                append_score_update_audit_log(
-                    actor_user=actor_user,
-                    student_obj=student_obj,
-                    task_obj=task,
-                    old_score=old_score,
-                    old_remark=old_remark,
-                    new_score=final_score,
-                    new_remark=final_remark,
-                    source="admin_score_entry_save",
-                    class_id=student_obj.class_id,
-                    class_name=student_obj.current_class_rel.full_name
-                    if student_obj.current_class_rel
-                    else "",
-                    client_ip=client_ip,
+                audit_rows.append(
+                    build_score_update_audit_row(
+                        actor_user=actor_user,
+                        student_obj=student_obj,
+                        task_obj=task,
+                        old_score=old_score,
+                        old_remark=old_remark,
+                        new_score=final_score,
+                        new_remark=final_remark,
+                        source="admin_score_entry_save",
+                        class_id=student_obj.class_id,
+                        class_name=class_name_map.get(student_obj.class_id, ""),
+                        client_ip=client_ip,
+                    )
                 )
                 updated_count += 1
         else:
-            new_score = Score(
-                student_id=student_obj.id,
-                subject_id=task.subject_id,
-                exam_task_id=exam_task_id,
-                score=final_score,
-                term=task.name,
-                remark=final_remark,
-                class_id_snapshot=student_obj.class_id,
-            )
-            db.session.add(new_score)
+            new_row = {
+                "student_id": student_obj.id,
+                "subject_id": task.subject_id,
+                "exam_task_id": task.id,
+                "score": final_score,
+                "term": task.name,
+                "remark": final_remark,
+                "class_id_snapshot": student_obj.class_id,
+            }
+            current_state[student_obj.id] = new_row
+            pending_rows[student_obj.id] = new_row
             added_count += 1
 
     try:
+        upsert_scores(
+            [
+                {field: state[field] for field in SCORE_FIELDS}
+                for state in pending_rows.values()
+            ]
+        )
+        bulk_insert_audit_rows(audit_rows)
+        invalidate_exam_results([task.id])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
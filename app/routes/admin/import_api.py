@@ -1,21 +1,28 @@
 import json
-from datetime import datetime
 from urllib.parse import quote
 
-from flask import jsonify, request, send_file
+from flask import g, jsonify, request, send_file
 
-from app.models import ImportBatch, db
-from app.services import excel_service, rollback_service
+from app.models import ImportBatch
+from app.services import excel_service, job_service, rollback_service
+from app.services.rollback_service import IMPORT_TYPE_LABELS
 from app.utils.helpers import _json_loads
+from app.utils.read_replica import use_read_replica
 
 from . import admin_bp
 
-IMPORT_TYPE_LABELS = {
-    "student": "学生名单",
-    "teacher": "教师信息",
-    "course_assign": "任课分配",
-    "score": "成绩",
-}
+
+def _submit_import_job(job_type, func, file, **kwargs):
+    """导入改为后台任务：立即返回任务ID，前端轮询 /jobs/<id> 获取进度与结果。"""
+    job = job_service.submit_job(
+        job_type,
+        func,
+        source_filename=file.filename,
+        created_by=g.current_user.id,
+        file=job_service.detach_upload(file),
+        **kwargs,
+    )
+    return jsonify({"msg": "导入任务已提交，正在后台处理", "job_id": job.id}), 202
 
 
 @admin_bp.route("/students/import", methods=["POST"])
@@ -27,11 +34,11 @@ def import_students_excel():
     if file.filename == "":
         return jsonify({"msg": "文件名为空"}), 400
 
-    result, status = excel_service.process_students_import(file)
-    return jsonify(result), status
+    return _submit_import_job("student_import", excel_service.process_students_import, file)
 
 
 @admin_bp.route("/students/export", methods=["GET"])
+@use_read_replica
 def export_students():
     class_id = request.args.get("class_id", type=int)
     output, filename = excel_service.export_students_excel(class_id)
@@ -50,11 +57,16 @@ def import_teachers_excel():
         return jsonify({"msg": "没有上传文件"}), 400
     file = request.files["file"]
     academic_year = request.form.get("academic_year", type=int)
-    result, status = excel_service.process_teachers_import(file, academic_year)
-    return jsonify(result), status
+    return _submit_import_job(
+        "teacher_import",
+        excel_service.process_teachers_import,
+        file,
+        academic_year=academic_year,
+    )
 
 
 @admin_bp.route("/teachers/export", methods=["GET"])
+@use_read_replica
 def export_teachers():
     academic_year = request.args.get("academic_year", type=int)
     output, filename = excel_service.export_teachers_excel(academic_year)
@@ -74,11 +86,16 @@ def import_course_assignments():
 
     file = request.files["file"]
     academic_year = request.form.get("academic_year", type=int)
-    result, status = excel_service.process_course_assignments_import(file, academic_year)
-    return jsonify(result), status
+    return _submit_import_job(
+        "course_assign_import",
+        excel_service.process_course_assignments_import,
+        file,
+        academic_year=academic_year,
+    )
 
 
 @admin_bp.route("/assignments/export", methods=["GET"])
+@use_read_replica
 def export_course_assignments():
     try:
         output, filename = excel_service.export_course_assignments_excel()
@@ -95,6 +112,7 @@ def export_course_assignments():
 
 
 @admin_bp.route("/stats/score_template", methods=["POST"])
+@use_read_replica
 def get_score_import_template():
     data = request.get_json() or {}
     entry_year = data.get("entry_year")
@@ -136,14 +154,15 @@ def import_admin_scores():
     except Exception:
         return jsonify({"msg": "参数解析错误"}), 400
 
-    result, status = excel_service.process_admin_scores_import(
-        file=file,
+    return _submit_import_job(
+        "score_import",
+        excel_service.process_admin_scores_import,
+        file,
         entry_year=entry_year,
         exam_name=exam_name,
         subject_ids=subject_ids,
         class_ids=class_ids,
     )
-    return jsonify(result), status
 
 
 @admin_bp.route("/imports/history", methods=["GET"])
@@ -193,48 +212,22 @@ def rollback_import_batch(batch_id):
     if not batch:
         return jsonify({"msg": "导入记录不存在"}), 404
 
-    if not batch.can_rollback:
-        return jsonify({"msg": "该批次已回退，不能重复回退"}), 400
-
-    newer_batch = (
-        ImportBatch.query.filter(
-            ImportBatch.import_type == batch.import_type,
-            ImportBatch.id > batch.id,
-            ImportBatch.can_rollback.is_(True),
-        )
-        .order_by(ImportBatch.id.asc())
-        .first()
-    )
-    if newer_batch:
-        return (
-            jsonify({"msg": f"请先回退更新的同类批次（ID: {newer_batch.id}），再回退当前记录。"}),
-            400,
+    blocked = rollback_service.check_batch_rollback(batch)
+    if blocked:
+        msg, status = blocked
+        return jsonify({"msg": msg}), status
+
+    if batch.import_type == "score":
+        # 成绩批次可能有数万行，放到后台任务执行，前端轮询 /jobs/<id> 获取进度与结果
+        job = job_service.submit_job(
+            "score_rollback",
+            rollback_service.rollback_import_batch,
+            source_filename=batch.source_filename,
+            created_by=g.current_user.id,
+            batch_id=batch.id,
         )
+        return jsonify({"msg": "回退任务已提交，正在后台处理", "job_id": job.id}), 202
 
-    snapshot = _json_loads(batch.snapshot_json, {})
-    scope = _json_loads(batch.scope_json, {})
-
-    try:
-        if batch.import_type == "student":
-            rollback_service.rollback_students(snapshot)
-        elif batch.import_type == "teacher":
-            rollback_service.rollback_teacher(snapshot, scope)
-        elif batch.import_type == "course_assign":
-            rollback_service.rollback_course_assign(snapshot, scope)
-        elif batch.import_type == "score":
-            rollback_service.rollback_score(snapshot)
-        else:
-            return jsonify({"msg": "不支持的导入类型，无法回退"}), 400
-
-        batch.can_rollback = False
-        batch.rolled_back_at = datetime.now()
-        batch.rollback_note = "手动回退完成"
-        db.session.commit()
-        return jsonify({"msg": f"回退成功：{IMPORT_TYPE_LABELS.get(batch.import_type, batch.import_type)}"})
-    except ValueError as e:
-        db.session.rollback()
-        return jsonify({"msg": str(e)}), 400
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": f"回退失败: {str(e)}"}), 500
+    result, status = rollback_service.rollback_import_batch(batch.id)
+    return jsonify(result), status
 
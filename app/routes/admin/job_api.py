@@ -0,0 +1,20 @@
+from flask import jsonify
+
+from app.models import BackgroundJob, db
+from app.services.job_service import serialize_job
+
+from . import admin_bp
+
+
+@admin_bp.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    查询后台任务状态与结果。
+    运行中的 processed_rows/total_rows 取自本进程内存（见 JobRunner），不落库：
+    仅适用于单进程部署（waitress 多线程）；服务重启后进度丢失，
+    未结束的任务由 fail_interrupted_jobs 标记为失败，需重新提交。
+    """
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        return jsonify({"msg": "任务不存在"}), 404
+    return jsonify(serialize_job(job))
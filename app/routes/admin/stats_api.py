@@ -3,11 +3,14 @@ from urllib.parse import quote
 from flask import jsonify, request, send_file
 
 from app.services import excel_service, stats_service
+from app.utils.cache import get_stats_result_cache
+from app.utils.read_replica import use_read_replica
 
 from . import admin_bp
 
 
 @admin_bp.route("/stats/class_report", methods=["GET"])
+@use_read_replica
 def get_class_report():
     class_id = request.args.get("class_id")
     term = request.args.get("term")
@@ -15,12 +18,30 @@ def get_class_report():
 
 
 @admin_bp.route("/stats/exam_names", methods=["GET"])
+@use_read_replica
 def get_grade_exam_names():
     entry_year = request.args.get("entry_year", type=int)
     return jsonify(stats_service.get_exam_names_by_entry_year(entry_year))
 
 
+@admin_bp.route("/stats/cache_stats", methods=["GET"])
+def get_stats_cache_stats():
+    cache = get_stats_result_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(), enabled=cache.ttl > 0))
+
+
+@admin_bp.route("/stats/cache_stats", methods=["DELETE"])
+def clear_stats_cache():
+    cache = get_stats_result_cache()
+    if cache is not None:
+        cache.clear()
+    return jsonify({"msg": "统计缓存已清空"})
+
+
 @admin_bp.route("/stats/comprehensive_report", methods=["POST"])
+@use_read_replica
 def get_comprehensive_report():
     payload, err = stats_service.build_comprehensive_report(request.get_json() or {})
     if err:
@@ -30,6 +51,7 @@ def get_comprehensive_report():
 
 
 @admin_bp.route("/stats/comprehensive_report_export", methods=["POST"])
+@use_read_replica
 def export_comprehensive_report_excel():
     data = request.get_json() or {}
     export_query = dict(data)
@@ -60,6 +82,7 @@ def export_comprehensive_report_excel():
 
 
 @admin_bp.route("/stats/score_rank_trend", methods=["POST"])
+@use_read_replica
 def get_score_rank_trend():
     payload, err = stats_service.build_score_rank_trend_payload(request.get_json() or {})
     if err:
@@ -69,6 +92,7 @@ def get_score_rank_trend():
 
 
 @admin_bp.route("/stats/score_rank_trend_export", methods=["POST"])
+@use_read_replica
 def export_score_rank_trend_excel():
     data = request.get_json() or {}
     only_changed = bool(data.get("only_changed", False))
@@ -96,6 +120,7 @@ def export_score_rank_trend_excel():
 
 
 @admin_bp.route("/stats/class_score_stats", methods=["POST"])
+@use_read_replica
 def get_class_score_stats():
     payload, err = stats_service.build_class_score_stats(request.get_json() or {})
     if err:
@@ -105,6 +130,7 @@ def get_class_score_stats():
 
 
 @admin_bp.route("/stats/teacher_score_stats", methods=["POST"])
+@use_read_replica
 def get_teacher_score_stats():
     payload, err = stats_service.build_teacher_score_stats(request.get_json() or {})
     if err:
@@ -114,6 +140,7 @@ def get_teacher_score_stats():
 
 
 @admin_bp.route("/stats/teacher_score_stats_export", methods=["POST"])
+@use_read_replica
 def export_teacher_score_stats_excel():
     data = request.get_json() or {}
     payload, err = stats_service.build_teacher_score_stats(data)
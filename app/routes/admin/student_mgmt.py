@@ -12,6 +12,10 @@ from app.models import (
     db,
 )
 from app.services.document_service import render_student_certificate
+from app.services.invalidation_service import (
+    invalidate_class_results,
+    invalidate_grade_results,
+)
 
 from . import admin_bp
 
@@ -77,6 +81,7 @@ def add_class():
     data = request.get_json()
     new_class = ClassInfo(entry_year=data["entry_year"], class_num=data["class_num"])
     db.session.add(new_class)
+    invalidate_grade_results([new_class.entry_year])
     db.session.commit()
     return jsonify({"msg": "班级创建成功"})
 
@@ -98,6 +103,7 @@ def delete_class(class_id):
         CourseAssignment.query.filter_by(class_id=class_id).delete()
         HeadTeacherAssignment.query.filter_by(class_id=class_id).delete()
 
+        invalidate_grade_results([cls.entry_year])
         db.session.delete(cls)
         db.session.commit()
         return jsonify({"msg": "班级删除成功"})
@@ -195,6 +201,7 @@ def add_student():
         remarks=data.get("remarks"),
     )
     db.session.add(student)
+    invalidate_class_results([student.class_id])
     db.session.commit()
     return jsonify({"msg": "学生添加成功"})
 
@@ -215,6 +222,7 @@ def update_student(s_id):
         if Student.query.filter_by(id_card_number=new_id_card).first():
             return jsonify({"msg": "该身份证号已被其他学生占用"}), 400
 
+    old_class_id = student.class_id
     student.name = data.get("name", student.name)
     student.gender = data.get("gender", student.gender)
     student.class_id = data.get("class_id", student.class_id)
@@ -227,6 +235,7 @@ def update_student(s_id):
     student.id_card_number = new_id_card
     student.remarks = data.get("remarks", student.remarks)
 
+    invalidate_class_results([old_class_id, student.class_id])
     db.session.commit()
     return jsonify({"msg": "学生信息更新成功"})
 
@@ -238,6 +247,7 @@ def delete_student(s_id):
         return jsonify({"msg": "学生不存在"}), 404
 
     try:
+        invalidate_class_results([student.class_id])
         Score.query.filter_by(student_id=s_id).delete()
         db.session.delete(student)
         db.session.commit()
@@ -14,6 +14,7 @@ from app.models import (
     User,
     db,
 )
+from app.services.invalidation_service import invalidate_user_identity
 from app.utils.helpers import _apply_teacher_status_to_account
 
 from . import admin_bp
@@ -190,6 +191,7 @@ def update_teacher(t_id):
         if new_status:
             teacher.status = new_status
             _apply_teacher_status_to_account(teacher.user, new_status)
+            invalidate_user_identity([teacher.user_id])
 
     HeadTeacherAssignment.query.filter_by(
         teacher_id=teacher.id, academic_year=target_year
@@ -252,6 +254,7 @@ def reset_teacher_password(t_id):
     user = teacher.user
     user.set_password("123456")
     user.must_change_password = True
+    invalidate_user_identity([user.id])
     db.session.commit()
 
     return jsonify({"msg": f"教师 {teacher.name} 的密码已重置为 123456"})
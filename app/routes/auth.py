@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, g
 from app.models import db, User, SystemSetting
 from app.auth_utils import issue_access_token, auth_required
+from app.services.invalidation_service import invalidate_user_identity
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -92,7 +93,11 @@ def change_password():
     if not old_password or not new_password:
         return jsonify({"msg": "旧密码和新密码不能为空"}), 400
 
-    user = g.current_user
+    # g.current_user 是缓存的身份信息，改密需要加载账号实体
+    user = User.query.get(g.current_user.id)
+    if not user:
+        return jsonify({"msg": "账号不存在，请重新登录"}), 401
+
     user_id = data.get("user_id")
     if user_id is not None:
         try:
@@ -109,6 +114,7 @@ def change_password():
 
     user.set_password(new_password)
     user.must_change_password = False
+    invalidate_user_identity([user.id])
     db.session.commit()
 
     return jsonify({"msg": "密码修改成功，请重新登录"}), 200
@@ -1,14 +1,14 @@
-from flask import Blueprint, request, jsonify, send_file, g
+from flask import Blueprint, current_app, request, jsonify, send_file, g
 import pandas as pd
-import io
+import numpy as np
 from urllib.parse import quote
-from sqlalchemy import distinct, func, or_, tuple_
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import joinedload
 from collections import defaultdict
 
 from app.auth_utils import require_auth
 from app.models import (
     db,
-    Teacher,
     CourseAssignment,
     ClassInfo,
     Subject,
@@ -16,8 +16,20 @@ from app.models import (
     Score,
     ExamTask,
 )
-from app.services.audit_service import append_score_update_audit_log
-from app.services.progress_service import build_class_name, calc_class_record_progress
+from app.services.audit_service import (
+    build_score_update_audit_row,
+    bulk_insert_audit_rows,
+)
+from app.services.invalidation_service import invalidate_exam_results
+from app.services.score_service import SCORE_FIELDS, prefetch_scores, upsert_scores
+from app.services.progress_service import (
+    build_class_name,
+    calc_task_class_score_counts,
+    count_active_students_by_class,
+)
+from app.services.version_service import get_data_versions
+from app.utils.helpers import _PhaseTimer, _make_etag, _not_modified, _with_etag
+from app.utils.xlsx_writer import write_xlsx_stream
 
 teacher_bp = Blueprint("teacher", __name__)
 
@@ -32,7 +44,8 @@ def _get_current_teacher():
     if not user:
         return None, (jsonify({"msg": "未登录或登录已过期，请重新登录"}), 401)
 
-    teacher = Teacher.query.filter_by(user_id=user.id).first()
+    # 教师档案随登录身份一起缓存，这里只取 id/name，不再查库
+    teacher = user.teacher
     if not teacher:
         return None, (jsonify({"msg": "教师档案不存在，请联系管理员"}), 403)
 
@@ -74,25 +87,6 @@ def _teacher_can_operate_task_class(teacher_id, class_id, task):
     return bool(assignment)
 
 
-def _count_abnormal_scores(exam_task_id, student_ids, pass_line):
-    if not student_ids:
-        return 0
-
-    abnormal_count = (
-        db.session.query(func.count(distinct(Score.student_id)))
-        .filter(Score.exam_task_id == exam_task_id, Score.student_id.in_(student_ids))
-        .filter(
-            or_(
-                Score.remark == "缺考",
-                Score.score < pass_line,
-            )
-        )
-        .scalar()
-        or 0
-    )
-    return abnormal_count
-
-
 # --- 1. 获取当前老师的任教课程 ---
 @teacher_bp.route("/my_courses", methods=["GET"])
 @teacher_bp.route("/my_courses/<int:user_id>", methods=["GET"])
@@ -105,6 +99,15 @@ def get_my_courses(user_id=None):
     if err:
         return err
 
+    etag = _make_etag(
+        "my_courses",
+        teacher.id,
+        get_data_versions(["course_assignments", "classes", "subjects", "exam_tasks"]),
+    )
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
     assignments = (
         db.session.query(
             CourseAssignment.id,
@@ -159,7 +162,7 @@ def get_my_courses(user_id=None):
                 }
             )
 
-    return jsonify(valid_courses)
+    return _with_etag(jsonify(valid_courses), etag)
 
 
 # --- 1.1 教师首页待办提醒 ---
@@ -184,9 +187,6 @@ def get_dashboard_todos():
         .all()
     )
 
-    pending_items = []
-    abnormal_items = []
-
     assignment_keys = {
         (a.entry_year, a.subject_id, a.academic_year)
         for a in assignments
@@ -209,6 +209,36 @@ def get_dashboard_todos():
             key = (task.entry_year, task.subject_id, task.academic_year)
             task_map[key].append(task)
 
+    # 录入进度取决于本人任务的成绩版本号；exam_tasks 的表版本号不随成绩保存变化，
+    # 其他教师保存成绩不会使本接口的 ETag 失效
+    etag = _make_etag(
+        "dashboard_todos",
+        teacher.id,
+        get_data_versions(
+            ["course_assignments", "classes", "subjects", "students", "exam_tasks"]
+        ),
+        sorted(
+            (task.id, task.score_version)
+            for tasks in task_map.values()
+            for task in tasks
+        ),
+    )
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    pending_items = []
+    abnormal_items = []
+
+    # 全部 (任务, 班级) 的人数统计一次聚合完成
+    student_count_map = count_active_students_by_class(
+        [a.class_id for a in assignments]
+    )
+    score_count_map = calc_task_class_score_counts(
+        [task.id for tasks in task_map.values() for task in tasks],
+        [a.class_id for a in assignments],
+    )
+
     for assignment in assignments:
         tasks = task_map.get(
             (assignment.entry_year, assignment.subject_id, assignment.academic_year), []
@@ -218,11 +248,15 @@ def get_dashboard_todos():
             continue
 
         class_name = build_class_name(assignment.entry_year, assignment.class_num)
+        total_students = student_count_map.get(assignment.class_id, 0)
 
         for task in tasks:
-            class_progress = calc_class_record_progress(task.id, assignment.class_id)
+            recorded_count, abnormal_count = score_count_map.get(
+                (task.id, assignment.class_id), (0, 0)
+            )
+            recorded_count = min(recorded_count, total_students)
 
-            if class_progress["recorded_count"] < class_progress["total_students"]:
+            if recorded_count < total_students:
                 pending_items.append(
                     {
                         "task_id": task.id,
@@ -230,21 +264,16 @@ def get_dashboard_todos():
                         "subject_name": assignment.subject_name,
                         "class_id": assignment.class_id,
                         "class_name": class_name,
-                        "recorded_count": class_progress["recorded_count"],
-                        "total_students": class_progress["total_students"],
+                        "recorded_count": recorded_count,
+                        "total_students": total_students,
                         "msg": (
                             f"您有 [{task.name} - {assignment.subject_name}] 的成绩尚未录入，"
-                            f"当前进度 {class_progress['recorded_count']}/{class_progress['total_students']}。"
+                            f"当前进度 {recorded_count}/{total_students}。"
                         ),
                     }
                 )
 
             pass_line = task.full_score * 0.6
-            abnormal_count = _count_abnormal_scores(
-                task.id,
-                class_progress["student_ids"],
-                pass_line,
-            )
 
             if abnormal_count > 0:
                 abnormal_items.append(
@@ -263,12 +292,15 @@ def get_dashboard_todos():
                     }
                 )
 
-    return jsonify(
-        {
-            "pending_items": pending_items,
-            "abnormal_items": abnormal_items,
-            "total_todos": len(pending_items) + len(abnormal_items),
-        }
+    return _with_etag(
+        jsonify(
+            {
+                "pending_items": pending_items,
+                "abnormal_items": abnormal_items,
+                "total_todos": len(pending_items) + len(abnormal_items),
+            }
+        ),
+        etag,
     )
 
 
@@ -293,6 +325,18 @@ def get_score_list():
     if not _teacher_can_operate_task_class(teacher.id, class_id, task):
         return jsonify({"msg": "无权访问该班级的考试成绩"}), 403
 
+    etag = _make_etag(
+        "score_list",
+        class_id,
+        exam_task_id,
+        keyword,
+        task.score_version,
+        get_data_versions(["students"]),
+    )
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
     student_query = Student.query.filter_by(class_id=class_id, status="在读")
     if keyword:
         like_pattern = f"%{keyword}%"
@@ -331,12 +375,13 @@ def get_score_list():
             }
         )
 
-    return jsonify(result)
+    return _with_etag(jsonify(result), etag)
 
 
 # --- 3. 保存成绩 ---
 @teacher_bp.route("/save_scores", methods=["POST"])
 def save_scores():
+    timer = _PhaseTimer()
     data = request.get_json(silent=True) or {}
     exam_task_id = data.get("exam_task_id")
     scores_data = data.get("scores")
@@ -386,6 +431,22 @@ def save_scores():
         if s.class_id not in allowed_class_ids:
             return jsonify({"msg": "包含无权操作的学生成绩"}), 403
 
+    timer.mark("validate")
+
+    # 一次性预取本次提交涉及的已有成绩与班级，避免逐行查询
+    current_state = {
+        sid: state
+        for (sid, _), state in prefetch_scores([task.id], unique_student_ids).items()
+    }
+
+    class_name_map = {
+        c.id: c.full_name
+        for c in ClassInfo.query.filter(
+            ClassInfo.id.in_({s.class_id for s in students})
+        ).all()
+    }
+    timer.mark("prefetch")
+
     missing_count = 0
     invalid_count = 0
     updated_count = 0
@@ -395,6 +456,9 @@ def save_scores():
     if "," in client_ip:
         client_ip = client_ip.split(",")[0].strip()
 
+    changed_ids = set()
+    audit_rows = []
+
     for item in scores_data:
         student_obj = student_map[item["student_id"]]
         raw_val = item.get("score")
@@ -426,57 +490,81 @@ def save_scores():
                 invalid_count += 1
                 continue
 
-        existing_score = Score.query.filter_by(
-            student_id=student_obj.id,
-            exam_task_id=exam_task_id,
-        ).first()
+        existing_score = current_state.get(student_obj.id)
 
         if existing_score:
-            old_score = existing_score.score
-            old_remark = existing_score.remark
-
-            existing_score.score = final_score
-            existing_score.remark = final_remark
-            existing_score.class_id_snapshot = student_obj.class_id
+            old_score = existing_score["score"]
+            old_remark = existing_score["remark"]
+
+            if (
+                old_score != final_score
+                or old_remark != final_remark
+                or existing_score["class_id_snapshot"] != student_obj.class_id
+            ):
+                existing_score["score"] = final_score
+                existing_score["remark"] = final_remark
+                existing_score["class_id_snapshot"] = student_obj.class_id
+                if existing_score["id"] is not None:
+                    changed_ids.add(existing_score["id"])
 
             if old_score != final_score or old_remark != final_remark:
-                append_score_update_audit_log(
-                    actor_user=actor_user,
-                    student_obj=student_obj,
-                    task_obj=task,
-                    old_score=old_score,
-                    old_remark=old_remark,
-                    new_score=final_score,
-                    new_remark=final_remark,
-                    source="teacher_save_scores",
-                    class_id=student_obj.class_id,
-                    class_name=(
-                        student_obj.current_class_rel.full_name
-                        if student_obj.current_class_rel
-                        else ""
-                    ),
-                    client_ip=client_ip,
+                audit_rows.append(
+                    build_score_update_audit_row(
+                        actor_user=actor_user,
+                        student_obj=student_obj,
+                        task_obj=task,
+                        old_score=old_score,
+                        old_remark=old_remark,
+                        new_score=final_score,
+                        new_remark=final_remark,
+                        source="teacher_save_scores",
+                        class_id=student_obj.class_id,
+                        class_name=class_name_map.get(student_obj.class_id, ""),
+                        client_ip=client_ip,
+                    )
                 )
                 updated_count += 1
         else:
-            new_score = Score(
-                student_id=student_obj.id,
-                subject_id=task.subject_id,
-                exam_task_id=exam_task_id,
-                score=final_score,
-                term=task.name,
-                remark=final_remark,
-                class_id_snapshot=student_obj.class_id,
-            )
-            db.session.add(new_score)
+            new_row = {
+                "id": None,
+                "student_id": student_obj.id,
+                "subject_id": task.subject_id,
+                "exam_task_id": task.id,
+                "score": final_score,
+                "term": task.name,
+                "remark": final_remark,
+                "class_id_snapshot": student_obj.class_id,
+            }
+            # 同一学生在本次提交中重复出现时，后续条目按“更新”处理
+            current_state[student_obj.id] = new_row
             added_count += 1
 
+    timer.mark("diff")
+
+    upsert_rows = [
+        {field: state[field] for field in SCORE_FIELDS}
+        for state in current_state.values()
+        if state["id"] is None or state["id"] in changed_ids
+    ]
+
     try:
+        upsert_scores(upsert_rows)
+        bulk_insert_audit_rows(audit_rows)
+        invalidate_exam_results([task.id])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": f"数据库写入失败: {str(e)}"}), 500
 
+    timer.mark("write")
+    # 各阶段耗时已通过 Server-Timing 响应头返回，控制台只记录慢请求
+    slow_ms = current_app.config.get("SCORE_SAVE_SLOW_LOG_MS", 0)
+    if slow_ms and timer.total() >= slow_ms:
+        print(
+            f">> [save_scores] 慢请求：任务 {task.id} 提交 {len(scores_data)} 条"
+            f"（新增 {added_count}，更新 {updated_count}）: {timer.summary()}"
+        )
+
     if missing_count > 0 or invalid_count > 0:
         msg = (
             f"已保存（新增 {added_count}，更新 {updated_count}）。"
@@ -485,7 +573,7 @@ def save_scores():
         if invalid_count > 0:
             msg += f"，{invalid_count} 项格式不合法已跳过"
         msg += "。"
-        return jsonify(
+        resp = jsonify(
             {
                 "msg": msg,
                 "missing_count": missing_count,
@@ -494,16 +582,18 @@ def save_scores():
                 "updated_count": updated_count,
             }
         )
-
-    return jsonify(
-        {
-            "msg": f"成绩保存成功（新增 {added_count}，更新 {updated_count}）",
-            "missing_count": 0,
-            "invalid_count": 0,
-            "added_count": added_count,
-            "updated_count": updated_count,
-        }
-    )
+    else:
+        resp = jsonify(
+            {
+                "msg": f"成绩保存成功（新增 {added_count}，更新 {updated_count}）",
+                "missing_count": 0,
+                "invalid_count": 0,
+                "added_count": added_count,
+                "updated_count": updated_count,
+            }
+        )
+    resp.headers["Server-Timing"] = timer.header()
+    return resp
 
 
 # --- 获取某班级某科目可用的考试任务 ---
@@ -536,6 +626,19 @@ def get_available_exams():
     if not academic_years:
         return jsonify([])
 
+    etag = _make_etag(
+        "available_exams",
+        teacher.id,
+        class_id,
+        subject_id,
+        cls.entry_year,
+        sorted(academic_years),
+        get_data_versions(["exam_tasks"]),
+    )
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
     tasks = (
         ExamTask.query.filter(
             ExamTask.entry_year == cls.entry_year,
@@ -547,17 +650,19 @@ def get_available_exams():
         .all()
     )
 
-    return jsonify(
+    resp = jsonify(
         [
             {
                 "id": t.id,
                 "name": t.name,
                 "full_score": t.full_score,
                 "is_active": t.is_active,
+                "score_version": t.score_version,
             }
             for t in tasks
         ]
     )
+    return _with_etag(resp, etag)
 
 
 # --- 5. 导出成绩单/录入模板 (XLSX格式) ---
@@ -599,24 +704,12 @@ def export_scores():
         else:
             score_map[s.student_id] = s.score
 
-    data_list = []
-    for s in students:
-        row = {
-            "学号": s.student_id,
-            "姓名": s.name,
-            "班级名称": formatted_class_name,
-            "状态": s.status,
-            subject_name: score_map.get(s.id, ""),
-        }
-        data_list.append(row)
-
-    df = pd.DataFrame(data_list)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="成绩录入")
-
-    output.seek(0)
+    columns = ["学号", "姓名", "班级名称", "状态", subject_name]
+    rows = (
+        (s.student_id, s.name, formatted_class_name, s.status, score_map.get(s.id, ""))
+        for s in students
+    )
+    output = write_xlsx_stream([("成绩录入", columns, rows)])
 
     filename = f"{formatted_class_name}-{subject_name}-{task.name}.xlsx"
     filename = quote(filename)
@@ -630,6 +723,70 @@ def export_scores():
     )
 
 
+def _parse_import_score(raw_score):
+    """返回 (分数, 备注, 状态)，状态为 ok / blank / bad_format。"""
+    if isinstance(raw_score, str) and raw_score == "":
+        return 0.0, "", "blank"
+    if str(raw_score).strip() == "缺考":
+        return 0.0, "缺考", "ok"
+    try:
+        return float(raw_score), "", "ok"
+    except (ValueError, TypeError):
+        return 0.0, "", "bad_format"
+
+
+def _classify_score_import_rows(
+    df, subject_name, expected_class_name, db_student_map, full_score
+):
+    """
+    按列对导入表格整体校验，返回每行的解析结果与状态：
+    skip / class_mismatch / not_in_class / name_mismatch / bad_format / out_of_range / ok。
+    判定优先级与原逐行校验一致，每行只报告第一个问题。
+    """
+    checked = pd.DataFrame(
+        {
+            "excel_row": [int(i) + 2 for i in df.index],
+            "s_id": df["学号"].map(str).str.strip(),
+            "s_name": df["姓名"].map(str).str.strip(),
+            "class_name": df["班级名称"].map(str).str.strip(),
+            "raw_score": df[subject_name],
+        },
+        index=df.index,
+    )
+
+    parsed = [_parse_import_score(v) for v in checked["raw_score"].tolist()]
+    checked["score"] = [p[0] for p in parsed]
+    checked["remark"] = [p[1] for p in parsed]
+    score_state = np.array([p[2] for p in parsed], dtype=object)
+
+    in_class = checked["s_id"].isin(db_student_map.keys())
+    db_names = checked["s_id"].map(
+        {sid: stu.name for sid, stu in db_student_map.items()}
+    )
+    scores = checked["score"].to_numpy(dtype=float)
+
+    conditions = [
+        (checked["s_id"] == "").to_numpy(),
+        (checked["class_name"] != expected_class_name).to_numpy(),
+        (~in_class).to_numpy(),
+        (db_names != checked["s_name"]).to_numpy(),
+        score_state == "blank",
+        score_state == "bad_format",
+        (scores < 0) | (scores > full_score),
+    ]
+    choices = [
+        "skip",
+        "class_mismatch",
+        "not_in_class",
+        "name_mismatch",
+        "skip",
+        "bad_format",
+        "out_of_range",
+    ]
+    checked["status"] = np.select(conditions, choices, default="ok")
+    return checked
+
+
 # --- 6. Excel 批量导入成绩 (含详细错误处理与严格校验) ---
 @teacher_bp.route("/import_scores", methods=["POST"])
 def import_scores():
@@ -702,134 +859,100 @@ def import_scores():
     db_students = Student.query.filter_by(class_id=class_id, status="在读").all()
     db_student_map = {s.student_id: s for s in db_students}
 
-    processed_student_ids = set()
-
-    for index, row in df.iterrows():
-        excel_row_num = index + 2
-
-        s_id = str(row["学号"]).strip()
-        s_name = str(row["姓名"]).strip()
-        row_class_name = str(row["班级名称"]).strip()
-        raw_score = row[subject_name]
+    checked = _classify_score_import_rows(
+        df, subject_name, expected_class_name, db_student_map, task.full_score
+    )
 
-        if not s_id:
+    # 非本班学号一次性预取，用于提示其所在班级
+    foreign_ids = checked.loc[checked["status"] == "not_in_class", "s_id"].unique()
+    foreign_class_map = {}
+    if len(foreign_ids):
+        for stu in (
+            Student.query.options(joinedload(Student.current_class_rel))
+            .filter(Student.student_id.in_(foreign_ids.tolist()))
+            .all()
+        ):
+            cls_rel = stu.current_class_rel
+            foreign_class_map[stu.student_id] = cls_rel.full_name if cls_rel else "未知"
+
+    ok_rows = []
+    for row in checked.itertuples(index=False):
+        if row.status == "ok":
+            ok_rows.append(row)
             continue
-
-        if row_class_name != expected_class_name:
-            logs["errors"].append(
-                {
-                    "row": excel_row_num,
-                    "name": s_name,
-                    "msg": f"班级不匹配: Excel中为 [{row_class_name}]，应为 [{expected_class_name}]",
-                }
-            )
+        if row.status == "skip":
             continue
 
-        if s_id not in db_student_map:
-            other_student = Student.query.filter_by(student_id=s_id).first()
-            if other_student:
-                current_cls = other_student.current_class_rel
-                c_name = current_cls.full_name if current_cls else "未知"
-                logs["errors"].append(
-                    {
-                        "row": excel_row_num,
-                        "name": s_name,
-                        "msg": f"非本班学生 (该生属于 {c_name})，已忽略",
-                    }
-                )
+        if row.status == "class_mismatch":
+            msg = f"班级不匹配: Excel中为 [{row.class_name}]，应为 [{expected_class_name}]"
+        elif row.status == "not_in_class":
+            if row.s_id in foreign_class_map:
+                msg = f"非本班学生 (该生属于 {foreign_class_map[row.s_id]})，已忽略"
             else:
-                logs["errors"].append(
-                    {
-                        "row": excel_row_num,
-                        "name": s_name,
-                        "msg": "系统中不存在该学号，已忽略",
-                    }
-                )
-            continue
-
-        student_obj = db_student_map[s_id]
-
-        if student_obj.name != s_name:
-            logs["errors"].append(
-                {
-                    "row": excel_row_num,
-                    "name": s_name,
-                    "msg": f"姓名与学号不匹配，系统记录为: {student_obj.name}",
-                }
-            )
-            continue
+                msg = "系统中不存在该学号，已忽略"
+        elif row.status == "name_mismatch":
+            msg = f"姓名与学号不匹配，系统记录为: {db_student_map[row.s_id].name}"
+        elif row.status == "out_of_range":
+            msg = f"分数 {row.score} 超出范围 (0-{task.full_score})"
+        else:
+            msg = f"分数格式错误: {row.raw_score}"
 
-        score_val = 0.0
-        remark_val = ""
-        if raw_score == "" or pd.isna(raw_score):
-            continue
+        logs["errors"].append({"row": int(row.excel_row), "name": row.s_name, "msg": msg})
 
-        str_val = str(raw_score).strip()
+    processed_student_ids = {row.s_id for row in ok_rows}
 
-        if str_val == "缺考":
-            score_val = 0.0
-            remark_val = "缺考"
-        else:
-            try:
-                score_val = float(raw_score)
-                if score_val < 0 or score_val > task.full_score:
-                    logs["errors"].append(
-                        {
-                            "row": excel_row_num,
-                            "name": s_name,
-                            "msg": f"分数 {score_val} 超出范围 (0-{task.full_score})",
-                        }
-                    )
-                    continue
-            except (ValueError, TypeError):
-                logs["errors"].append(
-                    {
-                        "row": excel_row_num,
-                        "name": s_name,
-                        "msg": f"分数格式错误: {raw_score}",
-                    }
-                )
-                continue
-
-        processed_student_ids.add(s_id)
+    # 一次性预取本班已有成绩，内存比对后批量写入
+    current_state = {
+        sid: state
+        for (sid, _), state in prefetch_scores(
+            [task.id], [db_student_map[r.s_id].id for r in ok_rows]
+        ).items()
+    }
 
-        existing_score = Score.query.filter_by(
-            student_id=student_obj.id,
-            exam_task_id=exam_task_id,
-        ).first()
+    pending_rows = {}
+    audit_rows = []
+    for row in ok_rows:
+        student_obj = db_student_map[row.s_id]
+        score_val = row.score
+        remark_val = row.remark
 
+        existing_score = current_state.get(student_obj.id)
         if existing_score:
-            if existing_score.score != score_val or existing_score.remark != remark_val:
-                old_score = existing_score.score
-                old_remark = existing_score.remark
-                existing_score.score = score_val
-                existing_score.remark = remark_val
-                existing_score.class_id_snapshot = student_obj.class_id
-                append_score_update_audit_log(
-                    actor_user=actor_user,
-                    student_obj=student_obj,
-                    task_obj=task,
-                    old_score=old_score,
-                    old_remark=old_remark,
-                    new_score=score_val,
-                    new_remark=remark_val,
-                    source="teacher_import_scores",
-                    class_id=student_obj.class_id,
-                    class_name=expected_class_name,
-                    client_ip=client_ip,
+            if existing_score["score"] != score_val or existing_score["remark"] != remark_val:
+                audit_rows.append(
+                    build_score_update_audit_row(
+                        actor_user=actor_user,
+                        student_obj=student_obj,
+                        task_obj=task,
+                        old_score=existing_score["score"],
+                        old_remark=existing_score["remark"],
+                        new_score=score_val,
+                        new_remark=remark_val,
+                        source="teacher_import_scores",
+                        class_id=student_obj.class_id,
+                        class_name=expected_class_name,
+                        client_ip=client_ip,
+                    )
                 )
+                existing_score["score"] = score_val
+                existing_score["remark"] = remark_val
+                existing_score["class_id_snapshot"] = student_obj.class_id
+                pending_rows[student_obj.id] = existing_score
                 logs["updated"] += 1
         else:
-            new_score = Score(
-                student_id=student_obj.id,
-                subject_id=task.subject_id,
-                exam_task_id=task.id,
-                score=score_val,
-                term=task.name,
-                remark=remark_val,
-                class_id_snapshot=student_obj.class_id,
-            )
-            db.session.add(new_score)
+            new_row = {
+                "id": None,
+                "student_id": student_obj.id,
+                "subject_id": task.subject_id,
+                "exam_task_id": task.id,
+                "score": score_val,
+                "term": task.name,
+                "remark": remark_val,
+                "class_id_snapshot": student_obj.class_id,
+            }
+            # Excel 中同一学生重复出现时，后续行按“更新”处理
+            current_state[student_obj.id] = new_row
+            pending_rows[student_obj.id] = new_row
             logs["success"] += 1
 
     all_db_ids = set(db_student_map.keys())
@@ -850,6 +973,14 @@ def import_scores():
         )
 
     try:
+        upsert_scores(
+            [
+                {field: state[field] for field in SCORE_FIELDS}
+                for state in pending_rows.values()
+            ]
+        )
+        bulk_insert_audit_rows(audit_rows)
+        invalidate_exam_results([task.id])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
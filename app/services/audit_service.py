@@ -23,7 +23,7 @@ def format_score_value(score, remark):
         return str(score)
 
 
-def append_score_update_audit_log(
+def build_score_update_audit_row(
     *,
     actor_user,
     student_obj,
@@ -37,6 +37,7 @@ def append_score_update_audit_log(
     class_name="",
     client_ip="",
 ):
+    """生成成绩修改审计记录的字段字典；新旧值显示一致时返回 None。"""
     old_value = format_score_value(old_score, old_remark)
     new_value = format_score_value(new_score, new_remark)
 
@@ -62,25 +63,41 @@ def append_score_update_audit_log(
         f"从 [{old_value}] 改为 [{new_value}]。"
     )
 
-    log = AuditLog(
-        action_type="score_update",
-        source=source,
-        actor_user_id=actor_user.id,
-        actor_username=actor_user.username or "",
-        actor_real_name=actor_name,
-        actor_role=actor_user.role or "",
-        target_student_id=student_obj.id,
-        target_student_no=student_obj.student_id or "",
-        target_student_name=student_obj.name or "",
-        exam_task_id=task_obj.id,
-        exam_task_name=task_obj.name or "",
-        subject_name=subject_name,
-        class_id_snapshot=resolved_class_id,
-        class_name_snapshot=resolved_class_name or "",
-        old_value=old_value,
-        new_value=new_value,
-        detail_text=detail_text,
-        client_ip=client_ip or "",
-    )
+    return {
+        "action_type": "score_update",
+        "source": source,
+        "actor_user_id": actor_user.id,
+        "actor_username": actor_user.username or "",
+        "actor_real_name": actor_name,
+        "actor_role": actor_user.role or "",
+        "target_student_id": student_obj.id,
+        "target_student_no": student_obj.student_id or "",
+        "target_student_name": student_obj.name or "",
+        "exam_task_id": task_obj.id,
+        "exam_task_name": task_obj.name or "",
+        "subject_name": subject_name,
+        "class_id_snapshot": resolved_class_id,
+        "class_name_snapshot": resolved_class_name or "",
+        "old_value": old_value,
+        "new_value": new_value,
+        "detail_text": detail_text,
+        "client_ip": client_ip or "",
+    }
+
+
+def append_score_update_audit_log(**kwargs):
+    row = build_score_update_audit_row(**kwargs)
+    if row is None:
+        return None
+
+    log = AuditLog(**row)
     db.session.add(log)
     return log
+
+
+def bulk_insert_audit_rows(rows):
+    """批量写入 build_score_update_audit_row 生成的审计记录。"""
+    rows = [row for row in rows if row]
+    if rows:
+        db.session.bulk_insert_mappings(AuditLog, rows)
+    return len(rows)
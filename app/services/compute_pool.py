@@ -0,0 +1,53 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(size):
+    """按需创建进程池并复用；使用 spawn，与 Windows / 打包 exe 的行为一致。"""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != size:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=size, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_size = size
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def run_compute_jobs(func, jobs, total_rows):
+    """
+    批量执行 func(*job)，返回与 jobs 对齐的结果。func 须为模块级函数，
+    job 只含紧凑数组（成绩行的下标、分数、标记等），子进程内完成矩阵构建与排名。
+    开启进程池且成绩行数 total_rows 达到阈值时在子进程中计算，避免长时间占用
+    GIL 阻塞其他请求；数据量小或进程池不可用时在当前线程执行。
+    """
+    jobs = list(jobs)
+    size = int(current_app.config.get("STATS_PROCESS_POOL_SIZE", 1) or 0)
+    min_rows = int(current_app.config.get("STATS_PROCESS_POOL_MIN_ROWS", 5000) or 0)
+
+    if size > 0 and jobs and total_rows >= min_rows:
+        try:
+            pool = _get_pool(size)
+            return list(pool.map(func, *zip(*jobs)))
+        except Exception as e:
+            print(f">> [统计进程池] 子进程计算失败，改为本线程计算: {e}")
+            _discard_pool()
+
+    return [func(*job) for job in jobs]
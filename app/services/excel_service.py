@@ -1,9 +1,12 @@
-import io
 import json
 import re
 from datetime import datetime
+from types import SimpleNamespace
 
 import pandas as pd
+from sqlalchemy import insert, update
+from sqlalchemy.orm import joinedload
+from werkzeug.security import generate_password_hash
 
 from app.models import (
     ClassInfo,
@@ -20,16 +23,32 @@ from app.models import (
     User,
     db,
 )
+from app.services.invalidation_service import (
+    invalidate_exam_results,
+    invalidate_grade_results,
+    invalidate_user_identity,
+)
+from app.services.score_service import SCORE_FIELDS, prefetch_scores, upsert_scores
 from app.utils.helpers import (
     _apply_teacher_status_to_account,
     _create_import_batch,
     _normalize_excel_sheet_name,
-    _serialize_score,
+    _pack_rows,
     _serialize_student,
-    _serialize_teacher,
-    _serialize_user,
     _to_excel_value,
 )
+from app.utils.xlsx_writer import write_xlsx_stream
+
+# 教师导入新建账号的初始密码（首次登录强制修改）
+DEFAULT_TEACHER_PASSWORD = "123456"
+# 教师导入会改写的档案字段，回退快照只记录这些字段的原值
+_TEACHER_IMPORT_FIELDS = ("name", "gender", "phone", "job_title", "status")
+
+
+def _report_progress(progress, processed, total):
+    """后台任务执行时回报已处理行数；同步调用时 progress 为 None。"""
+    if progress is not None:
+        progress(processed, total)
 
 
 def build_score_rank_trend_excel(payload, entry_year, only_changed=False):
@@ -44,30 +63,31 @@ def build_score_rank_trend_excel(payload, entry_year, only_changed=False):
     if not exams:
         raise ValueError("当前筛选条件下无可导出的考试数据")
 
-    output = io.BytesIO()
     used_sheet_names = set()
 
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        total_columns = ["学号", "姓名", "班级", "状态"]
-        for idx, exam in enumerate(exams):
-            exam_name = exam.get("name", "")
-            total_columns.append(f"{exam_name}-总分")
-            total_columns.append(f"{exam_name}-级排")
-            total_columns.append(f"{exam_name}-班排")
-            if idx > 0:
-                prev_exam_name = exams[idx - 1].get("name", "")
-                total_columns.append(f"{prev_exam_name}->{exam_name}-总分变化")
-                total_columns.append(f"{prev_exam_name}->{exam_name}-级排变化")
-                total_columns.append(f"{prev_exam_name}->{exam_name}-班排变化")
-
-        total_records = []
+    def base_record(row):
+        return {
+            "学号": row.get("student_id", ""),
+            "姓名": row.get("name", ""),
+            "班级": row.get("class_name", ""),
+            "状态": row.get("status", ""),
+        }
+
+    total_columns = ["学号", "姓名", "班级", "状态"]
+    for idx, exam in enumerate(exams):
+        exam_name = exam.get("name", "")
+        total_columns.append(f"{exam_name}-总分")
+        total_columns.append(f"{exam_name}-级排")
+        total_columns.append(f"{exam_name}-班排")
+        if idx > 0:
+            prev_exam_name = exams[idx - 1].get("name", "")
+            total_columns.append(f"{prev_exam_name}->{exam_name}-总分变化")
+            total_columns.append(f"{prev_exam_name}->{exam_name}-级排变化")
+            total_columns.append(f"{prev_exam_name}->{exam_name}-班排变化")
+
+    def total_records():
         for row in rows:
-            base = {
-                "学号": row.get("student_id", ""),
-                "姓名": row.get("name", ""),
-                "班级": row.get("class_name", ""),
-                "状态": row.get("status", ""),
-            }
+            base = base_record(row)
             exam_data_map = row.get("exam_data", {})
 
             for idx, exam in enumerate(exams):
@@ -87,13 +107,40 @@ def build_score_rank_trend_excel(payload, entry_year, only_changed=False):
                     base[f"{prev_exam_name}->{exam_name}-班排变化"] = _to_excel_value(
                         exam_data.get("class_rank_change")
                     )
-            total_records.append(base)
+            yield base
+
+    def subject_records(subject_name):
+        for row in rows:
+            base = base_record(row)
+            exam_data_map = row.get("exam_data", {})
+
+            for idx, exam in enumerate(exams):
+                exam_name = exam.get("name", "")
+                exam_data = exam_data_map.get(exam_name, {})
+                score_map = exam_data.get("scores", {}) or {}
+                score_change_map = exam_data.get("score_changes", {}) or {}
+
+                base[f"{exam_name}-成绩"] = _to_excel_value(score_map.get(subject_name))
+                base[f"{exam_name}-级排"] = _to_excel_value(exam_data.get("grade_rank"))
+                base[f"{exam_name}-班排"] = _to_excel_value(exam_data.get("class_rank"))
+                if idx > 0:
+                    prev_exam_name = exams[idx - 1].get("name", "")
+                    base[f"{prev_exam_name}->{exam_name}-变化"] = _to_excel_value(
+                        score_change_map.get(subject_name)
+                    )
+                    base[f"{prev_exam_name}->{exam_name}-级排变化"] = _to_excel_value(
+                        exam_data.get("grade_rank_change")
+                    )
+                    base[f"{prev_exam_name}->{exam_name}-班排变化"] = _to_excel_value(
+                        exam_data.get("class_rank_change")
+                    )
+            yield base
 
-        total_df = pd.DataFrame(total_records).reindex(columns=total_columns)
-        total_df.to_excel(
-            writer,
-            index=False,
-            sheet_name=_normalize_excel_sheet_name("总分变化", used_sheet_names),
+    def iter_sheets():
+        yield (
+            _normalize_excel_sheet_name("总分变化", used_sheet_names),
+            total_columns,
+            total_records(),
         )
 
         for subject_name in subjects:
@@ -109,62 +156,20 @@ def build_score_rank_trend_excel(payload, entry_year, only_changed=False):
                     subject_columns.append(f"{prev_exam_name}->{exam_name}-级排变化")
                     subject_columns.append(f"{prev_exam_name}->{exam_name}-班排变化")
 
-            subject_records = []
-            for row in rows:
-                base = {
-                    "学号": row.get("student_id", ""),
-                    "姓名": row.get("name", ""),
-                    "班级": row.get("class_name", ""),
-                    "状态": row.get("status", ""),
-                }
-                exam_data_map = row.get("exam_data", {})
-
-                for idx, exam in enumerate(exams):
-                    exam_name = exam.get("name", "")
-                    exam_data = exam_data_map.get(exam_name, {})
-                    score_map = exam_data.get("scores", {}) or {}
-                    score_change_map = exam_data.get("score_changes", {}) or {}
-
-                    base[f"{exam_name}-成绩"] = _to_excel_value(
-                        score_map.get(subject_name)
-                    )
-                    base[f"{exam_name}-级排"] = _to_excel_value(
-                        exam_data.get("grade_rank")
-                    )
-                    base[f"{exam_name}-班排"] = _to_excel_value(
-                        exam_data.get("class_rank")
-                    )
-                    if idx > 0:
-                        prev_exam_name = exams[idx - 1].get("name", "")
-                        base[f"{prev_exam_name}->{exam_name}-变化"] = _to_excel_value(
-                            score_change_map.get(subject_name)
-                        )
-                        base[f"{prev_exam_name}->{exam_name}-级排变化"] = _to_excel_value(
-                            exam_data.get("grade_rank_change")
-                        )
-                        base[f"{prev_exam_name}->{exam_name}-班排变化"] = _to_excel_value(
-                            exam_data.get("class_rank_change")
-                        )
-                subject_records.append(base)
-
-            subject_df = pd.DataFrame(subject_records).reindex(columns=subject_columns)
-            subject_df.to_excel(
-                writer,
-                index=False,
-                sheet_name=_normalize_excel_sheet_name(
-                    f"{subject_name}变化", used_sheet_names
-                ),
+            yield (
+                _normalize_excel_sheet_name(f"{subject_name}变化", used_sheet_names),
+                subject_columns,
+                subject_records(subject_name),
             )
 
         if warnings:
-            warn_df = pd.DataFrame([{"提示": w} for w in warnings])
-            warn_df.to_excel(
-                writer,
-                index=False,
-                sheet_name=_normalize_excel_sheet_name("导出说明", used_sheet_names),
+            yield (
+                _normalize_excel_sheet_name("导出说明", used_sheet_names),
+                ["提示"],
+                ([w] for w in warnings),
             )
 
-    output.seek(0)
+    output = write_xlsx_stream(iter_sheets())
     suffix = "_仅变化" if only_changed else ""
     filename = f"{entry_year}级_成绩变化比较{suffix}.xlsx"
     return output, filename
@@ -191,32 +196,27 @@ def build_comprehensive_report_excel(payload, entry_year, exam_name):
         "满分值",
     ]
 
-    records = []
-    for row in rows:
-        score_map = row.get("scores", {}) or {}
-        item = {
-            "级排名(总分并列)": _to_excel_value(row.get("grade_rank_skip")),
-            "级排名(规则严格)": _to_excel_value(row.get("grade_rank_dense")),
-            "班排名(总分并列)": _to_excel_value(row.get("class_rank_skip")),
-            "班排名(规则严格)": _to_excel_value(row.get("class_rank_dense")),
-            "学号": row.get("student_id", ""),
-            "姓名": row.get("name", ""),
-            "班级": row.get("class_name", ""),
-            "状态": row.get("status", ""),
-            "总分": _to_excel_value(row.get("total")),
-            "满分值": _to_excel_value(row.get("full_score")),
-        }
-        for subject_name in subjects:
-            item[subject_name] = _to_excel_value(score_map.get(subject_name, "-"))
-        records.append(item)
+    def records():
+        for row in rows:
+            score_map = row.get("scores", {}) or {}
+            item = {
+                "级排名(总分并列)": _to_excel_value(row.get("grade_rank_skip")),
+                "级排名(规则严格)": _to_excel_value(row.get("grade_rank_dense")),
+                "班排名(总分并列)": _to_excel_value(row.get("class_rank_skip")),
+                "班排名(规则严格)": _to_excel_value(row.get("class_rank_dense")),
+                "学号": row.get("student_id", ""),
+                "姓名": row.get("name", ""),
+                "班级": row.get("class_name", ""),
+                "状态": row.get("status", ""),
+                "总分": _to_excel_value(row.get("total")),
+                "满分值": _to_excel_value(row.get("full_score")),
+            }
+            for subject_name in subjects:
+                item[subject_name] = _to_excel_value(score_map.get(subject_name, "-"))
+            yield item
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        pd.DataFrame(records).reindex(columns=export_columns).to_excel(
-            writer, index=False, sheet_name="综合成绩统计"
-        )
+    output = write_xlsx_stream([("综合成绩统计", export_columns, records())])
 
-    output.seek(0)
     safe_entry_year = str(entry_year).strip() or "未指定年级"
     safe_exam_name = str(exam_name).strip() or "未命名考试"
     filename = f"{safe_entry_year}级_{safe_exam_name}_综合成绩统计.xlsx"
@@ -267,24 +267,49 @@ def build_teacher_score_stats_excel(rows, entry_year, exam_name, academic_year):
             }
         )
 
-    output = io.BytesIO()
     sheet_base_name = "教师教学统计"
     if academic_year:
         sheet_base_name = f"{academic_year}学年教师统计"
 
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        pd.DataFrame(data_list).reindex(columns=columns).to_excel(
-            writer, index=False, sheet_name=sheet_base_name[:31]
-        )
-
-    output.seek(0)
+    output = write_xlsx_stream([(sheet_base_name[:31], columns, data_list)])
     safe_entry_year = str(entry_year).strip() or "未指定年级"
     safe_exam_name = str(exam_name).strip() or "未命名考试"
     filename = f"{safe_entry_year}级_{safe_exam_name}_教师教学统计.xlsx"
     return output, filename
 
 
-def process_students_import(file):
+# 学生导入会写入的字段（学号除外）
+_STUDENT_IMPORT_FIELDS = (
+    "name",
+    "class_id",
+    "gender",
+    "status",
+    "household_registration",
+    "remarks",
+    "city_school_id",
+    "national_school_id",
+    "id_card_number",
+)
+
+
+def _clean_str_series(series):
+    """整列转字符串并去掉 Excel 数字列带出的 “.0” 后缀。"""
+    values = series.astype(str).str.strip()
+    return values.where(~values.str.endswith(".0"), values.str[:-2])
+
+
+def _column_or_default(df, col, default):
+    if col in df.columns:
+        return df[col].astype(str).str.strip().tolist()
+    return [default] * len(df)
+
+
+def process_students_import(file, progress=None):
+    """
+    学生名单导入：班级、学生、身份证号一次性预取为字典，整列解析后逐行在内存中校验，
+    最后批量插入新学生、批量更新有变化的学生。逐行语义（后行覆盖前行、
+    身份证号冲突判断以处理到该行时的状态为准）与逐条写库时一致。
+    """
     try:
         df = pd.read_excel(file).fillna("")
 
@@ -301,82 +326,168 @@ def process_students_import(file):
         before_students = {}
         created_student_ids = []
         created_class_ids = []
+        total = len(df)
+
+        # --- 整列解析 ---
+        class_strs = df[class_col].astype(str).str.strip()
+        class_parts = class_strs.str.extract(r"(\d+)级\s*[（\(](\d+)[）\)]\s*班")
+        class_keys = []
+        for y_str, n_str in zip(class_parts[0].tolist(), class_parts[1].tolist()):
+            if not isinstance(y_str, str):
+                class_keys.append(None)
+                continue
+            short_year = int(y_str)
+            entry_year = 2000 + short_year if short_year < 100 else short_year
+            class_keys.append((entry_year, int(n_str)))
+
+        columns = {
+            "student_id": _clean_str_series(df[id_col]).tolist(),
+            "name": df[name_col].astype(str).str.strip().tolist(),
+            "gender": _column_or_default(df, "性别", "男"),
+            "status": _column_or_default(df, "状态", "在读"),
+            "household_registration": _column_or_default(df, "户籍", ""),
+            "remarks": _column_or_default(df, "备注", ""),
+            "city_school_id": (
+                _clean_str_series(df["市学籍号"]).tolist()
+                if "市学籍号" in df.columns
+                else [""] * total
+            ),
+            "national_school_id": (
+                _clean_str_series(df["国家学籍号"]).tolist()
+                if "国家学籍号" in df.columns
+                else [""] * total
+            ),
+            "id_card_number": _column_or_default(df, "身份证号", ""),
+        }
 
-        class_pattern = re.compile(r"(\d+)级\s*[（\(](\d+)[）\)]\s*班")
-
-        def clean_str(val):
-            s = str(val).strip()
-            return s[:-2] if s.endswith(".0") else s
+        # --- 班级：一次预取，缺失的按首次出现顺序统一创建 ---
+        class_map = {
+            (c.entry_year, c.class_num): c.id
+            for c in db.session.query(
+                ClassInfo.id, ClassInfo.entry_year, ClassInfo.class_num
+            ).order_by(ClassInfo.id)
+        }
+        new_classes = []
+        for key in class_keys:
+            if key is not None and key not in class_map:
+                class_map[key] = None
+                new_classes.append(ClassInfo(entry_year=key[0], class_num=key[1]))
+        if new_classes:
+            db.session.add_all(new_classes)
+            db.session.flush()
+            for cls in new_classes:
+                class_map[(cls.entry_year, cls.class_num)] = cls.id
+                created_class_ids.append(
+                    {"id": cls.id, "entry_year": cls.entry_year, "class_num": cls.class_num}
+                )
 
-        for index, row in df.iterrows():
+        # --- 学生与身份证号：一次预取 ---
+        students = {}
+        originals = {}
+        card_holders = {}
+        for row in db.session.query(
+            Student.id, Student.student_id, *[getattr(Student, f) for f in _STUDENT_IMPORT_FIELDS]
+        ):
+            rec = SimpleNamespace(**row._asdict())
+            students[rec.student_id] = rec
+            originals[rec.student_id] = {f: getattr(rec, f) for f in _STUDENT_IMPORT_FIELDS}
+            if rec.id_card_number:
+                card_holders[rec.id_card_number] = rec
+
+        new_students = {}
+        for index in range(total):
+            _report_progress(progress, index, total)
             row_num = index + 2
-            class_str = str(row[class_col]).strip()
-            match = class_pattern.search(class_str)
-
-            class_id = None
-            if match:
-                y_str = match.group(1)
-                n_str = match.group(2)
-                short_year = int(y_str)
-                entry_year = 2000 + short_year if short_year < 100 else short_year
-                class_num = int(n_str)
-
-                cls = ClassInfo.query.filter_by(
-                    entry_year=entry_year, class_num=class_num
-                ).first()
-                if not cls:
-                    cls = ClassInfo(entry_year=entry_year, class_num=class_num)
-                    db.session.add(cls)
-                    db.session.flush()
-                    created_class_ids.append(
-                        {"id": cls.id, "entry_year": entry_year, "class_num": class_num}
-                    )
-                class_id = cls.id
-            else:
-                warnings.append(f"行{row_num}: 班级格式无法识别【{class_str}】，已跳过。")
+
+            key = class_keys[index]
+            if key is None:
+                warnings.append(
+                    f"行{row_num}: 班级格式无法识别【{class_strs.iat[index]}】，已跳过。"
+                )
                 continue
 
-            student_id = clean_str(row[id_col])
+            student_id = columns["student_id"][index]
             if not student_id:
                 continue
 
-            name = str(row[name_col]).strip()
-            student = Student.query.filter_by(student_id=student_id).first()
+            name = columns["name"][index]
+            student = students.get(student_id)
             is_new = False
 
-            if not student:
-                student = Student(student_id=student_id)
+            if student is None:
+                student = SimpleNamespace(
+                    id=None, student_id=student_id, id_card_number=None
+                )
+                students[student_id] = student
+                new_students[student_id] = student
                 is_new = True
                 created_student_ids.append(student_id)
             elif student_id not in before_students:
                 before_students[student_id] = _serialize_student(student)
 
             student.name = name
-            student.class_id = class_id
-            student.gender = str(row.get("性别", "男")).strip()
-            student.status = str(row.get("状态", "在读")).strip()
-            student.household_registration = str(row.get("户籍", "")).strip()
-            student.remarks = str(row.get("备注", "")).strip()
-
-            student.city_school_id = clean_str(row.get("市学籍号", ""))
-            student.national_school_id = clean_str(row.get("国家学籍号", ""))
-
-            raw_id_card = str(row.get("身份证号", "")).strip()
+            student.class_id = class_map[key]
+            for field in (
+                "gender",
+                "status",
+                "household_registration",
+                "remarks",
+                "city_school_id",
+                "national_school_id",
+            ):
+                setattr(student, field, columns[field][index])
+
+            raw_id_card = columns["id_card_number"][index]
             if raw_id_card:
-                conflict_stu = Student.query.filter_by(id_card_number=raw_id_card).first()
+                conflict_stu = card_holders.get(raw_id_card)
                 if conflict_stu and conflict_stu.student_id != student_id:
                     warnings.append(
                         f"行{row_num}: 学生【{name}】的身份证号与库中【{conflict_stu.name}】重复，已忽略身份证更新。"
                     )
                 else:
+                    if student.id_card_number and student.id_card_number != raw_id_card:
+                        card_holders.pop(student.id_card_number, None)
                     student.id_card_number = raw_id_card
+                    card_holders[raw_id_card] = student
 
             if is_new:
-                db.session.add(student)
                 success_count += 1
             else:
                 updated_count += 1
 
+        # --- 批量写入 ---
+        updates = []
+        released_cards = []
+        for student_id, original in originals.items():
+            student = students[student_id]
+            changed = {
+                f: getattr(student, f)
+                for f in _STUDENT_IMPORT_FIELDS
+                if getattr(student, f) != original[f]
+            }
+            if not changed:
+                continue
+            updates.append({"id": student.id, **changed})
+            if "id_card_number" in changed and original["id_card_number"]:
+                released_cards.append({"id": student.id, "id_card_number": None})
+
+        # 身份证号唯一：先清空将要变更的旧号，避免按行合并后的更新顺序撞上唯一约束
+        if released_cards:
+            db.session.execute(update(Student), released_cards)
+        if new_students:
+            db.session.execute(
+                insert(Student),
+                [
+                    {
+                        "student_id": sid,
+                        **{f: getattr(stu, f) for f in _STUDENT_IMPORT_FIELDS},
+                    }
+                    for sid, stu in new_students.items()
+                ],
+            )
+        if updates:
+            db.session.execute(update(Student), updates)
+
         _create_import_batch(
             import_type="student",
             source_filename=file.filename,
@@ -392,6 +503,7 @@ def process_students_import(file):
                 "created_class_ids": created_class_ids,
             },
         )
+        invalidate_grade_results()
         db.session.commit()
 
         msg = f"导入成功！新增 {success_count} 人，更新 {updated_count} 人。"
@@ -415,14 +527,16 @@ def export_students_excel(class_id):
     if class_id:
         query = query.filter_by(class_id=class_id)
 
+    # 逐批读取并逐行写出，全校名单也不会整体加载到内存
     students = (
         query.join(ClassInfo)
+        .with_entities(Student, ClassInfo.entry_year, ClassInfo.class_num)
         .order_by(
             ClassInfo.entry_year.desc(),
             ClassInfo.class_num.asc(),
             Student.student_id.asc(),
         )
-        .all()
+        .yield_per(500)
     )
 
     columns = [
@@ -438,37 +552,27 @@ def export_students_excel(class_id):
         "备注",
     ]
 
-    data_list = []
-    for s in students:
-        class_name = ""
-        if s.current_class_rel:
-            c = s.current_class_rel
-            short_year = str(c.entry_year)[-2:]
-            class_num_str = str(c.class_num).zfill(2)
+    def records():
+        for s, entry_year, class_num in students:
+            short_year = str(entry_year)[-2:]
+            class_num_str = str(class_num).zfill(2)
             class_name = f"{short_year}级({class_num_str})班"
 
-        data_list.append(
-            {
-                "学号": s.student_id,
-                "姓名": s.name,
-                "性别": s.gender,
-                "班级": class_name,
-                "状态": s.status,
-                "身份证号": s.id_card_number,
-                "市学籍号": s.city_school_id,
-                "国家学籍号": s.national_school_id,
-                "户籍": s.household_registration,
-                "备注": s.remarks,
-            }
-        )
-
-    df = pd.DataFrame(data_list, columns=columns)
+            yield (
+                s.student_id,
+                s.name,
+                s.gender,
+                class_name,
+                s.status,
+                s.id_card_number,
+                s.city_school_id,
+                s.national_school_id,
+                s.household_registration,
+                s.remarks,
+            )
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="学生信息")
+    output = write_xlsx_stream([("学生信息", columns, records())])
 
-    output.seek(0)
     filename = "全体学生名单_备份.xlsx"
     if class_id:
         cls = ClassInfo.query.get(class_id)
@@ -477,7 +581,56 @@ def export_students_excel(class_id):
     return output, filename
 
 
-def process_teachers_import(file, academic_year):
+def _teacher_import_values(teacher):
+    return tuple(getattr(teacher, f) for f in _TEACHER_IMPORT_FIELDS)
+
+
+def _replace_leader_assignments(model, columns, academic_year, desired):
+    """
+    把该学年的领导分工替换为 desired [(teacher_id, *columns)]，只删除/插入有差异的行
+    （同值的行原样保留，重复行按个数匹配）。
+    返回 {"inserted_ids": [...], "deleted": 打包的被删除行}，供回退使用。
+    """
+    value_columns = ("teacher_id", *columns)
+    existing = {}
+    for row in db.session.query(
+        model.id, *(getattr(model, col) for col in value_columns)
+    ).filter(model.academic_year == academic_year):
+        existing.setdefault(tuple(row[1:]), []).append(row.id)
+
+    inserts = []
+    for values in desired:
+        kept = existing.get(values)
+        if kept:
+            kept.pop()
+        else:
+            inserts.append(values)
+
+    deleted = []
+    delete_ids = []
+    for values, row_ids in existing.items():
+        for row_id in row_ids:
+            delete_ids.append(row_id)
+            deleted.append(values)
+
+    if delete_ids:
+        db.session.query(model).filter(model.id.in_(delete_ids)).delete(
+            synchronize_session=False
+        )
+    inserted_ids = []
+    if inserts:
+        result = db.session.execute(
+            insert(model).returning(model.id),
+            [
+                {**dict(zip(value_columns, values)), "academic_year": academic_year}
+                for values in inserts
+            ],
+        )
+        inserted_ids = sorted(result.scalars().all())
+    return {"inserted_ids": inserted_ids, "deleted": _pack_rows(value_columns, deleted)}
+
+
+def process_teachers_import(file, academic_year, progress=None):
     if not academic_year:
         return {"msg": "请选择导入的学年"}, 400
 
@@ -540,95 +693,91 @@ def process_teachers_import(file, academic_year):
         return {"msg": f"数据校验未通过，请修正Excel后重试：<br>{error_msg}"}, 400
 
     try:
-        before_assignments = {
-            "grade": [
-                {
-                    "teacher_id": r.teacher_id,
-                    "entry_year": r.entry_year,
-                    "academic_year": r.academic_year,
-                }
-                for r in GradeLeaderAssignment.query.filter_by(
-                    academic_year=academic_year
-                ).all()
-            ],
-            "subject": [
-                {
-                    "teacher_id": r.teacher_id,
-                    "subject_id": r.subject_id,
-                    "academic_year": r.academic_year,
-                }
-                for r in SubjectGroupLeaderAssignment.query.filter_by(
-                    academic_year=academic_year
-                ).all()
-            ],
-            "prep": [
-                {
-                    "teacher_id": r.teacher_id,
-                    "entry_year": r.entry_year,
-                    "subject_id": r.subject_id,
-                    "academic_year": r.academic_year,
-                }
-                for r in PrepGroupLeaderAssignment.query.filter_by(
-                    academic_year=academic_year
-                ).all()
-            ],
-        }
-
-        db.session.query(GradeLeaderAssignment).filter_by(
-            academic_year=academic_year
-        ).delete()
-        db.session.query(SubjectGroupLeaderAssignment).filter_by(
-            academic_year=academic_year
-        ).delete()
-        db.session.query(PrepGroupLeaderAssignment).filter_by(
-            academic_year=academic_year
-        ).delete()
-
         added_count = 0
         updated_count = 0
         frozen_count = 0
+        # 已有账号/教师档案首次被本批次改到时的原值，提交前只保留实际变化的
         before_users = {}
         before_teachers = {}
         created_usernames = []
-        created_teacher_user_ids = []
+        created_teacher_users = []
+        created_users = set()
+        created_teachers = set()
+        touched_user_ids = set()
+
+        # 账号与教师档案按工号一次预取；新账号统一使用同一个默认密码哈希
+        usernames = {
+            str(val).strip() for val in df.get("工号", pd.Series(dtype=str)).tolist()
+        }
+        usernames.discard("")
+        user_map = {}
+        if usernames:
+            user_map = {
+                u.username: u
+                for u in User.query.options(joinedload(User.teacher_profile))
+                .filter(User.username.in_(usernames))
+                .all()
+            }
+        teacher_map = {u.username: u.teacher_profile for u in user_map.values()}
+        default_password_hash = None
+
+        grade_rows = []
+        subject_rows = []
+        prep_rows = []
 
-        for _, row in df.iterrows():
+        for index, row in df.iterrows():
+            _report_progress(progress, index, len(df))
             username = str(row.get("工号", "")).strip()
             name = str(row.get("姓名", "")).strip()
             if not username or not name:
                 continue
 
-            user = User.query.filter_by(username=username).first()
+            user = user_map.get(username)
             if not user:
+                if default_password_hash is None:
+                    default_password_hash = generate_password_hash(
+                        DEFAULT_TEACHER_PASSWORD
+                    )
                 user = User(
                     username=username,
                     role="teacher",
                     is_approved=True,
                     must_change_password=True,
+                    password_hash=default_password_hash,
                 )
-                user.set_password("123456")
                 db.session.add(user)
-                db.session.flush()
+                user_map[username] = user
                 created_usernames.append(username)
+                created_users.add(user)
 
-                teacher = Teacher(user_id=user.id, name=name)
+                # 未 flush 前列默认值尚未生效，性别默认值需显式给出
+                teacher = Teacher(user=user, name=name, gender="男")
                 db.session.add(teacher)
-                db.session.flush()
-                created_teacher_user_ids.append(user.id)
+                teacher_map[username] = teacher
+                created_teacher_users.append(user)
+                created_teachers.add(teacher)
                 added_count += 1
             else:
-                if username not in before_users:
-                    before_users[username] = _serialize_user(user)
-                teacher = user.teacher_profile
+                if user.id is None:
+                    # 同一工号在表中重复出现且为本次新建：补 flush 以取得 id
+                    db.session.flush()
+                if user not in created_users:
+                    before_users.setdefault(user.id, (user, bool(user.is_approved)))
+                touched_user_ids.add(user.id)
+                teacher = teacher_map.get(username)
                 if teacher:
-                    if user.id not in before_teachers:
-                        before_teachers[user.id] = _serialize_teacher(teacher)
+                    if teacher not in created_teachers:
+                        before_teachers.setdefault(
+                            teacher.id,
+                            (teacher, _teacher_import_values(teacher)),
+                        )
                     updated_count += 1
                 else:
-                    teacher = Teacher(user_id=user.id, name=name)
+                    teacher = Teacher(user=user, name=name, gender="男")
                     db.session.add(teacher)
-                    db.session.flush()
-                    created_teacher_user_ids.append(user.id)
+                    teacher_map[username] = teacher
+                    created_teacher_users.append(user)
+                    created_teachers.add(teacher)
 
             teacher.name = name
             teacher.gender = str(row.get("性别", teacher.gender))
@@ -646,25 +795,13 @@ def process_teachers_import(file, academic_year):
             for item in split_str(gl_str):
                 entry_year = parse_year(item)
                 if entry_year:
-                    db.session.add(
-                        GradeLeaderAssignment(
-                            teacher_id=teacher.id,
-                            entry_year=entry_year,
-                            academic_year=academic_year,
-                        )
-                    )
+                    grade_rows.append((teacher, {"entry_year": entry_year}))
 
             sgl_str = row.get("科组长分配", "")
             for item in split_str(sgl_str):
                 sid = subject_map.get(item)
                 if sid:
-                    db.session.add(
-                        SubjectGroupLeaderAssignment(
-                            teacher_id=teacher.id,
-                            subject_id=sid,
-                            academic_year=academic_year,
-                        )
-                    )
+                    subject_rows.append((teacher, {"subject_id": sid}))
 
             pgl_str = row.get("备课组长分配", "")
             for item in split_str(pgl_str):
@@ -676,15 +813,44 @@ def process_teachers_import(file, academic_year):
                     sid = subject_map.get(sub_name)
 
                     if entry_year and sid:
-                        db.session.add(
-                            PrepGroupLeaderAssignment(
-                                teacher_id=teacher.id,
-                                entry_year=entry_year,
-                                subject_id=sid,
-                                academic_year=academic_year,
-                            )
+                        prep_rows.append(
+                            (teacher, {"entry_year": entry_year, "subject_id": sid})
                         )
 
+        # 新账号与教师档案一次 flush 取得 id，再按差异写入各类分工
+        db.session.flush()
+        created_teacher_user_ids = [user.id for user in created_teacher_users]
+        leader_changes = {}
+        for kind, model, columns, rows in (
+            ("grade", GradeLeaderAssignment, ("entry_year",), grade_rows),
+            ("subject", SubjectGroupLeaderAssignment, ("subject_id",), subject_rows),
+            ("prep", PrepGroupLeaderAssignment, ("entry_year", "subject_id"), prep_rows),
+        ):
+            leader_changes[kind] = _replace_leader_assignments(
+                model,
+                columns,
+                academic_year,
+                [
+                    (teacher.id, *(values[col] for col in columns))
+                    for teacher, values in rows
+                ],
+            )
+
+        # 快照只记录实际变化的账号审核状态与教师档案字段（不含密码哈希）
+        user_changes = [
+            (user_id, before)
+            for user_id, (user, before) in before_users.items()
+            if bool(user.is_approved) != before
+        ]
+        teacher_changes = [
+            (teacher_id, *before)
+            for teacher_id, (teacher, before) in before_teachers.items()
+            if _teacher_import_values(teacher) != before
+        ]
+
+        # 已有账号的审核状态或教师档案可能变化
+        invalidate_user_identity(touched_user_ids)
+
         _create_import_batch(
             import_type="teacher",
             source_filename=file.filename,
@@ -693,11 +859,17 @@ def process_teachers_import(file, academic_year):
                 "added": added_count,
                 "updated": updated_count,
                 "frozen": frozen_count,
+                "changed_leader_assignments": sum(
+                    len(change["inserted_ids"]) + len(change["deleted"]["rows"])
+                    for change in leader_changes.values()
+                ),
             },
             snapshot={
-                "before_assignments": before_assignments,
-                "before_users": list(before_users.values()),
-                "before_teachers": list(before_teachers.values()),
+                "leader_assignment_changes": leader_changes,
+                "user_changes": _pack_rows(("id", "is_approved"), user_changes),
+                "teacher_changes": _pack_rows(
+                    ("id", *_TEACHER_IMPORT_FIELDS), teacher_changes
+                ),
                 "created_usernames": created_usernames,
                 "created_teacher_user_ids": created_teacher_user_ids,
             },
@@ -712,94 +884,108 @@ def process_teachers_import(file, academic_year):
         return {"msg": f"导入失败: {str(e)}"}, 500
 
 
-def process_course_assignments_import(file, academic_year):
-    if not academic_year:
-        return {"msg": "请选择导入的学年"}, 400
-
-    try:
-        df = pd.read_excel(file).fillna("")
-    except Exception as e:
-        return {"msg": f"Excel读取失败: {str(e)}"}, 400
-
+def _plan_course_assignments(df, class_col, academic_year, progress=None):
+    """
+    任课导入第一阶段（纯内存）：整列解析班级名，校验并生成该学年期望的
+    任课 {(class_id, subject_id): teacher_id} 与班主任 {class_id: teacher_id}。
+    返回 (errors, course_desired, head_desired, class_count)。
+    """
     valid_years = [academic_year, academic_year - 1, academic_year - 2]
     valid_years_str = "/".join([f"{y}级" for y in valid_years])
 
-    all_teachers = Teacher.query.all()
-    teacher_map = {t.name: t.id for t in all_teachers}
+    teacher_map = {t.name: t.id for t in db.session.query(Teacher.id, Teacher.name)}
+    subject_map = {s.name: s.id for s in db.session.query(Subject.id, Subject.name)}
 
-    all_subjects = Subject.query.all()
-    subject_map = {s.name: s.id for s in all_subjects}
-
-    all_classes = ClassInfo.query.all()
     class_map = {}
-    for c in all_classes:
+    class_entry_years = {}
+    for c in db.session.query(ClassInfo.id, ClassInfo.entry_year, ClassInfo.class_num):
         short_year = str(c.entry_year)[-2:]
         class_num_str = str(c.class_num).zfill(2)
         key = f"{short_year}级({class_num_str})班"
         class_map[key] = c.id
+        class_entry_years[c.id] = c.entry_year
 
-    class_pattern = re.compile(r"(\d+)级\s*[（\(](\d+)[）\)]\s*班")
+    # 每列的角色只判断一次：班主任列 / 科目列（科目 id）
+    role_columns = []
+    for col_name in df.columns:
+        if col_name == class_col or not str(col_name).strip():
+            continue
+        if "班主任" in str(col_name):
+            role_columns.append((col_name, None))
+        elif col_name in subject_map:
+            role_columns.append((col_name, subject_map[col_name]))
+    cell_values = {
+        col_name: df[col_name].astype(str).str.strip().tolist()
+        for col_name, _ in role_columns
+    }
+
+    class_names = df[class_col].astype(str).str.strip()
+    class_parts = class_names.str.extract(r"(\d+)级\s*[（\(](\d+)[）\)]\s*班")
 
     errors = []
     missing_teachers = set()
+    course_desired = {}
+    head_desired = {}
+    class_count = 0
+    total = len(df)
 
-    class_col = next((col for col in df.columns if "班级" in str(col)), None)
-    if not class_col:
-        return {"msg": "Excel中未找到包含[班级]的列"}, 400
-
-    for index, row in df.iterrows():
+    for index in range(total):
+        _report_progress(progress, index, total)
         row_num = index + 2
-        class_name_raw = str(row[class_col]).strip()
-
+        class_name_raw = class_names.iat[index]
         if not class_name_raw:
             continue
 
-        match = class_pattern.search(class_name_raw)
-        standard_key = None
-
-        if match:
-            y_str = match.group(1)
-            n_str = match.group(2)
+        y_str = class_parts.iat[index, 0]
+        if not isinstance(y_str, str):
+            errors.append(f"行{row_num}: 班级名格式无法识别【{class_name_raw}】")
+            continue
 
-            entry_year = int(y_str) if len(y_str) == 4 else 2000 + int(y_str)
-            short_year = str(entry_year)[-2:]
-            class_num = int(n_str)
-            standard_key = f"{short_year}级({str(class_num).zfill(2)})班"
+        entry_year = int(y_str) if len(y_str) == 4 else 2000 + int(y_str)
+        short_year = str(entry_year)[-2:]
+        class_num = int(class_parts.iat[index, 1])
+        standard_key = f"{short_year}级({str(class_num).zfill(2)})班"
 
-            if entry_year not in valid_years:
-                errors.append(
-                    f"行{row_num}: 班级【{standard_key}】(原:{class_name_raw}) 的年份在 {academic_year} 学年无效。合法范围: {valid_years_str}"
-                )
-                continue
+        if entry_year not in valid_years:
+            errors.append(
+                f"行{row_num}: 班级【{standard_key}】(原:{class_name_raw}) 的年份在 {academic_year} 学年无效。合法范围: {valid_years_str}"
+            )
+            continue
 
-            if standard_key not in class_map:
-                errors.append(
-                    f"行{row_num}: 系统中找不到班级【{standard_key}】，请先在班级管理中创建"
-                )
-                continue
-        else:
-            errors.append(f"行{row_num}: 班级名格式无法识别【{class_name_raw}】")
+        if standard_key not in class_map:
+            errors.append(
+                f"行{row_num}: 系统中找不到班级【{standard_key}】，请先在班级管理中创建"
+            )
             continue
 
-        cls_obj = ClassInfo.query.get(class_map[standard_key])
-        if cls_obj and cls_obj.entry_year not in valid_years:
+        class_id = class_map[standard_key]
+        cls_entry_year = class_entry_years[class_id]
+        if cls_entry_year not in valid_years:
             errors.append(
-                f"行{row_num}: 班级【{standard_key}】是 {cls_obj.entry_year}级，不属于 {academic_year} 学年的范围"
+                f"行{row_num}: 班级【{standard_key}】是 {cls_entry_year}级，不属于 {academic_year} 学年的范围"
             )
 
-        for col_name in df.columns:
-            if col_name == class_col or not str(col_name).strip():
+        class_count += 1
+        for col_name, subject_id in role_columns:
+            teacher_name = cell_values[col_name][index]
+            if not teacher_name:
                 continue
 
-            cell_value = str(row[col_name]).strip()
-            if not cell_value:
+            teacher_id = teacher_map.get(teacher_name)
+            if not teacher_id:
+                missing_teachers.add(teacher_name)
                 continue
 
-            is_subject = col_name in subject_map
-            is_ht = "班主任" in str(col_name)
-
-            if (is_subject or is_ht) and cell_value not in teacher_map:
-                missing_teachers.add(cell_value)
+            if subject_id is None:
+                target, key = head_desired, class_id
+            else:
+                target, key = course_desired, (class_id, subject_id)
+            if key in target:
+                errors.append(
+                    f"行{row_num}: 班级【{standard_key}】的【{col_name}】在表中重复填写"
+                )
+                continue
+            target[key] = teacher_id
 
     if missing_teachers:
         t_list = list(missing_teachers)[:5]
@@ -808,6 +994,55 @@ def process_course_assignments_import(file, academic_year):
             msg += "..."
         errors.append(msg)
 
+    return errors, course_desired, head_desired, class_count
+
+
+def _diff_assignments(existing, desired):
+    """
+    比较现有与期望的分配（键 -> (行 id, teacher_id) / 键 -> teacher_id），
+    返回 (待删除 id, 待更新 [{id, teacher_id}], 待插入 [(键, teacher_id)], 变更行)。
+    变更行为 (键, 原 teacher_id, 新 teacher_id)，None 表示该键原本不存在/被删除。
+    """
+    delete_ids = []
+    updates = []
+    inserts = []
+    changes = []
+    for key, (row_id, teacher_id) in existing.items():
+        new_teacher_id = desired.get(key)
+        if new_teacher_id is None:
+            delete_ids.append(row_id)
+            changes.append((key, teacher_id, None))
+        elif new_teacher_id != teacher_id:
+            updates.append({"id": row_id, "teacher_id": new_teacher_id})
+            changes.append((key, teacher_id, new_teacher_id))
+    for key, teacher_id in desired.items():
+        if key not in existing:
+            inserts.append((key, teacher_id))
+            changes.append((key, None, teacher_id))
+    return delete_ids, updates, inserts, changes
+
+
+def process_course_assignments_import(file, academic_year, progress=None):
+    """
+    任课与班主任导入：先在内存中校验并算出该学年的期望分配，
+    再只对差异部分执行删除/更新/插入，快照也只记录变化的分配。
+    """
+    if not academic_year:
+        return {"msg": "请选择导入的学年"}, 400
+
+    try:
+        df = pd.read_excel(file).fillna("")
+    except Exception as e:
+        return {"msg": f"Excel读取失败: {str(e)}"}, 400
+
+    class_col = next((col for col in df.columns if "班级" in str(col)), None)
+    if not class_col:
+        return {"msg": "Excel中未找到包含[班级]的列"}, 400
+
+    errors, course_desired, head_desired, count = _plan_course_assignments(
+        df, class_col, academic_year, progress=progress
+    )
+
     if errors:
         error_html = "<br>".join(errors[:8])
         if len(errors) > 8:
@@ -815,90 +1050,80 @@ def process_course_assignments_import(file, academic_year):
         return {"msg": f"校验失败，请修正后重试：<br>{error_html}", "errors": errors}, 400
 
     try:
-        before_course_assignments = [
-            {
-                "teacher_id": item.teacher_id,
-                "class_id": item.class_id,
-                "subject_id": item.subject_id,
-                "academic_year": item.academic_year,
-            }
-            for item in CourseAssignment.query.filter_by(academic_year=academic_year).all()
-        ]
-        before_head_teacher_assignments = [
-            {
-                "teacher_id": item.teacher_id,
-                "class_id": item.class_id,
-                "academic_year": item.academic_year,
-            }
-            for item in HeadTeacherAssignment.query.filter_by(
-                academic_year=academic_year
-            ).all()
-        ]
-
-        db.session.query(CourseAssignment).filter_by(academic_year=academic_year).delete()
-        db.session.query(HeadTeacherAssignment).filter_by(academic_year=academic_year).delete()
-
-        count = 0
-
-        for _, row in df.iterrows():
-            class_name_raw = str(row[class_col]).strip()
-            if not class_name_raw:
-                continue
-
-            match = class_pattern.search(class_name_raw)
-            if not match:
-                continue
-
-            y_str = match.group(1)
-            n_str = match.group(2)
-            entry_year = int(y_str) if len(y_str) == 4 else 2000 + int(y_str)
-            short_year = str(entry_year)[-2:]
-            class_num = int(n_str)
-            standard_key = f"{short_year}级({str(class_num).zfill(2)})班"
-
-            if standard_key not in class_map:
-                continue
+        existing_course = {
+            (r.class_id, r.subject_id): (r.id, r.teacher_id)
+            for r in db.session.query(
+                CourseAssignment.id,
+                CourseAssignment.class_id,
+                CourseAssignment.subject_id,
+                CourseAssignment.teacher_id,
+            ).filter(CourseAssignment.academic_year == academic_year)
+        }
+        existing_head = {
+            r.class_id: (r.id, r.teacher_id)
+            for r in db.session.query(
+                HeadTeacherAssignment.id,
+                HeadTeacherAssignment.class_id,
+                HeadTeacherAssignment.teacher_id,
+            ).filter(HeadTeacherAssignment.academic_year == academic_year)
+        }
 
-            class_id = class_map[standard_key]
-
-            for col_name in df.columns:
-                teacher_name = str(row[col_name]).strip()
-                if not teacher_name:
-                    continue
-
-                if "班主任" in str(col_name):
-                    teacher_id = teacher_map.get(teacher_name)
-                    if teacher_id:
-                        db.session.add(
-                            HeadTeacherAssignment(
-                                teacher_id=teacher_id,
-                                class_id=class_id,
-                                academic_year=academic_year,
-                            )
-                        )
-                elif col_name in subject_map:
-                    teacher_id = teacher_map.get(teacher_name)
-                    subject_id = subject_map[col_name]
-                    if teacher_id:
-                        db.session.add(
-                            CourseAssignment(
-                                teacher_id=teacher_id,
-                                class_id=class_id,
-                                subject_id=subject_id,
-                                academic_year=academic_year,
-                            )
-                        )
+        course_delete, course_update, course_insert, course_changes = _diff_assignments(
+            existing_course, course_desired
+        )
+        head_delete, head_update, head_insert, head_changes = _diff_assignments(
+            existing_head, head_desired
+        )
 
-            count += 1
+        _apply_assignment_delta(
+            CourseAssignment,
+            course_delete,
+            course_update,
+            [
+                {
+                    "teacher_id": teacher_id,
+                    "class_id": class_id,
+                    "subject_id": subject_id,
+                    "academic_year": academic_year,
+                }
+                for (class_id, subject_id), teacher_id in course_insert
+            ],
+        )
+        _apply_assignment_delta(
+            HeadTeacherAssignment,
+            head_delete,
+            head_update,
+            [
+                {
+                    "teacher_id": teacher_id,
+                    "class_id": class_id,
+                    "academic_year": academic_year,
+                }
+                for class_id, teacher_id in head_insert
+            ],
+        )
 
         _create_import_batch(
             import_type="course_assign",
             source_filename=file.filename,
             scope={"academic_year": academic_year},
-            summary={"updated_classes": count},
+            summary={
+                "updated_classes": count,
+                "changed_course_assignments": len(course_changes),
+                "changed_head_teacher_assignments": len(head_changes),
+            },
             snapshot={
-                "before_course_assignments": before_course_assignments,
-                "before_head_teacher_assignments": before_head_teacher_assignments,
+                "course_assignment_changes": _pack_rows(
+                    ["class_id", "subject_id", "before_teacher_id", "after_teacher_id"],
+                    [
+                        [class_id, subject_id, before, after]
+                        for (class_id, subject_id), before, after in course_changes
+                    ],
+                ),
+                "head_teacher_assignment_changes": _pack_rows(
+                    ["class_id", "before_teacher_id", "after_teacher_id"],
+                    [[class_id, before, after] for class_id, before, after in head_changes],
+                ),
             },
         )
         db.session.commit()
@@ -911,6 +1136,18 @@ def process_course_assignments_import(file, academic_year):
         return {"msg": f"数据库写入错误: {str(e)}"}, 500
 
 
+def _apply_assignment_delta(model, delete_ids, updates, inserts):
+    """按差异批量写入分配表：先删、再改、后插，避免撞上唯一约束。"""
+    if delete_ids:
+        db.session.query(model).filter(model.id.in_(delete_ids)).delete(
+            synchronize_session=False
+        )
+    if updates:
+        db.session.execute(update(model), updates)
+    if inserts:
+        db.session.execute(insert(model), inserts)
+
+
 def export_course_assignments_excel():
     classes = ClassInfo.query.order_by(
         ClassInfo.entry_year.desc(), ClassInfo.class_num.asc()
@@ -941,15 +1178,8 @@ def export_course_assignments_excel():
             row[sub.name] = ca_map.get((cls.id, sub.id), "")
         data_list.append(row)
 
-    df = pd.DataFrame(data_list)
     column_order = ["班级名称", "人数", "班主任"] + [s.name for s in subjects]
-    df = df.reindex(columns=column_order)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="任课总表")
-
-    output.seek(0)
+    output = write_xlsx_stream([("任课总表", column_order, data_list)])
     return output, "任课分配表(导入模板_备份).xlsx"
 
 
@@ -1020,12 +1250,7 @@ def export_teachers_excel(academic_year=None):
             }
         )
 
-    df = pd.DataFrame(data_list, columns=columns)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=f"{target_year}学年教师信息")
-
-    output.seek(0)
+    output = write_xlsx_stream([(f"{target_year}学年教师信息", columns, data_list)])
     return output, f"{target_year}学年_教师信息表(备份).xlsx"
 
 
@@ -1079,20 +1304,16 @@ def build_score_import_template(entry_year, class_ids, subject_ids, exam_name=No
             row[sub_name] = score_map.get((s.id, sub_name), "") if exam_name else ""
         data_list.append(row)
 
-    df = pd.DataFrame(data_list)
     cols = ["学号", "姓名", "班级名称"] + subject_names
-    df = df.reindex(columns=cols)
-
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        sheet_name = "成绩备份" if exam_name else "录入模版"
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    output.seek(0)
+    sheet_name = "成绩备份" if exam_name else "录入模版"
+    output = write_xlsx_stream([(sheet_name, cols, data_list)])
 
     return output, f"{entry_year}级_{exam_name or '导入模版'}_成绩数据.xlsx"
 
 
-def process_admin_scores_import(file, entry_year, exam_name, subject_ids, class_ids):
+def process_admin_scores_import(
+    file, entry_year, exam_name, subject_ids, class_ids, progress=None
+):
     if not entry_year or not exam_name or not subject_ids:
         return {"msg": "必要参数缺失(年级/考试/科目)"}, 400
 
@@ -1171,6 +1392,7 @@ def process_admin_scores_import(file, entry_year, exam_name, subject_ids, class_
     pending_score_map = {}
 
     for index, row in df.iterrows():
+        _report_progress(progress, index, len(df))
         row_num = index + 2
         sid = str(row["学号"]).strip()
         name = str(row["姓名"]).strip()
@@ -1266,20 +1488,17 @@ def process_admin_scores_import(file, entry_year, exam_name, subject_ids, class_
         relevant_task_ids = [task_map[n].id for n in valid_subject_cols]
         relevant_stu_ids = list({p["student_id"] for p in pending_score_map.values()})
 
-        existing_scores = Score.query.filter(
-            Score.exam_task_id.in_(relevant_task_ids),
-            Score.student_id.in_(relevant_stu_ids),
-        ).all()
-
-        existing_map = {(es.student_id, es.exam_task_id): es for es in existing_scores}
+        existing_map = prefetch_scores(relevant_task_ids, relevant_stu_ids)
+        insert_rows = []
+        update_rows = []
 
         for item in pending_score_map.values():
             key = (item["student_id"], item["exam_task_id"])
             if key in existing_map:
                 sc = existing_map[key]
-                old_score = float(sc.score) if sc.score is not None else 0.0
+                old_score = float(sc["score"]) if sc["score"] is not None else 0.0
                 new_score = float(item["score"]) if item["score"] is not None else 0.0
-                old_remark = (sc.remark or "").strip()
+                old_remark = (sc["remark"] or "").strip()
                 new_remark = (item["remark"] or "").strip()
 
                 score_changed = abs(old_score - new_score) > 1e-6
@@ -1287,24 +1506,34 @@ def process_admin_scores_import(file, entry_year, exam_name, subject_ids, class_
 
                 if score_changed or remark_changed:
                     if key not in before_scores:
-                        before_scores[key] = _serialize_score(sc)
-                    sc.score = new_score
-                    sc.remark = new_remark
+                        before_scores[key] = {f: sc[f] for f in SCORE_FIELDS}
+                    update_rows.append(
+                        dict(
+                            {f: sc[f] for f in SCORE_FIELDS},
+                            score=new_score,
+                            remark=new_remark,
+                        )
+                    )
                     updated_count += 1
             else:
-                new_sc = Score(
-                    student_id=item["student_id"],
-                    subject_id=item["subject_id"],
-                    exam_task_id=item["exam_task_id"],
-                    score=float(item["score"]) if item["score"] is not None else 0.0,
-                    remark=(item["remark"] or "").strip(),
-                    term=item["term"],
-                    class_id_snapshot=item.get("class_id_snapshot"),
+                insert_rows.append(
+                    {
+                        "student_id": item["student_id"],
+                        "exam_task_id": item["exam_task_id"],
+                        "subject_id": item["subject_id"],
+                        "score": float(item["score"]) if item["score"] is not None else 0.0,
+                        "remark": (item["remark"] or "").strip(),
+                        "term": item["term"],
+                        "class_id_snapshot": item.get("class_id_snapshot"),
+                    }
                 )
-                db.session.add(new_sc)
                 created_score_keys.add(key)
                 added_count += 1
 
+        # 已有成绩只更新分数与备注，保持原有班级快照
+        upsert_scores(update_rows, update_columns=["score", "remark"])
+        upsert_scores(insert_rows)
+
         _create_import_batch(
             import_type="score",
             source_filename=file.filename,
@@ -1328,6 +1557,7 @@ def process_admin_scores_import(file, entry_year, exam_name, subject_ids, class_
                 ],
             },
         )
+        invalidate_exam_results([t.id for t in task_map.values()])
         db.session.commit()
 
         return {
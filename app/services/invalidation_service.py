@@ -0,0 +1,174 @@
+"""成绩/学籍变动后的统一失效入口，所有写路径在提交前调用。"""
+
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import ClassInfo, ExamTask, db
+from app.services.score_service import bump_score_versions
+from app.services.snapshot_service import delete_exam_snapshots
+from app.utils.cache import get_identity_cache, get_stats_result_cache
+
+# session.info 中待失效的结果缓存标签集合；含 _ALL_TAGS 时全部失效
+_PENDING_CACHE_KEY = "pending_stats_cache_tags"
+_ALL_TAGS = "__all__"
+# session.info 中待失效登录身份的账号 id 集合
+_PENDING_IDENTITY_KEY = "pending_identity_user_ids"
+_ALL_USERS = "__all__"
+
+
+def _exam_tag(entry_year, exam_name):
+    return ("exam", int(entry_year), str(exam_name))
+
+
+def _roster_tag(entry_year):
+    return ("roster", int(entry_year))
+
+
+def exam_result_cache_tags(entry_year, exam_name):
+    """
+    单次考试结果缓存的标签：该考试成绩变动，或该年级学生名单变动时失效。
+    不带年级整数标签，其他考试的成绩变动不会波及。
+    """
+    return (_exam_tag(entry_year, exam_name), _roster_tag(entry_year))
+
+
+def _invalidate_result_cache(tags=None):
+    """
+    立即失效缓存，并登记到当前事务，提交后再失效一次，避免并发读回填旧结果。
+    tags 为 None 时全部失效；整数标签为年级，对应按年级缓存的统计结果。
+    """
+    _apply_cache_invalidation(tags)
+
+    pending = db.session.info.setdefault(_PENDING_CACHE_KEY, set())
+    if tags is None:
+        pending.add(_ALL_TAGS)
+    else:
+        pending.update(tags)
+
+
+def _apply_cache_invalidation(tags=None):
+    if not has_app_context():
+        return
+    cache = get_stats_result_cache()
+    if cache is None:
+        return
+    if tags is None:
+        cache.clear()
+    else:
+        cache.invalidate_tags(tags)
+
+
+def _apply_identity_invalidation(user_ids=None):
+    if not has_app_context():
+        return
+    cache = get_identity_cache()
+    if cache is None:
+        return
+    if user_ids is None:
+        cache.clear()
+    else:
+        cache.invalidate_tags(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_pending_cache_invalidation(session):
+    pending = session.info.pop(_PENDING_CACHE_KEY, None)
+    if pending:
+        if _ALL_TAGS in pending:
+            _apply_cache_invalidation()
+        else:
+            _apply_cache_invalidation(pending)
+
+    pending_users = session.info.pop(_PENDING_IDENTITY_KEY, None)
+    if pending_users:
+        if _ALL_USERS in pending_users:
+            _apply_identity_invalidation()
+        else:
+            _apply_identity_invalidation(pending_users)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_cache_invalidation(session):
+    session.info.pop(_PENDING_CACHE_KEY, None)
+    session.info.pop(_PENDING_IDENTITY_KEY, None)
+
+
+def invalidate_user_identity(user_ids=None):
+    """
+    账号密码、角色、审核状态或教师档案发生变化：失效对应的登录身份缓存，
+    user_ids 为 None 时全部失效。立即失效一次，提交后再失效一次。
+    """
+    if user_ids is not None:
+        user_ids = {int(uid) for uid in user_ids if uid is not None}
+        if not user_ids:
+            return
+
+    _apply_identity_invalidation(user_ids)
+
+    pending = db.session.info.setdefault(_PENDING_IDENTITY_KEY, set())
+    if user_ids is None:
+        pending.add(_ALL_USERS)
+    else:
+        pending.update(user_ids)
+
+
+def invalidate_exam_results(task_ids, extra_exam_keys=()):
+    """
+    考试任务的成绩或任务本身发生变化：递增成绩版本号，
+    并失效对应 年级+考试名 的物化结果。
+    extra_exam_keys 为额外需要失效的 (年级, 考试名)，如任务改名前的旧考试名。
+    """
+    task_ids = [tid for tid in set(task_ids or []) if tid is not None]
+    if not task_ids:
+        return
+
+    bump_score_versions(task_ids)
+
+    exam_keys = {
+        (row.entry_year, row.name)
+        for row in db.session.query(ExamTask.entry_year, ExamTask.name)
+        .filter(ExamTask.id.in_(task_ids))
+        .distinct()
+    }
+    exam_keys.update(extra_exam_keys)
+    if exam_keys:
+        delete_exam_snapshots(exam_keys=list(exam_keys))
+
+        tags = set()
+        for entry_year, exam_name in exam_keys:
+            tags.add(int(entry_year))
+            tags.add(_exam_tag(entry_year, exam_name))
+        _invalidate_result_cache(tags)
+
+
+def invalidate_grade_results(entry_years=None):
+    """学生名单/班级归属发生变化：失效相关年级的物化结果，entry_years 为 None 时全部失效。"""
+    if entry_years is None:
+        delete_exam_snapshots()
+        _invalidate_result_cache()
+        return
+
+    delete_exam_snapshots(entry_years=entry_years)
+
+    tags = set()
+    for year in entry_years:
+        if year is not None:
+            tags.add(int(year))
+            tags.add(_roster_tag(year))
+    _invalidate_result_cache(tags)
+
+
+def invalidate_class_results(class_ids):
+    """按班级定位年级后失效（学生增删、转班、状态变化）。"""
+    class_ids = [cid for cid in set(class_ids or []) if cid is not None]
+    if not class_ids:
+        return
+
+    entry_years = (
+        db.session.query(ClassInfo.entry_year)
+        .filter(ClassInfo.id.in_(class_ids))
+        .distinct()
+        .all()
+    )
+    invalidate_grade_results([row.entry_year for row in entry_years])
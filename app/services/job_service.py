@@ -0,0 +1,165 @@
+import io
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+from app.models import BackgroundJob, db
+from app.utils.helpers import _json_dumps, _json_loads
+
+JOB_STATUS_LABELS = {
+    "pending": "排队中",
+    "running": "执行中",
+    "success": "已完成",
+    "failed": "失败",
+}
+
+
+class JobRunner:
+    """
+    进程内后台任务执行器：线程池执行任务，运行中的进度保存在内存。
+    导入在单个事务内写库，SQLite 写锁期间无法另开连接更新任务表，
+    因此进度不落库，只在开始和结束时写回 background_jobs。
+    """
+
+    def __init__(self, max_workers=1):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(int(max_workers), 1), thread_name_prefix="bg-job"
+        )
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    def set_progress(self, job_id, processed, total):
+        with self._lock:
+            self._progress[job_id] = (int(processed), int(total))
+
+    def get_progress(self, job_id):
+        with self._lock:
+            return self._progress.get(job_id)
+
+    def pop_progress(self, job_id):
+        with self._lock:
+            return self._progress.pop(job_id, None)
+
+
+def get_job_runner():
+    return current_app.extensions["job_runner"]
+
+
+def detach_upload(file):
+    """把上传文件读入内存，请求结束后后台线程仍可读取。"""
+    return FileStorage(stream=io.BytesIO(file.read()), filename=file.filename)
+
+
+def submit_job(job_type, func, source_filename="", created_by=None, **kwargs):
+    """
+    登记任务并提交到线程池，立即返回任务记录。
+    func 需返回 (结果 dict, HTTP 状态码)，并接受 progress(processed, total) 回调。
+    """
+    job = BackgroundJob(
+        job_type=job_type,
+        status="pending",
+        source_filename=(source_filename or "")[:255],
+        created_by=created_by,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    runner = get_job_runner()
+    runner.set_progress(job.id, 0, 0)
+    runner.executor.submit(_run_job, app, job.id, func, kwargs)
+    return job
+
+
+def _run_job(app, job_id, func, kwargs):
+    with app.app_context():
+        runner = get_job_runner()
+        _update_job(job_id, status="running", start_time=datetime.now())
+
+        def progress(processed, total):
+            runner.set_progress(job_id, processed, total)
+
+        try:
+            result, http_status = func(progress=progress, **kwargs)
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            result, http_status = {"msg": f"任务执行异常: {str(e)}"}, 500
+
+        processed, total = runner.pop_progress(job_id) or (0, 0)
+        succeeded = http_status < 400
+        try:
+            _update_job(
+                job_id,
+                status="success" if succeeded else "failed",
+                processed_rows=total if succeeded else processed,
+                total_rows=total,
+                result_json=_json_dumps(result),
+                http_status=http_status,
+                finish_time=datetime.now(),
+            )
+        except Exception as e:
+            db.session.rollback()
+            print(f">> [后台任务] 任务 {job_id} 结果写回失败: {e}")
+
+
+def _update_job(job_id, **fields):
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        return
+    for key, value in fields.items():
+        setattr(job, key, value)
+    db.session.commit()
+
+
+def fail_interrupted_jobs():
+    """服务重启后，上次未结束的任务已随进程中断（事务已回滚），统一标记为失败。"""
+    interrupted = BackgroundJob.query.filter(
+        BackgroundJob.status.in_(["pending", "running"])
+    ).all()
+    if not interrupted:
+        return
+
+    for job in interrupted:
+        job.status = "failed"
+        job.http_status = 500
+        job.result_json = _json_dumps({"msg": "服务已重启，任务被中断，请重新导入"})
+        job.finish_time = datetime.now()
+    db.session.commit()
+    print(f">> [后台任务] 已将 {len(interrupted)} 个中断的任务标记为失败")
+
+
+def serialize_job(job):
+    live = None
+    if job.status in ("pending", "running"):
+        live = get_job_runner().get_progress(job.id)
+    processed, total = live or (job.processed_rows, job.total_rows)
+
+    finished = job.status in ("success", "failed")
+    if job.status == "success":
+        percent = 100
+    else:
+        percent = round(processed / total * 100, 1) if total else 0
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "status_label": JOB_STATUS_LABELS.get(job.status, job.status),
+        "source_filename": job.source_filename,
+        "processed_rows": processed,
+        "total_rows": total,
+        "percent": percent,
+        "result": _json_loads(job.result_json, {}) if finished else None,
+        "http_status": job.http_status,
+        "create_time": _format_time(job.create_time),
+        "start_time": _format_time(job.start_time),
+        "finish_time": _format_time(job.finish_time),
+    }
+
+
+def _format_time(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
@@ -1,6 +1,6 @@
-from sqlalchemy import distinct, func
+from sqlalchemy import case, distinct, func, or_, tuple_
 
-from app.models import ClassInfo, CourseAssignment, Score, Student, db
+from app.models import ClassInfo, CourseAssignment, ExamTask, Score, Student, db
 
 
 def build_class_name(entry_year, class_num):
@@ -16,6 +16,58 @@ def get_active_student_ids(class_id):
     return [row.id for row in rows]
 
 
+def count_active_students_by_class(class_ids):
+    """各班在读学生人数，返回 {class_id: count}（无学生的班级不出现）。"""
+    class_ids = list(set(class_ids))
+    if not class_ids:
+        return {}
+
+    rows = (
+        db.session.query(Student.class_id, func.count(Student.id))
+        .filter(Student.class_id.in_(class_ids), Student.status == "在读")
+        .group_by(Student.class_id)
+        .all()
+    )
+    return {class_id: count for class_id, count in rows}
+
+
+def calc_task_class_score_counts(task_ids, class_ids, pass_ratio=0.6):
+    """
+    一次聚合统计各 (考试任务, 班级) 的在读学生已录入人数与异常人数
+    （缺考或低于 满分×pass_ratio），返回 {(task_id, class_id): (recorded, abnormal)}。
+    """
+    task_ids = list(set(task_ids))
+    class_ids = list(set(class_ids))
+    if not task_ids or not class_ids:
+        return {}
+
+    is_abnormal = or_(
+        Score.remark == "缺考",
+        Score.score < ExamTask.full_score * pass_ratio,
+    )
+    rows = (
+        db.session.query(
+            Score.exam_task_id,
+            Student.class_id,
+            func.count(distinct(Score.student_id)),
+            func.count(distinct(case((is_abnormal, Score.student_id)))),
+        )
+        .join(Student, Student.id == Score.student_id)
+        .join(ExamTask, ExamTask.id == Score.exam_task_id)
+        .filter(
+            Score.exam_task_id.in_(task_ids),
+            Student.class_id.in_(class_ids),
+            Student.status == "在读",
+        )
+        .group_by(Score.exam_task_id, Student.class_id)
+        .all()
+    )
+    return {
+        (task_id, class_id): (recorded, abnormal)
+        for task_id, class_id, recorded, abnormal in rows
+    }
+
+
 def calc_class_record_progress(exam_task_id, class_id):
     student_ids = get_active_student_ids(class_id)
     total_students = len(student_ids)
@@ -49,49 +101,7 @@ def calc_class_record_progress(exam_task_id, class_id):
     }
 
 
-def calc_exam_task_progress(task):
-    class_rows = (
-        db.session.query(ClassInfo.id, ClassInfo.entry_year, ClassInfo.class_num)
-        .join(CourseAssignment, CourseAssignment.class_id == ClassInfo.id)
-        .filter(
-            CourseAssignment.subject_id == task.subject_id,
-            CourseAssignment.academic_year == task.academic_year,
-            ClassInfo.entry_year == task.entry_year,
-        )
-        .distinct()
-        .all()
-    )
-
-    class_ids = [row.id for row in class_rows]
-    student_count_map = {}
-    recorded_count_map = {}
-
-    if class_ids:
-        # 每个班在读学生总数（一次聚合）
-        student_rows = (
-            db.session.query(Student.class_id, func.count(Student.id))
-            .filter(Student.class_id.in_(class_ids), Student.status == "在读")
-            .group_by(Student.class_id)
-            .all()
-        )
-        student_count_map = {class_id: count for class_id, count in student_rows}
-
-        # 每个班已录入人数（按考试任务，一次聚合）
-        recorded_rows = (
-            db.session.query(Student.class_id, func.count(distinct(Score.student_id)))
-            .join(Student, Student.id == Score.student_id)
-            .filter(
-                Score.exam_task_id == task.id,
-                Student.class_id.in_(class_ids),
-                Student.status == "在读",
-            )
-            .group_by(Student.class_id)
-            .all()
-        )
-        recorded_count_map = {
-            class_id: count for class_id, count in recorded_rows
-        }
-
+def _summarize_task_progress(class_rows, student_count_map, recorded_count_map):
     total_classes = len(class_rows)
     completed_classes = 0
     class_details = []
@@ -130,3 +140,86 @@ def calc_exam_task_progress(task):
         "is_fully_completed": total_classes > 0 and completed_classes == total_classes,
         "class_details": class_details,
     }
+
+
+def calc_exam_tasks_progress(tasks):
+    """
+    批量计算多个考试任务的录入进度，返回 {task_id: progress}。
+    无论任务数量多少，固定为三次分组查询（任课班级、班级人数、已录入人数）。
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return {}
+
+    # 1) 各 (科目, 学年, 年级) 组合对应的任课班级
+    scope_keys = {(t.subject_id, t.academic_year, t.entry_year) for t in tasks}
+    class_rows_by_scope = {key: [] for key in scope_keys}
+    assign_rows = (
+        db.session.query(
+            CourseAssignment.subject_id,
+            CourseAssignment.academic_year,
+            ClassInfo.id,
+            ClassInfo.entry_year,
+            ClassInfo.class_num,
+        )
+        .join(CourseAssignment, CourseAssignment.class_id == ClassInfo.id)
+        .filter(
+            tuple_(
+                CourseAssignment.subject_id,
+                CourseAssignment.academic_year,
+                ClassInfo.entry_year,
+            ).in_(list(scope_keys))
+        )
+        .distinct()
+        .all()
+    )
+    for row in assign_rows:
+        class_rows_by_scope[(row.subject_id, row.academic_year, row.entry_year)].append(
+            row
+        )
+
+    class_ids = list({row.id for row in assign_rows})
+    student_count_map = {}
+    recorded_count_map = {}
+
+    if class_ids:
+        # 2) 每个班在读学生总数
+        student_rows = (
+            db.session.query(Student.class_id, func.count(Student.id))
+            .filter(Student.class_id.in_(class_ids), Student.status == "在读")
+            .group_by(Student.class_id)
+            .all()
+        )
+        student_count_map = {class_id: count for class_id, count in student_rows}
+
+        # 3) 每个 (考试任务, 班级) 已录入人数
+        recorded_rows = (
+            db.session.query(
+                Score.exam_task_id,
+                Student.class_id,
+                func.count(distinct(Score.student_id)),
+            )
+            .join(Student, Student.id == Score.student_id)
+            .filter(
+                Score.exam_task_id.in_([t.id for t in tasks]),
+                Student.class_id.in_(class_ids),
+                Student.status == "在读",
+            )
+            .group_by(Score.exam_task_id, Student.class_id)
+            .all()
+        )
+        for task_id, class_id, count in recorded_rows:
+            recorded_count_map.setdefault(task_id, {})[class_id] = count
+
+    return {
+        t.id: _summarize_task_progress(
+            class_rows_by_scope[(t.subject_id, t.academic_year, t.entry_year)],
+            student_count_map,
+            recorded_count_map.get(t.id, {}),
+        )
+        for t in tasks
+    }
+
+
+def calc_exam_task_progress(task):
+    return calc_exam_tasks_progress([task])[task.id]
@@ -0,0 +1,207 @@
+import numpy as np
+
+
+def _sorted_skip_ranks(sorted_totals, group_start):
+    """
+    在已排好序的序列上计算“总分并列”名次（1,1,3 式）。
+    group_start 为每个位置所在分组的起始下标；分组起点强制视为新名次。
+    """
+    count = len(sorted_totals)
+    positions = np.arange(count)
+
+    is_new_rank = np.ones(count, dtype=bool)
+    if count > 1:
+        is_new_rank[1:] = sorted_totals[1:] < sorted_totals[:-1]
+    is_new_rank |= positions == group_start
+
+    last_new_pos = np.maximum.accumulate(np.where(is_new_rank, positions, 0))
+    return last_new_pos - group_start + 1
+
+
+def rank_students(totals, tie_break_columns, group_codes):
+    """
+    向量化排名：按总分降序，再按 tie_break_columns 依次降序打破并列，
+    仍并列时保持输入顺序（与 Python 稳定排序一致）。
+
+    返回与输入下标对齐的数组：
+    - order: 年级内排序后的输入下标
+    - grade_rank_dense / grade_rank_skip: 年级“规则严格”/“总分并列”名次
+    - class_rank_dense / class_rank_skip: 按 group_codes 分组后的同类名次
+    """
+    totals = np.asarray(totals, dtype=float)
+    group_codes = np.asarray(group_codes)
+    count = len(totals)
+
+    empty = np.zeros(0, dtype=int)
+    if count == 0:
+        return {
+            "order": empty,
+            "grade_rank_dense": empty,
+            "grade_rank_skip": empty,
+            "class_rank_dense": empty,
+            "class_rank_skip": empty,
+        }
+
+    positions = np.arange(count)
+
+    # lexsort 以最后一个键为主键且升序，故对数值取负实现降序，输入下标兜底保证稳定。
+    sort_keys = [positions]
+    for column in reversed(list(tie_break_columns)):
+        sort_keys.append(-np.asarray(column, dtype=float))
+    sort_keys.append(-totals)
+    order = np.lexsort(sort_keys)
+
+    grade_rank_dense = np.empty(count, dtype=int)
+    grade_rank_dense[order] = positions + 1
+
+    grade_rank_skip = np.empty(count, dtype=int)
+    grade_rank_skip[order] = _sorted_skip_ranks(
+        totals[order], np.zeros(count, dtype=int)
+    )
+
+    # 按班级稳定分组后，组内顺序即年级顺序的子序列。
+    class_order = order[np.argsort(group_codes[order], kind="stable")]
+    sorted_groups = group_codes[class_order]
+    is_group_start = np.ones(count, dtype=bool)
+    if count > 1:
+        is_group_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    group_start = np.maximum.accumulate(np.where(is_group_start, positions, 0))
+
+    class_rank_dense = np.empty(count, dtype=int)
+    class_rank_dense[class_order] = positions - group_start + 1
+
+    class_rank_skip = np.empty(count, dtype=int)
+    class_rank_skip[class_order] = _sorted_skip_ranks(
+        totals[class_order], group_start
+    )
+
+    return {
+        "order": order,
+        "grade_rank_dense": grade_rank_dense,
+        "grade_rank_skip": grade_rank_skip,
+        "class_rank_dense": class_rank_dense,
+        "class_rank_skip": class_rank_skip,
+    }
+
+
+def _pivot_scores(
+    count, row_students, row_subjects, row_scores, row_absent, subject_count
+):
+    """成绩行透视为 学生×科目 矩阵；states 中 0 为无成绩、1 为缺考、2 为有分数。"""
+    row_students = np.asarray(row_students, dtype=int)
+    row_subjects = np.asarray(row_subjects, dtype=int)
+    row_absent = np.asarray(row_absent, dtype=bool)
+    values = np.where(row_absent, 0.0, np.asarray(row_scores, dtype=float))
+
+    scores = np.zeros((count, subject_count))
+    scores[row_students, row_subjects] = values
+    states = np.zeros((count, subject_count), dtype=np.int8)
+    states[row_students, row_subjects] = np.where(row_absent, 1, 2)
+    return row_students, row_subjects, row_absent, values, scores, states
+
+
+def _subject_columns(scores, subject_cols):
+    """按列下标取科目分数列，-1 表示本次考试没有该科目（按 0 分计）。"""
+    zeros = np.zeros(len(scores))
+    return [scores[:, col] if col >= 0 else zeros for col in subject_cols]
+
+
+def rank_comprehensive_rows(
+    count,
+    row_students,
+    row_subjects,
+    row_scores,
+    row_absent,
+    subject_count,
+    tie_break_subjects,
+    group_codes,
+):
+    """
+    年级综合排名：由成绩行构建总分与科目矩阵后排名。参数与返回值均为紧凑数组，
+    可直接交给子进程执行。
+
+    - row_students / row_subjects: 每行成绩对应的学生下标、科目列下标
+    - row_absent: 是否缺考（缺考按 0 分计入总分）
+    - tie_break_subjects: 打破并列的科目列下标，按优先级排列
+
+    总分按成绩行的输入顺序逐个累加。返回 rank_students 的结果，另含
+    totals、has_numeric（是否有非缺考成绩）、scores 与 states 矩阵。
+    """
+    row_students, _, row_absent, values, scores, states = _pivot_scores(
+        count, row_students, row_subjects, row_scores, row_absent, subject_count
+    )
+
+    totals = np.zeros(count)
+    np.add.at(totals, row_students, values)
+    has_numeric = np.zeros(count, dtype=bool)
+    has_numeric[row_students[~row_absent]] = True
+
+    ranks = rank_students(
+        totals, _subject_columns(scores, tie_break_subjects), group_codes
+    )
+    ranks.update(totals=totals, has_numeric=has_numeric, scores=scores, states=states)
+    return ranks
+
+
+def rank_trend_exam_rows(
+    count,
+    row_students,
+    row_subjects,
+    row_tasks,
+    row_scores,
+    row_absent,
+    row_class_snapshots,
+    subject_count,
+    tie_break_subjects,
+    student_keys,
+    class_codes,
+):
+    """
+    成绩趋势中单次考试的排名，参数与返回值均为紧凑数组，可直接交给子进程执行。
+
+    - 总分按科目列顺序累加，无成绩与缺考按 0 分计
+    - 排名分组取该次考试中考试任务 id 最小的非空班级快照，没有快照时用 class_codes
+    - 并列时依次比较 tie_break_subjects 各科，再按 student_keys 升序
+
+    返回 rank_students 的结果，另含 scores 矩阵、display_rows（每生各科展示值：
+    保留 1 位小数的分数 / "缺考" / "-"）与 display_totals。
+    """
+    row_students, row_subjects, _, values, scores, states = _pivot_scores(
+        count, row_students, row_subjects, row_scores, row_absent, subject_count
+    )
+
+    # 每个学生的成绩按科目列顺序累加，与逐科求和的浮点结果一致
+    sum_order = np.lexsort((row_subjects, row_students))
+    totals = np.zeros(count)
+    np.add.at(totals, row_students[sum_order], values[sum_order])
+
+    group_codes = np.array(class_codes, dtype=int)
+    row_class_snapshots = np.asarray(row_class_snapshots, dtype=int)
+    has_snapshot = row_class_snapshots > 0
+    if has_snapshot.any():
+        snap_students = row_students[has_snapshot]
+        snap_order = np.lexsort((np.asarray(row_tasks)[has_snapshot], snap_students))
+        first_students, first_pos = np.unique(
+            snap_students[snap_order], return_index=True
+        )
+        snapshots = row_class_snapshots[has_snapshot][snap_order]
+        group_codes[first_students] = snapshots[first_pos]
+
+    tie_columns = _subject_columns(scores, tie_break_subjects)
+    tie_columns.append(-np.asarray(student_keys, dtype=float))
+    ranks = rank_students(totals, tie_columns, group_codes)
+
+    display_rows = [
+        [
+            round(value, 1) if state == 2 else ("缺考" if state == 1 else "-")
+            for value, state in zip(score_row, state_row)
+        ]
+        for score_row, state_row in zip(scores.tolist(), states.tolist())
+    ]
+    ranks.update(
+        totals=totals,
+        scores=scores,
+        display_rows=display_rows,
+        display_totals=[round(total, 1) for total in totals.tolist()],
+    )
+    return ranks
@@ -1,8 +1,13 @@
+from datetime import datetime
+
+from sqlalchemy import insert, tuple_, update
+
 from app.models import (
     ClassInfo,
     CourseAssignment,
     GradeLeaderAssignment,
     HeadTeacherAssignment,
+    ImportBatch,
     PrepGroupLeaderAssignment,
     Score,
     Student,
@@ -11,6 +16,90 @@ from app.models import (
     User,
     db,
 )
+from app.services.invalidation_service import (
+    invalidate_exam_results,
+    invalidate_grade_results,
+    invalidate_user_identity,
+)
+from app.services.score_service import SCORE_FIELDS
+from app.utils.helpers import _json_loads, _unpack_rows
+
+IMPORT_TYPE_LABELS = {
+    "student": "学生名单",
+    "teacher": "教师信息",
+    "course_assign": "任课分配",
+    "score": "成绩",
+}
+
+# 成绩回退按 (student_id, exam_task_id) 元组分批查询，每个元组占 2 个绑定参数，
+# 单批控制在 SQLite 旧版默认 999 个变量上限以内
+_SCORE_KEY_CHUNK_SIZE = 450
+_SCORE_ID_CHUNK_SIZE = 900
+# 回退条数达到该值时在控制台输出进度
+_SCORE_ROLLBACK_LOG_ROWS = 5000
+
+
+def check_batch_rollback(batch):
+    """批次不可回退时返回 (提示, HTTP 状态码)，可回退返回 None。"""
+    if not batch.can_rollback:
+        return "该批次已回退，不能重复回退", 400
+
+    newer_batch = (
+        ImportBatch.query.filter(
+            ImportBatch.import_type == batch.import_type,
+            ImportBatch.id > batch.id,
+            ImportBatch.can_rollback.is_(True),
+        )
+        .order_by(ImportBatch.id.asc())
+        .first()
+    )
+    if newer_batch:
+        return f"请先回退更新的同类批次（ID: {newer_batch.id}），再回退当前记录。", 400
+    return None
+
+
+def rollback_import_batch(batch_id, progress=None):
+    """
+    回退一个导入批次并提交事务，返回 (结果 dict, HTTP 状态码)。
+    可在请求内同步调用，也可作为后台任务执行（progress 仅成绩回退使用）。
+    """
+    batch = db.session.get(ImportBatch, batch_id)
+    if not batch:
+        return {"msg": "导入记录不存在"}, 404
+
+    # 后台任务排队期间可能已被其他请求回退，执行前再校验一次
+    blocked = check_batch_rollback(batch)
+    if blocked:
+        msg, status = blocked
+        return {"msg": msg}, status
+
+    snapshot = _json_loads(batch.snapshot_json, {})
+    scope = _json_loads(batch.scope_json, {})
+
+    try:
+        if batch.import_type == "student":
+            rollback_students(snapshot)
+        elif batch.import_type == "teacher":
+            rollback_teacher(snapshot, scope)
+        elif batch.import_type == "course_assign":
+            rollback_course_assign(snapshot, scope)
+        elif batch.import_type == "score":
+            rollback_score(snapshot, progress=progress)
+        else:
+            return {"msg": "不支持的导入类型，无法回退"}, 400
+
+        batch.can_rollback = False
+        batch.rolled_back_at = datetime.now()
+        batch.rollback_note = "手动回退完成"
+        db.session.commit()
+        label = IMPORT_TYPE_LABELS.get(batch.import_type, batch.import_type)
+        return {"msg": f"回退成功：{label}"}, 200
+    except ValueError as e:
+        db.session.rollback()
+        return {"msg": str(e)}, 400
+    except Exception as e:
+        db.session.rollback()
+        return {"msg": f"回退失败: {str(e)}"}, 500
 
 
 def rollback_students(snapshot):
@@ -67,17 +156,63 @@ def rollback_students(snapshot):
             continue
         db.session.delete(cls)
 
+    invalidate_grade_results()
+
 
 def rollback_teacher(snapshot, scope):
     academic_year = scope.get("academic_year")
     if not academic_year:
         raise ValueError("教师导入记录缺少学年信息，无法回退。")
 
+    created_usernames = snapshot.get("created_usernames", [])
+    created_teacher_user_ids = snapshot.get("created_teacher_user_ids", [])
+
+    if "leader_assignment_changes" in snapshot:
+        # 增量快照：只撤销本批次插入/删除的分工，只还原实际改动过的账号与档案字段
+        leader_changes = snapshot.get("leader_assignment_changes", {})
+        for kind, model in (
+            ("grade", GradeLeaderAssignment),
+            ("subject", SubjectGroupLeaderAssignment),
+            ("prep", PrepGroupLeaderAssignment),
+        ):
+            change = leader_changes.get(kind) or {}
+            inserted_ids = change.get("inserted_ids", [])
+            if inserted_ids:
+                db.session.query(model).filter(
+                    model.id.in_(inserted_ids), model.academic_year == academic_year
+                ).delete(synchronize_session=False)
+            deleted = _unpack_rows(change.get("deleted"))
+            if deleted:
+                db.session.execute(
+                    insert(model),
+                    [dict(item, academic_year=academic_year) for item in deleted],
+                )
+
+        user_changes = _unpack_rows(snapshot.get("user_changes"))
+        if user_changes:
+            db.session.execute(update(User), user_changes)
+        teacher_changes = _unpack_rows(snapshot.get("teacher_changes"))
+        if teacher_changes:
+            db.session.execute(update(Teacher), teacher_changes)
+
+        _delete_created_teachers(created_teacher_user_ids, created_usernames)
+
+        touched_user_ids = {item["id"] for item in user_changes}
+        if teacher_changes:
+            touched_user_ids.update(
+                uid
+                for (uid,) in db.session.query(Teacher.user_id).filter(
+                    Teacher.id.in_([item["id"] for item in teacher_changes])
+                )
+            )
+        touched_user_ids.update(created_teacher_user_ids)
+        invalidate_user_identity(touched_user_ids)
+        return
+
+    # 旧版快照：整学年分工删除后重建，账号与档案按完整记录还原
     before_assignments = snapshot.get("before_assignments", {})
     before_users = snapshot.get("before_users", [])
     before_teachers = snapshot.get("before_teachers", [])
-    created_usernames = snapshot.get("created_usernames", [])
-    created_teacher_user_ids = snapshot.get("created_teacher_user_ids", [])
 
     db.session.query(GradeLeaderAssignment).filter_by(academic_year=academic_year).delete()
     db.session.query(SubjectGroupLeaderAssignment).filter_by(
@@ -147,8 +282,23 @@ def rollback_teacher(snapshot, scope):
         teacher.major = item.get("major")
         teacher.remarks = item.get("remarks")
 
+    _delete_created_teachers(
+        created_teacher_user_ids,
+        created_usernames,
+        skip_user_ids=before_teacher_user_ids,
+        skip_usernames=before_usernames,
+    )
+
+    # 账号状态、密码与教师档案均可能被还原或删除
+    invalidate_user_identity()
+
+
+def _delete_created_teachers(
+    created_teacher_user_ids, created_usernames, skip_user_ids=(), skip_usernames=()
+):
+    """删除本批次新建的教师档案与账号；已被后续分配引用的拒绝删除。"""
     for user_id in created_teacher_user_ids:
-        if user_id in before_teacher_user_ids:
+        if user_id in skip_user_ids:
             continue
         teacher = Teacher.query.filter_by(user_id=user_id).first()
         if not teacher:
@@ -166,7 +316,7 @@ def rollback_teacher(snapshot, scope):
         db.session.delete(teacher)
 
     for username in created_usernames:
-        if username in before_usernames:
+        if username in skip_usernames:
             continue
         user = User.query.filter_by(username=username).first()
         if not user:
@@ -176,11 +326,76 @@ def rollback_teacher(snapshot, scope):
         db.session.delete(user)
 
 
+def _rollback_assignment_changes(model, academic_year, changes, key_columns):
+    """
+    按变更记录把分配恢复到导入前：只处理本批次改动过的键。
+    changes 为 [{键列..., before_teacher_id, after_teacher_id}]，before 为 None 表示导入时新增。
+    """
+    if not changes:
+        return
+
+    key_attrs = [getattr(model, col) for col in key_columns]
+    class_ids = {item["class_id"] for item in changes}
+    current = {
+        tuple(getattr(row, col) for col in key_columns): row.id
+        for row in db.session.query(model.id, *key_attrs).filter(
+            model.academic_year == academic_year, model.class_id.in_(class_ids)
+        )
+    }
+
+    delete_ids = []
+    updates = []
+    inserts = []
+    for item in changes:
+        key = tuple(item[col] for col in key_columns)
+        row_id = current.get(key)
+        before = item.get("before_teacher_id")
+        if before is None:
+            if row_id is not None:
+                delete_ids.append(row_id)
+        elif row_id is not None:
+            updates.append({"id": row_id, "teacher_id": before})
+        else:
+            inserts.append(
+                {
+                    **{col: item[col] for col in key_columns},
+                    "teacher_id": before,
+                    "academic_year": academic_year,
+                }
+            )
+
+    if delete_ids:
+        db.session.query(model).filter(model.id.in_(delete_ids)).delete(
+            synchronize_session=False
+        )
+    if updates:
+        db.session.execute(update(model), updates)
+    if inserts:
+        db.session.execute(insert(model), inserts)
+
+
 def rollback_course_assign(snapshot, scope):
     academic_year = scope.get("academic_year")
     if not academic_year:
         raise ValueError("任课导入记录缺少学年信息，无法回退。")
 
+    if "course_assignment_changes" in snapshot:
+        # 增量快照：只恢复本批次改动过的分配
+        _rollback_assignment_changes(
+            CourseAssignment,
+            academic_year,
+            _unpack_rows(snapshot.get("course_assignment_changes")),
+            ("class_id", "subject_id"),
+        )
+        _rollback_assignment_changes(
+            HeadTeacherAssignment,
+            academic_year,
+            _unpack_rows(snapshot.get("head_teacher_assignment_changes")),
+            ("class_id",),
+        )
+        return
+
+    # 旧版快照：整学年删除后按快照重建
     db.session.query(CourseAssignment).filter_by(academic_year=academic_year).delete()
     db.session.query(HeadTeacherAssignment).filter_by(academic_year=academic_year).delete()
 
@@ -203,32 +418,81 @@ def rollback_course_assign(snapshot, scope):
         )
 
 
-def rollback_score(snapshot):
+def rollback_score(snapshot, progress=None):
+    """
+    成绩回退按集合处理：受影响的 (学生, 考试任务) 分批一次查出现有成绩，
+    本批次新增的按 id 批量删除，被覆盖的仅在值不同时批量改回原值，缺失的批量插入。
+    progress(processed, total) 按批回报进度（后台任务轮询用）；条数较多时同时在控制台输出。
+    """
     before_scores = snapshot.get("before_scores", [])
     created_scores = snapshot.get("created_scores", [])
 
-    for key in created_scores:
-        sid = key.get("student_id")
-        tid = key.get("exam_task_id")
-        if sid is None or tid is None:
-            continue
-        rows = Score.query.filter_by(student_id=sid, exam_task_id=tid).all()
-        for row in rows:
-            db.session.delete(row)
-
+    restore_rows = {}
     for item in before_scores:
         sid = item.get("student_id")
         tid = item.get("exam_task_id")
         if sid is None or tid is None:
             continue
-        row = Score.query.filter_by(student_id=sid, exam_task_id=tid).first()
-        if not row:
-            row = Score(student_id=sid, exam_task_id=tid)
-            db.session.add(row)
+        restore_rows[(sid, tid)] = {
+            "student_id": sid,
+            "exam_task_id": tid,
+            "subject_id": item.get("subject_id"),
+            "score": item.get("score", 0.0),
+            "remark": item.get("remark", ""),
+            "term": item.get("term"),
+            "class_id_snapshot": item.get("class_id_snapshot"),
+        }
+    # 同一键既在新增又在原值中时以原值为准，改回原值即可
+    created_keys = {
+        (key.get("student_id"), key.get("exam_task_id"))
+        for key in created_scores
+        if key.get("student_id") is not None and key.get("exam_task_id") is not None
+    }
+    created_keys.difference_update(restore_rows)
+
+    keys = list(created_keys) + list(restore_rows)
+    total = len(keys)
+    verbose = total >= _SCORE_ROLLBACK_LOG_ROWS
+    logged = 0
+
+    def report(processed):
+        nonlocal logged
+        if progress is not None:
+            progress(processed, total)
+        # 控制台约每 10% 输出一次
+        if verbose and (processed - logged >= total // 10 or processed == total):
+            logged = processed
+            print(f">> [成绩回退] 已处理 {processed}/{total} 条")
+
+    delete_ids = []
+    updates = []
+    now = datetime.now()
+    for start in range(0, total, _SCORE_KEY_CHUNK_SIZE):
+        chunk = keys[start : start + _SCORE_KEY_CHUNK_SIZE]
+        rows = db.session.query(
+            Score.id, *[getattr(Score, f) for f in SCORE_FIELDS]
+        ).filter(tuple_(Score.student_id, Score.exam_task_id).in_(chunk))
+        for row in rows:
+            key = (row.student_id, row.exam_task_id)
+            restore = restore_rows.get(key)
+            if restore is None:
+                delete_ids.append(row.id)
+                continue
+            restore["id"] = row.id
+            if any(getattr(row, f) != restore[f] for f in SCORE_FIELDS):
+                updates.append(dict(restore, update_time=now))
+        report(start + len(chunk))
 
-        row.subject_id = item.get("subject_id")
-        row.score = item.get("score", 0.0)
-        row.remark = item.get("remark", "")
-        row.term = item.get("term")
-        row.class_id_snapshot = item.get("class_id_snapshot")
+    inserts = [row for row in restore_rows.values() if "id" not in row]
+    for start in range(0, len(delete_ids), _SCORE_ID_CHUNK_SIZE):
+        db.session.query(Score).filter(
+            Score.id.in_(delete_ids[start : start + _SCORE_ID_CHUNK_SIZE])
+        ).delete(synchronize_session=False)
+    if updates:
+        db.session.execute(update(Score), updates)
+    if inserts:
+        db.session.execute(insert(Score), inserts)
 
+    invalidate_exam_results(
+        [tid for _, tid in created_keys] + [tid for _, tid in restore_rows]
+    )
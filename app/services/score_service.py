@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import ExamTask, Score, db
+
+# 成绩行的业务字段（不含主键与时间戳）
+SCORE_FIELDS = (
+    "student_id",
+    "exam_task_id",
+    "subject_id",
+    "score",
+    "remark",
+    "term",
+    "class_id_snapshot",
+)
+SCORE_KEY_FIELDS = ("student_id", "exam_task_id")
+
+# 单条 INSERT 的行数上限，避免超出 SQLite 绑定参数数量限制
+UPSERT_CHUNK_SIZE = 500
+
+
+def prefetch_scores(exam_task_ids, student_ids):
+    """
+    一次性读取 (学生, 考试任务) 组合的现有成绩，返回 {(student_id, exam_task_id): dict}。
+    只查询列值，不加载 ORM 对象。
+    """
+    exam_task_ids = list({tid for tid in exam_task_ids if tid is not None})
+    student_ids = list({sid for sid in student_ids if sid is not None})
+    if not exam_task_ids or not student_ids:
+        return {}
+
+    rows = (
+        db.session.query(Score.id, *[getattr(Score, f) for f in SCORE_FIELDS])
+        .filter(
+            Score.exam_task_id.in_(exam_task_ids),
+            Score.student_id.in_(student_ids),
+        )
+        .all()
+    )
+    return {
+        (row.student_id, row.exam_task_id): {
+            "id": row.id,
+            **{f: getattr(row, f) for f in SCORE_FIELDS},
+        }
+        for row in rows
+    }
+
+
+def upsert_scores(rows, update_columns=None):
+    """
+    以 (student_id, exam_task_id) 唯一索引为冲突键批量写入成绩：
+    不存在则插入，已存在则仅在值发生变化时更新 update_columns。
+    update_columns 为 None 时更新行中除冲突键以外的全部字段。
+    返回写入（插入或实际更新）的 [(id, student_id, exam_task_id), ...]。
+
+    SQLite 的 RETURNING 只能拿到写入后的新值，审计所需的旧值由调用方
+    通过 prefetch_scores 一次性预取。
+    """
+    rows = [row for row in rows if row]
+    if not rows:
+        return []
+
+    if update_columns is None:
+        update_columns = [c for c in rows[0].keys() if c not in SCORE_KEY_FIELDS]
+    update_columns = [c for c in update_columns if c not in SCORE_KEY_FIELDS]
+
+    # 先落盘会话中尚未提交的 ORM 变更（如回退时的删除），保证执行顺序
+    db.session.flush()
+
+    table = Score.__table__
+    written = []
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+        stmt = sqlite_insert(table).values(chunk)
+
+        changed = None
+        for col in update_columns:
+            cond = table.c[col].is_distinct_from(stmt.excluded[col])
+            changed = cond if changed is None else (changed | cond)
+
+        conflict_target = [table.c.student_id, table.c.exam_task_id]
+        if update_columns:
+            set_ = {col: stmt.excluded[col] for col in update_columns}
+            set_["update_time"] = datetime.now()
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_target, set_=set_, where=changed
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_target)
+        stmt = stmt.returning(table.c.id, table.c.student_id, table.c.exam_task_id)
+
+        written.extend(tuple(r) for r in db.session.execute(stmt).all())
+    return written
+
+
+def bump_score_versions(task_ids):
+    """考试任务的成绩版本号递增（随调用方事务提交）。"""
+    task_ids = list({tid for tid in task_ids if tid is not None})
+    if not task_ids:
+        return
+    ExamTask.query.filter(ExamTask.id.in_(task_ids)).update(
+        {ExamTask.score_version: ExamTask.score_version + 1},
+        synchronize_session="evaluate",
+    )
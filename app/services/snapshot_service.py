@@ -0,0 +1,107 @@
+from sqlalchemy import tuple_
+
+from app.models import ExamResultSnapshot, Student, db
+from app.utils.helpers import _json_dumps, _json_loads
+
+
+def make_subject_key(subject_ids):
+    """科目组合的规范化键：去重、转整数、升序拼接。非法输入返回 None。"""
+    try:
+        normalized = sorted({int(sid) for sid in subject_ids})
+    except (TypeError, ValueError):
+        return None
+    if not normalized:
+        return None
+    return ",".join(str(sid) for sid in normalized)
+
+
+def load_exam_snapshot(entry_year, exam_name, subject_key):
+    """
+    读取物化的综合成绩结果，按年级名次排序返回，结构与实时排名结果一致。
+    不存在快照时返回 None。
+    """
+    rows = (
+        db.session.query(ExamResultSnapshot, Student)
+        .join(Student, ExamResultSnapshot.student_id == Student.id)
+        .filter(
+            ExamResultSnapshot.entry_year == entry_year,
+            ExamResultSnapshot.exam_name == exam_name,
+            ExamResultSnapshot.subject_key == subject_key,
+        )
+        .order_by(ExamResultSnapshot.grade_rank_dense.asc())
+        .all()
+    )
+    if not rows:
+        return None
+
+    result_list = []
+    for snap, stu in rows:
+        score_map = _json_loads(snap.scores_json, {})
+        has_numeric = any(val != "缺考" for val in score_map.values())
+        result_list.append(
+            {
+                "obj": stu,
+                "score_map": score_map,
+                "total": snap.total if has_numeric else 0,
+                "grade_rank_dense": snap.grade_rank_dense,
+                "grade_rank_skip": snap.grade_rank_skip,
+                "class_rank_dense": snap.class_rank_dense,
+                "class_rank_skip": snap.class_rank_skip,
+            }
+        )
+    return result_list
+
+
+def save_exam_snapshot(entry_year, exam_name, subject_key, result_list):
+    """用最新的排名结果整体替换对应快照（调用方负责提交事务）。"""
+    delete_exam_snapshots(exam_keys=[(entry_year, exam_name)], subject_key=subject_key)
+
+    mappings = [
+        {
+            "entry_year": entry_year,
+            "exam_name": exam_name,
+            "subject_key": subject_key,
+            "student_id": item["obj"].id,
+            "class_id": item["obj"].class_id,
+            "total": float(item["total"]),
+            "scores_json": _json_dumps(item["score_map"]),
+            "grade_rank_skip": item["grade_rank_skip"],
+            "grade_rank_dense": item["grade_rank_dense"],
+            "class_rank_skip": item.get("class_rank_skip"),
+            "class_rank_dense": item.get("class_rank_dense"),
+        }
+        for item in result_list
+    ]
+    if mappings:
+        db.session.bulk_insert_mappings(ExamResultSnapshot, mappings)
+
+
+def delete_exam_snapshots(exam_keys=None, entry_years=None, subject_key=None):
+    """
+    删除快照。
+    - exam_keys: [(entry_year, exam_name), ...]
+    - entry_years: 按年级整体删除
+    两者都为 None 时删除全部快照。
+    """
+    query = db.session.query(ExamResultSnapshot)
+
+    if exam_keys is not None:
+        exam_keys = list({(int(y), str(n)) for y, n in exam_keys})
+        if not exam_keys:
+            return
+        query = query.filter(
+            tuple_(ExamResultSnapshot.entry_year, ExamResultSnapshot.exam_name).in_(
+                exam_keys
+            )
+        )
+
+    if entry_years is not None:
+        entry_years = list({int(y) for y in entry_years if y is not None})
+        if not entry_years:
+            return
+        query = query.filter(ExamResultSnapshot.entry_year.in_(entry_years))
+
+    if subject_key is not None:
+        query = query.filter(ExamResultSnapshot.subject_key == subject_key)
+
+    query.delete(synchronize_session=False)
@@ -1,4 +1,9 @@
-from sqlalchemy import func
+from collections import defaultdict
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload
 
 from app.models import (
     ClassInfo,
@@ -7,8 +12,19 @@ from app.models import (
     Score,
     Student,
     Subject,
+    Teacher,
     db,
 )
+from app.services.compute_pool import run_compute_jobs
+from app.services.invalidation_service import exam_result_cache_tags
+from app.services.progress_service import count_active_students_by_class
+from app.services.ranking_service import rank_comprehensive_rows, rank_trend_exam_rows
+from app.services.snapshot_service import (
+    load_exam_snapshot,
+    make_subject_key,
+    save_exam_snapshot,
+)
+from app.utils.cache import get_stats_result_cache
 
 SUBJECT_PRIORITY = [
     "语文",
@@ -61,22 +77,39 @@ def build_class_report(class_id, term):
     if not class_id or not term:
         return {"subjects": [], "report": [], "subject_averages": {}}
 
-    subjects = Subject.query.all()
-    subject_map = {s.id: s.name for s in subjects}
     students = Student.query.filter_by(class_id=class_id).all()
 
+    # 全班该学期成绩连同科目名一次查出，按学生分组；只统计成绩中出现的科目
+    score_rows = (
+        db.session.query(
+            Score.student_id,
+            Score.subject_id,
+            Subject.name.label("subject_name"),
+            Score.score,
+            Score.remark,
+        )
+        .join(Student, Score.student_id == Student.id)
+        .join(Subject, Score.subject_id == Subject.id)
+        .filter(Student.class_id == class_id, Score.term == term)
+        .order_by(Score.student_id, Score.exam_task_id)
+        .all()
+    )
+    scores_by_student = defaultdict(list)
+    subject_map = {}
+    for row in score_rows:
+        scores_by_student[row.student_id].append(row)
+        subject_map[row.subject_id] = row.subject_name
+    subject_names = [subject_map[sid] for sid in sorted(subject_map)]
+
     report_data = []
-    subject_stats = {s.name: {"sum": 0, "count": 0} for s in subjects}
+    subject_stats = {name: {"sum": 0, "count": 0} for name in subject_names}
 
     for stu in students:
-        scores = Score.query.filter_by(student_id=stu.id, term=term).all()
         score_detail = {}
         student_total = 0
 
-        for score in scores:
-            sub_name = subject_map.get(score.subject_id)
-            if not sub_name:
-                continue
+        for score in scores_by_student.get(stu.id, ()):
+            sub_name = score.subject_name
             if score.remark == "缺考":
                 score_detail[sub_name] = "缺考"
                 student_total += 0
@@ -96,19 +129,17 @@ def build_class_report(class_id, term):
             }
         )
 
-    class_subject_averages = {}
-    for sub_name, stats in subject_stats.items():
-        if stats["count"] > 0:
-            class_subject_averages[sub_name] = round(stats["sum"] / stats["count"], 1)
-        else:
-            class_subject_averages[sub_name] = "-"
+    class_subject_averages = {
+        sub_name: round(stats["sum"] / stats["count"], 1)
+        for sub_name, stats in subject_stats.items()
+    }
 
     report_data.sort(key=lambda x: x["total"], reverse=True)
     for index, item in enumerate(report_data):
         item["rank"] = index + 1
 
     return {
-        "subjects": [s.name for s in subjects],
+        "subjects": subject_names,
         "report": report_data,
         "subject_averages": class_subject_averages,
     }
@@ -128,65 +159,29 @@ def get_exam_names_by_entry_year(entry_year):
     return [n[0] for n in names]
 
 
-def build_comprehensive_report(data):
-    entry_year = data.get("entry_year")
-    exam_name = data.get("exam_name")
-    subject_ids = data.get("subject_ids", [])
-    class_ids = data.get("class_ids", [])
-    keyword = str(data.get("keyword", "")).strip()
+def _use_reference_rank_engine():
+    engine = str(current_app.config.get("STATS_RANK_ENGINE", "vectorized"))
+    return engine.strip().lower() == "reference"
 
-    if not entry_year or not exam_name or not subject_ids:
-        return None, ("请选择完整的筛选条件（年级、考试、科目）", 400)
-    paged, page, page_size = _resolve_pagination(data)
 
-    all_classes = ClassInfo.query.filter_by(entry_year=entry_year).all()
-    class_map = {c.id: c.full_name for c in all_classes}
-    all_grade_class_ids = [c.id for c in all_classes]
-
-    tasks = ExamTask.query.filter(
-        ExamTask.entry_year == entry_year,
-        ExamTask.name == exam_name,
-        ExamTask.subject_id.in_(subject_ids),
-    ).all()
-
-    if not tasks:
-        if paged:
-            return {
-                "items": [],
-                "data": [],
-                "total": 0,
-                "page": page,
-                "page_size": page_size,
-                "subjects": [],
-            }, None
-        return {"data": [], "subjects": []}, None
-
-    task_map = {t.id: t.subject_id for t in tasks}
-    task_ids = [t.id for t in tasks]
-    total_full_score = sum([t.full_score for t in tasks])
+def _comprehensive_sort_key(item):
+    sm = item["score_map"]
+    compare_tuple = [item["total"]]
+    for sub in SUBJECT_PRIORITY:
+        val = sm.get(sub, 0)
+        if val == "缺考":
+            val = 0
+        compare_tuple.append(val)
+    return tuple(compare_tuple)
 
-    students = Student.query.filter(Student.class_id.in_(all_grade_class_ids)).all()
-    student_map = {s.id: s for s in students}
-
-    scores = Score.query.filter(
-        Score.exam_task_id.in_(task_ids), Score.student_id.in_(student_map.keys())
-    ).all()
 
+def _rank_comprehensive_reference(students, score_rows, task_map, subject_name_map):
+    """纯 Python 参考实现，保留用于与向量化引擎交叉核对。"""
     stats_data = {}
-
-    subjects = (
-        Subject.query.filter(Subject.id.in_(subject_ids))
-        .order_by(Subject.id.asc())
-        .all()
-    )
-
-    subject_name_map = {s.id: s.name for s in subjects}
-    ordered_subject_names = [s.name for s in subjects]
-
     for stu in students:
         stats_data[stu.id] = {"obj": stu, "score_map": {}, "total": 0}
 
-    for sc in scores:
+    for sc in score_rows:
         sid = sc.student_id
         if sid in stats_data:
             subj_id = task_map.get(sc.exam_task_id)
@@ -200,18 +195,7 @@ def build_comprehensive_report(data):
                     stats_data[sid]["total"] += sc.score
 
     result_list = list(stats_data.values())
-
-    def sort_key(item):
-        sm = item["score_map"]
-        compare_tuple = [item["total"]]
-        for sub in SUBJECT_PRIORITY:
-            val = sm.get(sub, 0)
-            if val == "缺考":
-                val = 0
-            compare_tuple.append(val)
-        return tuple(compare_tuple)
-
-    result_list.sort(key=sort_key, reverse=True)
+    result_list.sort(key=_comprehensive_sort_key, reverse=True)
 
     for i, item in enumerate(result_list):
         item["grade_rank_dense"] = i + 1
@@ -230,7 +214,7 @@ def build_comprehensive_report(data):
         class_groups[cid].append(item)
 
     for _, items in class_groups.items():
-        items.sort(key=sort_key, reverse=True)
+        items.sort(key=_comprehensive_sort_key, reverse=True)
         for i, sub_item in enumerate(items):
             sub_item["class_rank_dense"] = i + 1
             if i > 0 and sub_item["total"] < items[i - 1]["total"]:
@@ -240,6 +224,231 @@ def build_comprehensive_report(data):
             else:
                 sub_item["class_rank_skip"] = items[i - 1]["class_rank_skip"]
 
+    return result_list
+
+
+def _positions(keys, values):
+    """values 各元素在 keys 中的下标（keys 不重复），不存在时为 -1。"""
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    if len(keys) == 0:
+        return np.full(len(values), -1)
+    sorter = np.argsort(keys, kind="stable")
+    pos = np.minimum(np.searchsorted(keys, values, sorter=sorter), len(keys) - 1)
+    idx = sorter[pos]
+    return np.where(keys[idx] == values, idx, -1)
+
+
+def _rank_comprehensive_vectorized(students, score_rows, task_map, subject_name_map):
+    """
+    NumPy 排名引擎：成绩行转为紧凑数组（学生下标、科目列、分数、缺考标记），
+    由 rank_comprehensive_rows 透视为 学生×科目 矩阵并计算年级/班级名次，
+    数据量大时在子进程中执行。返回结构与 _rank_comprehensive_reference 一致。
+    """
+    subject_cols = {}
+    task_cols = {}
+    for task_id, subj_id in task_map.items():
+        subj_name = subject_name_map.get(subj_id)
+        if subj_name:
+            task_cols[task_id] = subject_cols.setdefault(subj_name, len(subject_cols))
+    subject_names = list(subject_cols)
+
+    count = len(students)
+    row_students = np.zeros(0, dtype=int)
+    row_subjects = np.zeros(0, dtype=int)
+    row_scores = np.zeros(0)
+    row_absent = np.zeros(0, dtype=bool)
+
+    if score_rows:
+        sids, tids, raw_scores, remarks = zip(*score_rows)
+        row_students = _positions([stu.id for stu in students], sids)
+        # 末尾追加 -1，不在本次考试科目中的行（下标 -1）取到 -1
+        col_of_task = np.append(np.asarray(list(task_cols.values()), dtype=int), -1)
+        row_subjects = col_of_task[_positions(list(task_cols), tids)]
+        keep = (row_students >= 0) & (row_subjects >= 0)
+        row_students = row_students[keep]
+        row_subjects = row_subjects[keep]
+        row_scores = np.asarray(raw_scores, dtype=float)[keep]
+        row_absent = (np.asarray(remarks, dtype=object) == "缺考")[keep]
+
+    class_codes = np.asarray(
+        [stu.class_id if stu.class_id is not None else -1 for stu in students]
+    )
+    tie_break_subjects = [subject_cols.get(name, -1) for name in SUBJECT_PRIORITY]
+    job = (
+        count,
+        row_students,
+        row_subjects,
+        row_scores,
+        row_absent,
+        len(subject_names),
+        tie_break_subjects,
+        class_codes,
+    )
+    ranks = run_compute_jobs(rank_comprehensive_rows, [job], len(row_students))[0]
+
+    # 无任何有效分数的学生，参考实现中总分保持为整数 0，这里保持一致。
+    totals = ranks["totals"].tolist()
+    has_numeric = ranks["has_numeric"].tolist()
+    scores = ranks["scores"].tolist()
+    states = ranks["states"].tolist()
+    grade_rank_dense = ranks["grade_rank_dense"].tolist()
+    grade_rank_skip = ranks["grade_rank_skip"].tolist()
+    class_rank_dense = ranks["class_rank_dense"].tolist()
+    class_rank_skip = ranks["class_rank_skip"].tolist()
+
+    result_list = []
+    for i in ranks["order"].tolist():
+        result_list.append(
+            {
+                "obj": students[i],
+                "score_map": {
+                    name: "缺考" if state == 1 else value
+                    for name, value, state in zip(subject_names, scores[i], states[i])
+                    if state
+                },
+                "total": totals[i] if has_numeric[i] else 0,
+                "grade_rank_dense": grade_rank_dense[i],
+                "grade_rank_skip": grade_rank_skip[i],
+                "class_rank_dense": class_rank_dense[i],
+                "class_rank_skip": class_rank_skip[i],
+            }
+        )
+    return result_list
+
+
+def _cached_ranked_result(cache_key, entry_year, builder):
+    """
+    排名结果缓存：翻页、关键字筛选直接复用已排好序的完整列表。
+    以年级为标签，成绩/学籍变动时由 invalidation_service 按年级失效。
+    """
+    cache = get_stats_result_cache()
+    if cache is None:
+        return builder()
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # 计算期间若有写事务提交并失效了该年级，结果不回填缓存
+    generation = cache.generation()
+    result = builder()
+    try:
+        tags = (int(entry_year),)
+    except (TypeError, ValueError):
+        tags = ()
+    cache.set(cache_key, result, tags=tags, generation=generation)
+    return result
+
+
+def _compute_comprehensive_ranking(tasks, all_grade_class_ids, subject_name_map):
+    task_map = {t.id: t.subject_id for t in tasks}
+    task_ids = [t.id for t in tasks]
+
+    students = Student.query.filter(Student.class_id.in_(all_grade_class_ids)).all()
+    student_map = {s.id: s for s in students}
+
+    score_rows = (
+        db.session.query(
+            Score.student_id, Score.exam_task_id, Score.score, Score.remark
+        )
+        .filter(
+            Score.exam_task_id.in_(task_ids), Score.student_id.in_(student_map.keys())
+        )
+        .all()
+    )
+
+    if _use_reference_rank_engine():
+        return _rank_comprehensive_reference(
+            students, score_rows, task_map, subject_name_map
+        )
+    return _rank_comprehensive_vectorized(
+        students, score_rows, task_map, subject_name_map
+    )
+
+
+def _get_comprehensive_ranking(
+    entry_year, exam_name, subject_ids, tasks, all_grade_class_ids, subject_name_map
+):
+    """
+    年级综合排名结果。考试任务全部锁定后优先读取物化快照（锁定时由
+    build_exam_snapshot 生成），快照不存在时实时计算；读取路径不回写快照，
+    避免在报表请求中提交事务。
+    """
+    subject_key = make_subject_key(subject_ids)
+    try:
+        entry_year = int(entry_year)
+    except (TypeError, ValueError):
+        subject_key = None
+    exam_locked = subject_key is not None and all(not t.is_active for t in tasks)
+
+    if exam_locked:
+        result_list = load_exam_snapshot(entry_year, exam_name, subject_key)
+        if result_list is not None:
+            return result_list
+
+    return _compute_comprehensive_ranking(tasks, all_grade_class_ids, subject_name_map)
+
+
+def build_exam_snapshot(entry_year, exam_name):
+    """考试锁定时预先物化“全部科目”组合的排名结果（调用方负责提交事务）。"""
+    tasks = ExamTask.query.filter_by(entry_year=entry_year, name=exam_name).all()
+    if not tasks or any(t.is_active for t in tasks):
+        return False
+
+    subject_ids = sorted({t.subject_id for t in tasks})
+    subject_key = make_subject_key(subject_ids)
+    if subject_key is None:
+        return False
+
+    all_grade_class_ids = [
+        c.id for c in ClassInfo.query.filter_by(entry_year=entry_year).all()
+    ]
+    subject_name_map = {
+        s.id: s.name for s in Subject.query.filter(Subject.id.in_(subject_ids)).all()
+    }
+    result_list = _compute_comprehensive_ranking(
+        tasks, all_grade_class_ids, subject_name_map
+    )
+    save_exam_snapshot(entry_year, exam_name, subject_key, result_list)
+    return True
+
+
+def _build_comprehensive_rows(entry_year, exam_name, subject_ids, class_ids):
+    """按排名顺序生成目标班级的全部行（未做关键字筛选与分页），结果可缓存。"""
+    all_classes = ClassInfo.query.filter_by(entry_year=entry_year).all()
+    class_map = {c.id: c.full_name for c in all_classes}
+    all_grade_class_ids = [c.id for c in all_classes]
+
+    tasks = ExamTask.query.filter(
+        ExamTask.entry_year == entry_year,
+        ExamTask.name == exam_name,
+        ExamTask.subject_id.in_(subject_ids),
+    ).all()
+
+    if not tasks:
+        return [], []
+
+    total_full_score = sum([t.full_score for t in tasks])
+
+    subjects = (
+        Subject.query.filter(Subject.id.in_(subject_ids))
+        .order_by(Subject.id.asc())
+        .all()
+    )
+
+    subject_name_map = {s.id: s.name for s in subjects}
+    ordered_subject_names = [s.name for s in subjects]
+
+    result_list = _get_comprehensive_ranking(
+        entry_year,
+        exam_name,
+        subject_ids,
+        tasks,
+        all_grade_class_ids,
+        subject_name_map,
+    )
+
     target_class_ids = set(class_ids) if class_ids else set(all_grade_class_ids)
     final_output = []
 
@@ -262,6 +471,33 @@ def build_comprehensive_report(data):
                 }
             )
 
+    return final_output, ordered_subject_names
+
+
+def build_comprehensive_report(data):
+    entry_year = data.get("entry_year")
+    exam_name = data.get("exam_name")
+    subject_ids = data.get("subject_ids", [])
+    class_ids = data.get("class_ids", [])
+    keyword = str(data.get("keyword", "")).strip()
+
+    if not entry_year or not exam_name or not subject_ids:
+        return None, ("请选择完整的筛选条件（年级、考试、科目）", 400)
+    paged, page, page_size = _resolve_pagination(data)
+
+    cache_key = (
+        "comprehensive_report",
+        str(entry_year),
+        str(exam_name),
+        tuple(sorted({str(sid) for sid in subject_ids})),
+        tuple(sorted({str(cid) for cid in class_ids or []})),
+    )
+    final_output, ordered_subject_names = _cached_ranked_result(
+        cache_key,
+        entry_year,
+        lambda: _build_comprehensive_rows(entry_year, exam_name, subject_ids, class_ids),
+    )
+
     if keyword:
         final_output = [
             item
@@ -339,6 +575,53 @@ def build_score_rank_trend_payload(data):
     if not subject_ids:
         return None, ("请至少选择一个科目", 400)
 
+    cache_key = (
+        "score_rank_trend",
+        entry_year,
+        tuple(exam_names),
+        tuple(subject_ids),
+        tuple(sorted(class_ids)),
+    )
+    base_payload = _cached_ranked_result(
+        cache_key,
+        entry_year,
+        lambda: _build_score_rank_trend_rows(
+            entry_year, exam_names, subject_ids, class_ids
+        ),
+    )
+
+    rows = base_payload["rows"]
+    if keyword:
+        rows = [
+            row
+            for row in rows
+            if keyword in str(row.get("name", ""))
+            or keyword in str(row.get("student_id", ""))
+        ]
+
+    if only_changed:
+        rows = [row for row in rows if row.get("has_change")]
+
+    payload = {
+        "subjects": base_payload["subjects"],
+        "exams": base_payload["exams"],
+        "rows": rows,
+        "warnings": base_payload["warnings"],
+    }
+    if paged:
+        total = len(rows)
+        start = (page - 1) * page_size
+        end = start + page_size
+        payload["rows"] = rows[start:end]
+        payload["total"] = total
+        payload["page"] = page
+        payload["page_size"] = page_size
+
+    return payload, None
+
+
+def _build_score_rank_trend_rows(entry_year, exam_names, subject_ids, class_ids):
+    """计算全部目标学生的成绩变化行（未做关键字/变化筛选与分页），结果可缓存。"""
     grade_classes = (
         ClassInfo.query.filter_by(entry_year=entry_year)
         .order_by(ClassInfo.class_num.asc())
@@ -346,9 +629,7 @@ def build_score_rank_trend_payload(data):
     )
     if not grade_classes:
         payload = {"subjects": [], "exams": [], "rows": [], "warnings": []}
-        if paged:
-            payload.update({"total": 0, "page": page, "page_size": page_size})
-        return payload, None
+        return payload
 
     all_grade_class_ids = [c.id for c in grade_classes]
     class_name_map = {c.id: c.full_name for c in grade_classes}
@@ -366,9 +647,7 @@ def build_score_rank_trend_payload(data):
             "rows": [],
             "warnings": ["筛选班级不属于当前年级，未返回数据。"],
         }
-        if paged:
-            payload.update({"total": 0, "page": page, "page_size": page_size})
-        return payload, None
+        return payload
 
     students = (
         Student.query.filter(
@@ -379,9 +658,7 @@ def build_score_rank_trend_payload(data):
     )
     if not students:
         payload = {"subjects": [], "exams": [], "rows": [], "warnings": []}
-        if paged:
-            payload.update({"total": 0, "page": page, "page_size": page_size})
-        return payload, None
+        return payload
 
     student_ids = [s.id for s in students]
 
@@ -393,9 +670,7 @@ def build_score_rank_trend_payload(data):
 
     if not ordered_subject_ids:
         payload = {"subjects": [], "exams": [], "rows": [], "warnings": []}
-        if paged:
-            payload.update({"total": 0, "page": page, "page_size": page_size})
-        return payload, None
+        return payload
 
     tie_break_subjects = [n for n in SUBJECT_PRIORITY if n in ordered_subject_names]
     tie_break_subjects.extend(
@@ -416,7 +691,7 @@ def build_score_rank_trend_payload(data):
             task_by_exam_subject[key] = task
 
     exams = []
-    task_info_by_id = {}
+    exam_task_maps = {}
     warnings = []
 
     for exam_name in exam_names:
@@ -425,7 +700,6 @@ def build_score_rank_trend_payload(data):
             task = task_by_exam_subject.get((exam_name, sid))
             if task:
                 task_map[sid] = task
-                task_info_by_id[task.id] = (exam_name, sid)
 
         if not task_map:
             warnings.append(
@@ -449,6 +723,7 @@ def build_score_rank_trend_payload(data):
                 "missing_subjects": missing_subjects,
             }
         )
+        exam_task_maps[exam_name] = task_map
 
     if not exams:
         payload = {
@@ -457,101 +732,16 @@ def build_score_rank_trend_payload(data):
             "rows": [],
             "warnings": warnings,
         }
-        if paged:
-            payload.update({"total": 0, "page": page, "page_size": page_size})
-        return payload, None
-
-    all_task_ids = list(task_info_by_id.keys())
-    score_map = {}
-    class_snapshot_map = {}
-
-    if all_task_ids:
-        score_rows = Score.query.filter(
-            Score.exam_task_id.in_(all_task_ids), Score.student_id.in_(student_ids)
-        ).all()
-
-        for sc in score_rows:
-            task_info = task_info_by_id.get(sc.exam_task_id)
-            if not task_info:
-                continue
-            exam_name, subject_id = task_info
-            skey = (sc.student_id, exam_name, subject_id)
-            prev = score_map.get(skey)
-            if not prev or sc.id > prev.id:
-                score_map[skey] = sc
-
-            if sc.class_id_snapshot:
-                ckey = (sc.student_id, exam_name)
-                if ckey not in class_snapshot_map:
-                    class_snapshot_map[ckey] = sc.class_id_snapshot
-
-    exam_student_metrics = {}
-
-    def build_sort_key(item):
-        vals = [item["total_raw"]]
-        for subject_name in tie_break_subjects:
-            vals.append(item["score_numeric"].get(subject_name, 0.0))
-        vals.append(-item["student"].id)
-        return tuple(vals)
-
-    for exam in exams:
-        exam_name = exam["name"]
-        per_exam = {}
-
-        for stu in students:
-            score_display = {}
-            score_numeric = {}
-            total_raw = 0.0
-
-            for sid in ordered_subject_ids:
-                subject_name = subject_name_by_id[sid]
-                sc = score_map.get((stu.id, exam_name, sid))
-
-                if sc:
-                    if (sc.remark or "").strip() == "缺考":
-                        display_val = "缺考"
-                        numeric_val = 0.0
-                    else:
-                        numeric_val = float(sc.score) if sc.score is not None else 0.0
-                        display_val = round(numeric_val, 1)
-                else:
-                    display_val = "-"
-                    numeric_val = 0.0
-
-                score_display[subject_name] = display_val
-                score_numeric[subject_name] = numeric_val
-                total_raw += numeric_val
-
-            rank_class_id = class_snapshot_map.get((stu.id, exam_name)) or stu.class_id
-
-            per_exam[stu.id] = {
-                "student": stu,
-                "rank_class_id": rank_class_id,
-                "score_display": score_display,
-                "score_numeric": score_numeric,
-                "total_raw": total_raw,
-                "total": round(total_raw, 1),
-                "grade_rank": None,
-                "class_rank": None,
-            }
-
-        grade_sorted = sorted(per_exam.values(), key=build_sort_key, reverse=True)
-        for i, item in enumerate(grade_sorted):
-            item["grade_rank"] = i + 1
-
-        class_groups = {}
-        for item in per_exam.values():
-            cid = item["rank_class_id"]
-            if cid not in class_groups:
-                class_groups[cid] = []
-            class_groups[cid].append(item)
-
-        for _, group_items in class_groups.items():
-            group_items.sort(key=build_sort_key, reverse=True)
-            for i, item in enumerate(group_items):
-                item["class_rank"] = i + 1
-
-        exam_student_metrics[exam_name] = per_exam
+        return payload
+
+    exam_student_metrics = _get_trend_exam_metrics(
+        entry_year,
+        students,
+        exam_task_maps,
+        ordered_subject_ids,
+        subject_name_by_id,
+        tie_break_subjects,
+    )
 
     target_students = [s for s in students if s.class_id in target_class_ids]
     target_students.sort(
@@ -636,33 +826,225 @@ def build_score_rank_trend_payload(data):
             }
         )
 
-    if keyword:
-        rows = [
-            row
-            for row in rows
-            if keyword in str(row.get("name", ""))
-            or keyword in str(row.get("student_id", ""))
-        ]
-
-    if only_changed:
-        rows = [row for row in rows if row.get("has_change")]
-
-    payload = {
+    return {
         "subjects": ordered_subject_names,
         "exams": exams,
         "rows": rows,
         "warnings": warnings,
     }
-    if paged:
-        total = len(rows)
-        start = (page - 1) * page_size
-        end = start + page_size
-        payload["rows"] = rows[start:end]
-        payload["total"] = total
-        payload["page"] = page
-        payload["page_size"] = page_size
 
-    return payload, None
+
+def _get_trend_exam_metrics(
+    entry_year,
+    students,
+    exam_task_maps,
+    ordered_subject_ids,
+    subject_name_by_id,
+    tie_break_subjects,
+):
+    """
+    成绩变化比较的单次考试结果（每生成绩、总分、年级/班级名次），按考试分别缓存，
+    缓存键含各科任务的成绩版本号。
+    考试窗口重叠时（如 1-4 次、2-5 次）直接复用已算好的考试，只计算缺失的部分。
+    名次在全年级在读学生中计算，与班级筛选无关，因此缓存键不含班级。
+    """
+    cache = get_stats_result_cache()
+    metrics = {}
+    missing = {}
+
+    for exam_name, task_map in exam_task_maps.items():
+        cache_key = (
+            "score_rank_trend_exam",
+            entry_year,
+            exam_name,
+            tuple(ordered_subject_ids),
+            tuple(sorted((task.id, task.score_version) for task in task_map.values())),
+        )
+        cached = cache.get(cache_key) if cache is not None else None
+        if cached is not None:
+            metrics[exam_name] = cached
+        else:
+            missing[exam_name] = (cache_key, task_map)
+
+    if missing:
+        generation = cache.generation() if cache is not None else None
+        computed = _compute_trend_exam_metrics(
+            students,
+            {exam_name: task_map for exam_name, (_, task_map) in missing.items()},
+            ordered_subject_ids,
+            subject_name_by_id,
+            tie_break_subjects,
+        )
+        for exam_name, (cache_key, _) in missing.items():
+            metrics[exam_name] = computed[exam_name]
+            if cache is not None:
+                cache.set(
+                    cache_key,
+                    computed[exam_name],
+                    tags=exam_result_cache_tags(entry_year, exam_name),
+                    generation=generation,
+                )
+
+    return metrics
+
+
+def _compute_trend_exam_metrics(
+    students, exam_task_maps, ordered_subject_ids, subject_name_by_id, tie_break_subjects
+):
+    """
+    计算若干次考试的每生指标，返回 {考试名: {学生主键: 指标}}。
+    成绩行转为紧凑数组后按考试交给 rank_trend_exam_rows，科目矩阵、总分与排名
+    在其中完成，数据量大时在子进程中执行。
+    """
+    student_ids = [s.id for s in students]
+    subject_names = [subject_name_by_id[sid] for sid in ordered_subject_ids]
+    subject_cols = {sid: j for j, sid in enumerate(ordered_subject_ids)}
+    name_cols = {name: j for j, name in enumerate(subject_names)}
+    tie_break_cols = [name_cols.get(name, -1) for name in tie_break_subjects]
+
+    task_ids = []
+    task_exams = []
+    task_cols = []
+    for exam_pos, task_map in enumerate(exam_task_maps.values()):
+        for sid, task in task_map.items():
+            task_ids.append(task.id)
+            task_exams.append(exam_pos)
+            task_cols.append(subject_cols[sid])
+
+    score_rows = (
+        db.session.query(
+            Score.student_id,
+            Score.exam_task_id,
+            Score.score,
+            Score.remark,
+            Score.class_id_snapshot,
+        )
+        .filter(
+            Score.exam_task_id.in_(task_ids),
+            Score.student_id.in_(student_ids),
+        )
+        .order_by(Score.exam_task_id, Score.student_id)
+        .all()
+    )
+
+    count = len(students)
+    student_keys = np.asarray(student_ids, dtype=float)
+    class_codes = np.asarray(
+        [stu.class_id if stu.class_id is not None else -1 for stu in students]
+    )
+
+    if score_rows:
+        sids, tids, raw_scores, remarks, snapshots = zip(*score_rows)
+        row_students = _positions(student_ids, sids)
+        row_tasks = np.asarray(tids)
+        task_pos = _positions(task_ids, row_tasks)
+        row_exams = np.asarray(task_exams)[task_pos]
+        row_subjects = np.asarray(task_cols)[task_pos]
+        row_scores = np.asarray(
+            [score if score is not None else 0.0 for score in raw_scores], dtype=float
+        )
+        row_absent = np.asarray([(r or "").strip() == "缺考" for r in remarks])
+        row_snapshots = np.asarray([c or 0 for c in snapshots])
+    else:
+        row_students = row_tasks = row_exams = row_subjects = np.zeros(0, dtype=int)
+        row_snapshots = np.zeros(0, dtype=int)
+        row_scores = np.zeros(0)
+        row_absent = np.zeros(0, dtype=bool)
+
+    rank_jobs = []
+    for exam_pos in range(len(exam_task_maps)):
+        in_exam = row_exams == exam_pos
+        rank_jobs.append(
+            (
+                count,
+                row_students[in_exam],
+                row_subjects[in_exam],
+                row_tasks[in_exam],
+                row_scores[in_exam],
+                row_absent[in_exam],
+                row_snapshots[in_exam],
+                len(subject_names),
+                tie_break_cols,
+                student_keys,
+                class_codes,
+            )
+        )
+
+    # 各次考试一次性提交，数据量大时在子进程中计算
+    metrics = {}
+    results = run_compute_jobs(rank_trend_exam_rows, rank_jobs, len(score_rows))
+    for exam_name, ranks in zip(exam_task_maps, results):
+        totals = ranks["totals"].tolist()
+        scores = ranks["scores"].tolist()
+        display_rows = ranks["display_rows"]
+        display_totals = ranks["display_totals"]
+        grade_ranks = ranks["grade_rank_dense"].tolist()
+        class_ranks = ranks["class_rank_dense"].tolist()
+
+        metrics[exam_name] = {
+            stu_id: {
+                "score_display": dict(zip(subject_names, display_rows[i])),
+                "score_numeric": dict(zip(subject_names, scores[i])),
+                "total_raw": totals[i],
+                "total": display_totals[i],
+                "grade_rank": grade_ranks[i],
+                "class_rank": class_ranks[i],
+            }
+            for i, stu_id in enumerate(student_ids)
+        }
+
+    return metrics
+
+
+def _aggregate_class_score_stats(entry_year, task_ids, exc_line, pass_line, low_line):
+    """
+    一条 SQL 完成班级成绩统计：CTE 先按学生汇总所选科目的总分（缺考不计），
+    再按班级用条件聚合得到人数、总分、最值与各分数线人数，返回按班号排序的行。
+    至少有一科非缺考成绩的学生计为参考人数。
+    """
+    # 外连接后没有成绩的学生整行为 NULL，需排除
+    not_absent = Score.id.isnot(None) & (func.coalesce(Score.remark, "") != "缺考")
+    student_totals = (
+        db.session.query(
+            Student.id.label("student_id"),
+            Student.class_id.label("class_id"),
+            func.sum(case((not_absent, Score.score))).label("total"),
+            func.count(case((not_absent, 1))).label("valid_subjects"),
+        )
+        .join(ClassInfo, Student.class_id == ClassInfo.id)
+        .outerjoin(
+            Score,
+            (Score.student_id == Student.id) & Score.exam_task_id.in_(task_ids),
+        )
+        .filter(ClassInfo.entry_year == entry_year, Student.status == "在读")
+        .group_by(Student.id)
+        .cte("student_totals")
+    )
+
+    attended = student_totals.c.valid_subjects > 0
+    total = student_totals.c.total
+
+    def count_if(cond):
+        return func.count(case((cond, 1)))
+
+    return (
+        db.session.query(
+            ClassInfo,
+            func.count(student_totals.c.student_id).label("total_people"),
+            count_if(attended).label("exam_people"),
+            func.sum(case((attended, total))).label("sum_score"),
+            func.max(case((attended, total))).label("max_score"),
+            func.min(case((attended, total))).label("min_score"),
+            count_if(attended & (total >= exc_line)).label("excellent_count"),
+            count_if(attended & (total >= pass_line)).label("pass_count"),
+            count_if(attended & (total <= low_line)).label("low_count"),
+        )
+        .outerjoin(student_totals, student_totals.c.class_id == ClassInfo.id)
+        .filter(ClassInfo.entry_year == entry_year)
+        .group_by(ClassInfo.id)
+        .order_by(ClassInfo.class_num)
+        .all()
+    )
 
 
 def build_class_score_stats(data):
@@ -677,11 +1059,15 @@ def build_class_score_stats(data):
     if not entry_year or not exam_name or not subject_ids:
         return None, ("请选择完整的筛选条件", 400)
 
-    tasks = ExamTask.query.filter(
-        ExamTask.entry_year == entry_year,
-        ExamTask.name == exam_name,
-        ExamTask.subject_id.in_(subject_ids),
-    ).all()
+    tasks = (
+        ExamTask.query.options(joinedload(ExamTask.subject))
+        .filter(
+            ExamTask.entry_year == entry_year,
+            ExamTask.name == exam_name,
+            ExamTask.subject_id.in_(subject_ids),
+        )
+        .all()
+    )
 
     if not tasks:
         return [], None
@@ -691,61 +1077,33 @@ def build_class_score_stats(data):
     subject_names = sorted(list(set([t.subject.name for t in tasks])))
     subjects_display = "、".join(subject_names)
 
-    classes = (
-        ClassInfo.query.filter_by(entry_year=entry_year)
-        .order_by(ClassInfo.class_num)
-        .all()
+    class_rows = _aggregate_class_score_stats(
+        entry_year,
+        task_ids,
+        exc_line=full_score_sum * th_exc,
+        pass_line=full_score_sum * th_pass,
+        low_line=full_score_sum * th_low,
     )
-    class_ids = [c.id for c in classes]
-
-    students = Student.query.filter(
-        Student.class_id.in_(class_ids), Student.status == "在读"
-    ).all()
-    student_class_map = {s.id: s.class_id for s in students}
-
-    scores = Score.query.filter(
-        Score.exam_task_id.in_(task_ids), Score.student_id.in_([s.id for s in students])
-    ).all()
-
-    student_stats = {s.id: {"total": 0, "valid_subjects": 0} for s in students}
-    for sc in scores:
-        sid = sc.student_id
-        if sid in student_stats:
-            if sc.remark != "缺考":
-                student_stats[sid]["total"] += sc.score
-                student_stats[sid]["valid_subjects"] += 1
-
-    grade_total_score = 0
-    grade_exam_count = 0
-    valid_student_data = []
-    for sid, stat in student_stats.items():
-        if stat["valid_subjects"] > 0:
-            grade_total_score += stat["total"]
-            grade_exam_count += 1
-            valid_student_data.append(
-                {"class_id": student_class_map[sid], "total": stat["total"]}
-            )
 
+    grade_total_score = sum(row.sum_score or 0 for row in class_rows)
+    grade_exam_count = sum(row.exam_people for row in class_rows)
     grade_avg = grade_total_score / grade_exam_count if grade_exam_count > 0 else 0
 
     result = []
-    for cls in classes:
-        cls_student_ids = [s.id for s in cls.students if s.status == "在读"]
-        total_people = len(cls_student_ids)
-
-        cls_valid_data = [d for d in valid_student_data if d["class_id"] == cls.id]
-        cls_exam_scores = [d["total"] for d in cls_valid_data]
-        exam_people = len(cls_exam_scores)
+    for row in class_rows:
+        cls = row.ClassInfo
+        total_people = row.total_people
+        exam_people = row.exam_people
 
-        cls_sum = sum(cls_exam_scores)
+        cls_sum = row.sum_score or 0
         cls_avg = cls_sum / exam_people if exam_people > 0 else 0
-        cls_max = max(cls_exam_scores) if exam_people > 0 else 0
-        cls_min = min(cls_exam_scores) if exam_people > 0 else 0
+        cls_max = row.max_score if exam_people > 0 else 0
+        cls_min = row.min_score if exam_people > 0 else 0
 
-        cnt_exc = sum(1 for s in cls_exam_scores if s >= full_score_sum * th_exc)
-        cnt_pass = sum(1 for s in cls_exam_scores if s >= full_score_sum * th_pass)
-        cnt_low = sum(1 for s in cls_exam_scores if s <= full_score_sum * th_low)
-        cnt_fail = sum(1 for s in cls_exam_scores if s < full_score_sum * th_pass)
+        cnt_exc = row.excellent_count
+        cnt_pass = row.pass_count
+        cnt_low = row.low_count
+        cnt_fail = exam_people - cnt_pass
 
         ratio = (cls_avg / grade_avg * 100) if grade_avg > 0 else 0
 
@@ -778,6 +1136,32 @@ def build_class_score_stats(data):
     return result, None
 
 
+def _load_task_class_scores(task_ids, grade_class_ids):
+    """
+    一次读取各考试任务下在读学生的有效成绩（缺考不计），按 (考试任务, 班级) 分组，
+    返回 {(task_id, class_id): [score, ...]}，组内按学生 id 排序。
+    """
+    if not task_ids or not grade_class_ids:
+        return {}
+
+    rows = (
+        db.session.query(Score.exam_task_id, Student.class_id, Score.score)
+        .join(Student, Score.student_id == Student.id)
+        .filter(
+            Score.exam_task_id.in_(task_ids),
+            Student.class_id.in_(grade_class_ids),
+            Student.status == "在读",
+            func.coalesce(Score.remark, "") != "缺考",
+        )
+        .order_by(Student.class_id, Student.id)
+        .all()
+    )
+    grouped = defaultdict(list)
+    for task_id, class_id, score in rows:
+        grouped[(task_id, class_id)].append(score)
+    return grouped
+
+
 def build_teacher_score_stats(data):
     entry_year = data.get("entry_year")
     academic_year = data.get("academic_year")
@@ -790,73 +1174,73 @@ def build_teacher_score_stats(data):
     if not entry_year or not academic_year or not exam_name:
         return None, ("请选择完整的筛选条件", 400)
 
-    all_subjects = Subject.query.order_by(Subject.id).all()
-    final_result = []
-
     classes = ClassInfo.query.filter_by(entry_year=entry_year).all()
     class_map = {c.id: c for c in classes}
     if not classes:
         return [], None
 
     grade_class_ids = [c.id for c in classes]
+    final_result = []
 
-    for sub in all_subjects:
-        task = ExamTask.query.filter_by(
-            entry_year=entry_year,
-            academic_year=academic_year,
-            subject_id=sub.id,
-            name=exam_name,
-        ).first()
-
-        if not task:
-            continue
-
-        full_score = task.full_score
-        assignments = (
-            db.session.query(CourseAssignment)
-            .join(ClassInfo)
-            .filter(
-                CourseAssignment.subject_id == sub.id,
-                CourseAssignment.academic_year == academic_year,
-                ClassInfo.entry_year == entry_year,
-            )
-            .all()
+    # 各科考试任务、任课安排、人数与成绩汇总均一次查出，不再逐科目查询
+    task_by_subject = {}
+    for task in (
+        ExamTask.query.filter_by(
+            entry_year=entry_year, academic_year=academic_year, name=exam_name
         )
+        .order_by(ExamTask.id)
+        .all()
+    ):
+        task_by_subject.setdefault(task.subject_id, task)
 
-        teacher_map = {}
-        for assign in assignments:
-            tid = assign.teacher_id
-            if tid not in teacher_map:
-                teacher_map[tid] = {
-                    "teacher": assign.teacher,
-                    "class_ids": [],
-                    "class_names": [],
-                }
-            teacher_map[tid]["class_ids"].append(assign.class_id)
-            c_obj = class_map.get(assign.class_id)
-            if c_obj:
-                teacher_map[tid]["class_names"].append(f"({c_obj.class_num})班")
+    if not task_by_subject:
+        return [], None
 
-        all_scores = Score.query.filter(Score.exam_task_id == task.id).all()
-        students = Student.query.filter(
-            Student.class_id.in_(grade_class_ids), Student.status == "在读"
-        ).all()
-        student_cls_map = {s.id: s.class_id for s in students}
+    subjects = (
+        Subject.query.filter(Subject.id.in_(task_by_subject.keys()))
+        .order_by(Subject.id)
+        .all()
+    )
 
-        valid_scores_map = {}
-        for sc in all_scores:
-            if sc.student_id in student_cls_map and sc.remark != "缺考":
-                valid_scores_map[sc.student_id] = sc.score
+    assignments_by_subject = defaultdict(list)
+    assignment_rows = (
+        db.session.query(
+            CourseAssignment.subject_id,
+            CourseAssignment.teacher_id,
+            CourseAssignment.class_id,
+            Teacher.name.label("teacher_name"),
+        )
+        .join(ClassInfo, CourseAssignment.class_id == ClassInfo.id)
+        .join(Teacher, CourseAssignment.teacher_id == Teacher.id)
+        .filter(
+            CourseAssignment.subject_id.in_(task_by_subject.keys()),
+            CourseAssignment.academic_year == academic_year,
+            ClassInfo.entry_year == entry_year,
+        )
+        .order_by(CourseAssignment.id)
+        .all()
+    )
+    for row in assignment_rows:
+        assignments_by_subject[row.subject_id].append(row)
 
-        grade_total_students = len(students)
-        grade_exam_scores = []
-        for sid in student_cls_map:
-            if sid in valid_scores_map:
-                grade_exam_scores.append(valid_scores_map[sid])
+    class_people = count_active_students_by_class(grade_class_ids)
+    grade_total_students = sum(class_people.values())
+    class_scores = _load_task_class_scores(
+        [t.id for t in task_by_subject.values()], grade_class_ids
+    )
 
-        grade_exam_count = len(grade_exam_scores)
-        grade_sum = sum(grade_exam_scores)
-        grade_avg = grade_sum / grade_exam_count if grade_exam_count > 0 else 0
+    def collect_scores(task_id, class_ids):
+        # 按班级、学生 id 顺序拼接。原逐科目查询的学生列表未指定排序，实际按
+        # idx_students_class_status 覆盖索引返回（班级升序、组内学生 id 升序），
+        # 此处显式采用同一顺序，浮点求和结果与原先一致
+        scores = []
+        for class_id in sorted(class_ids):
+            scores.extend(class_scores.get((task_id, class_id), ()))
+        return scores
+
+    for sub in subjects:
+        task = task_by_subject[sub.id]
+        full_score = task.full_score
 
         def calc_stats(score_list):
             count = len(score_list)
@@ -875,16 +1259,30 @@ def build_teacher_score_stats(data):
                 round(avg, 2),
             )
 
+        teacher_map = {}
+        for assign in assignments_by_subject.get(sub.id, []):
+            tid = assign.teacher_id
+            if tid not in teacher_map:
+                teacher_map[tid] = {
+                    "teacher_name": assign.teacher_name,
+                    "class_ids": [],
+                    "class_names": [],
+                }
+            teacher_map[tid]["class_ids"].append(assign.class_id)
+            c_obj = class_map.get(assign.class_id)
+            if c_obj:
+                teacher_map[tid]["class_names"].append(f"({c_obj.class_num})班")
+
+        grade_exam_scores = collect_scores(task.id, grade_class_ids)
+        grade_exam_count = len(grade_exam_scores)
+        grade_sum = sum(grade_exam_scores)
+        grade_avg = grade_sum / grade_exam_count if grade_exam_count > 0 else 0
+
         teacher_rows = []
         for _, t_data in teacher_map.items():
             t_class_ids = set(t_data["class_ids"])
-            t_stu_ids = [
-                sid for sid, cid in student_cls_map.items() if cid in t_class_ids
-            ]
-            t_total_people = len(t_stu_ids)
-            t_scores = [
-                valid_scores_map[sid] for sid in t_stu_ids if sid in valid_scores_map
-            ]
+            t_total_people = sum(class_people.get(cid, 0) for cid in t_class_ids)
+            t_scores = collect_scores(task.id, t_class_ids)
             t_exam_people = len(t_scores)
 
             exc_n, exc_r, pass_n, pass_r, t_avg = calc_stats(t_scores)
@@ -893,7 +1291,7 @@ def build_teacher_score_stats(data):
 
             teacher_rows.append(
                 {
-                    "name": t_data["teacher"].name,
+                    "name": t_data["teacher_name"],
                     "academic_year": f"{academic_year}学年",
                     "subject": sub.name,
                     "exam_name": exam_name,
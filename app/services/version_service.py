@@ -0,0 +1,13 @@
+from app.models import DataVersion, db
+
+
+def get_data_versions(table_names):
+    """按顺序返回各表的数据版本号，一次查询完成。"""
+    table_names = list(table_names)
+    rows = (
+        db.session.query(DataVersion.table_name, DataVersion.version)
+        .filter(DataVersion.table_name.in_(table_names))
+        .all()
+    )
+    versions = {row.table_name: row.version for row in rows}
+    return tuple(versions.get(name, 0) for name in table_names)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class TTLLRUCache:
+    """
+    进程内结果缓存：条目超过 ttl 秒自动过期，超过 maxsize 时淘汰最久未使用的条目。
+    每个条目可附带标签（如年级），便于按标签批量失效。线程安全，适配 Waitress 多线程。
+
+    失效计数：每次失效递增 _version，并记录各标签最近一次失效时的计数。
+    调用方在计算前取 generation()，写入时带上；计算期间对应标签已被失效
+    （如并发写事务提交）则放弃写入，避免把提交前的旧结果缓存一个 TTL。
+    """
+
+    def __init__(self, maxsize=64, ttl=300):
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = max(float(ttl), 0.0)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_skips = 0
+        self._version = 0
+        self._cleared_version = 0
+        self._tag_versions = {}
+
+    def generation(self):
+        """当前失效计数，作为 set(generation=...) 的参数。"""
+        with self._lock:
+            return self._version
+
+    def get(self, key):
+        """命中返回缓存值，未命中或已过期返回 None。"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tags=(), generation=None):
+        """generation 为计算前取得的失效计数；之后相关标签被失效过则不写入。"""
+        if self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and self._is_stale(tags, generation):
+                self.stale_skips += 1
+                return
+            self._data[key] = (expires_at, frozenset(tags), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def _is_stale(self, tags, generation):
+        if self._cleared_version > generation:
+            return True
+        return any(self._tag_versions.get(tag, 0) > generation for tag in tags)
+
+    def invalidate_tags(self, tags):
+        """删除带有任一指定标签的条目，返回删除数量。"""
+        tags = set(tags)
+        if not tags:
+            return 0
+        with self._lock:
+            self._version += 1
+            for tag in tags:
+                self._tag_versions[tag] = self._version
+            stale_keys = [k for k, (_, t, _) in self._data.items() if t & tags]
+            for key in stale_keys:
+                del self._data[key]
+            self.invalidations += len(stale_keys)
+            return len(stale_keys)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._cleared_version = self._version
+            self._tag_versions.clear()
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_skips": self.stale_skips,
+            }
+
+
+def get_stats_result_cache():
+    """当前应用的统计结果缓存，未初始化时返回 None。"""
+    return current_app.extensions.get("stats_result_cache")
+
+
+def get_identity_cache():
+    """当前应用的登录身份缓存，未初始化时返回 None。"""
+    return current_app.extensions.get("identity_cache")
@@ -1,5 +1,9 @@
+import hashlib
 import json
 import re
+import time
+
+from flask import make_response, request
 
 from app.models import ImportBatch, db
 
@@ -17,32 +21,6 @@ def _json_loads(raw, default):
         return default
 
 
-def _serialize_user(user):
-    return {
-        "username": user.username,
-        "real_name": user.real_name,
-        "role": user.role,
-        "is_approved": bool(user.is_approved),
-        "must_change_password": bool(user.must_change_password),
-        "password_hash": user.password_hash,
-    }
-
-
-def _serialize_teacher(teacher):
-    return {
-        "user_id": teacher.user_id,
-        "name": teacher.name,
-        "gender": teacher.gender,
-        "ethnicity": teacher.ethnicity,
-        "phone": teacher.phone,
-        "status": teacher.status,
-        "job_title": teacher.job_title,
-        "education": teacher.education,
-        "major": teacher.major,
-        "remarks": teacher.remarks,
-    }
-
-
 def _apply_teacher_status_to_account(user, status):
     if not user:
         return
@@ -107,6 +85,18 @@ def _to_excel_value(value):
     return value
 
 
+def _pack_rows(columns, rows):
+    """按列名 + 行数组的紧凑格式保存快照行，避免每行重复字段名。"""
+    return {"columns": list(columns), "rows": [list(row) for row in rows]}
+
+
+def _unpack_rows(packed):
+    if not packed:
+        return []
+    columns = packed.get("columns", [])
+    return [dict(zip(columns, row)) for row in packed.get("rows", [])]
+
+
 def _create_import_batch(import_type, source_filename, scope, summary, snapshot):
     batch = ImportBatch(
         import_type=import_type,
@@ -119,3 +109,47 @@ def _create_import_batch(import_type, source_filename, scope, summary, snapshot)
     db.session.add(batch)
     return batch
 
+
+class _PhaseTimer:
+    """按阶段记录耗时（毫秒），用于 Server-Timing 响应头与控制台输出。"""
+
+    def __init__(self):
+        self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self._last) * 1000))
+        self._last = now
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.phases)
+
+    def total(self):
+        return sum(ms for _, ms in self.phases)
+
+    def summary(self):
+        parts = " ".join(f"{name}={ms:.1f}ms" for name, ms in self.phases)
+        return f"{parts} total={self.total():.1f}ms"
+
+
+def _make_etag(*parts):
+    """由数据版本号等输入生成 ETag，输入不变则 ETag 不变。"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _not_modified(etag):
+    """请求携带的 If-None-Match 命中时返回 304 响应，否则返回 None。"""
+    if not request.if_none_match.contains(etag):
+        return None
+    resp = make_response("", 304)
+    return _with_etag(resp, etag)
+
+
+def _with_etag(resp, etag):
+    # no-cache：浏览器可缓存，但每次使用前都需带 If-None-Match 回源校验
+    resp = make_response(resp)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
@@ -0,0 +1,97 @@
+import sqlite3
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session as OrmSession
+
+# g 上的标记：当前请求处于报表只读作用域
+_SCOPE_KEY = "_read_replica_scope"
+# session.info 中的标记：本事务已写入，后续读取需走主连接才能看到未提交的数据
+_WROTE_KEY = "read_replica_wrote"
+
+# 只读连接上设置的 PRAGMA（journal_mode 等需写权限的项由主连接负责）
+_READ_PRAGMAS = ("cache_size", "mmap_size", "busy_timeout", "temp_store")
+
+
+class RoutingSession(Session):
+    """
+    报表只读作用域内，SELECT 路由到只读引擎（mode=ro），不占用写锁；
+    flush / INSERT / UPDATE / DELETE 以及本事务写入后的读取仍走主引擎。
+    未启用只读引擎或不在作用域内时，行为与默认 Session 一致。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get(_SCOPE_KEY):
+            if self._flushing or not getattr(clause, "is_select", False):
+                self.info[_WROTE_KEY] = True
+            elif not self.info.get(_WROTE_KEY):
+                engine = get_read_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(OrmSession, "after_commit")
+@event.listens_for(OrmSession, "after_rollback")
+def _reset_read_replica_wrote(session):
+    session.info.pop(_WROTE_KEY, None)
+
+
+def get_read_engine():
+    return current_app.extensions.get("sqlite_read_engine")
+
+
+def create_read_engine(database_path, pragmas, timeout=30):
+    """基于数据库文件创建只读引擎，连接时按主连接的配置设置缓存类 PRAGMA。"""
+    uri = Path(database_path).resolve().as_uri() + "?mode=ro"
+
+    def connect():
+        return sqlite3.connect(
+            uri, uri=True, timeout=timeout, check_same_thread=False
+        )
+
+    # "sqlite://" 默认使用面向内存库的 SingletonThreadPool，线程多于池大小时会关闭
+    # 其他请求线程仍在使用的连接；只读文件库显式使用 QueuePool
+    engine = create_engine(
+        "sqlite://", creator=connect, poolclass=QueuePool, pool_pre_ping=True
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply_read_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name in _READ_PRAGMAS:
+                if name in pragmas:
+                    cursor.execute(f"PRAGMA {name}={pragmas[name]}")
+            cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+@contextmanager
+def read_replica():
+    """进入报表只读作用域，可嵌套。"""
+    previous = g.get(_SCOPE_KEY, False)
+    setattr(g, _SCOPE_KEY, True)
+    try:
+        yield
+    finally:
+        setattr(g, _SCOPE_KEY, previous)
+
+
+def use_read_replica(view):
+    """路由装饰器：整个请求内的查询走只读连接（若已启用）。"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with read_replica():
+            return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,49 @@
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+# 导出文件超过该大小后转存到临时文件，避免大文件常驻内存
+XLSX_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+_THIN = Side(style="thin")
+# 与 pandas.to_excel 的表头样式保持一致
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+
+def _header_row(ws, columns):
+    cells = []
+    for col in columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def write_xlsx_stream(sheets):
+    """
+    以 openpyxl 只写模式逐行生成工作簿，内存占用与行数无关。
+    sheets: 可迭代的 (sheet_name, columns, rows)；rows 可以是生成器，
+    每行为 dict（按 columns 取值，缺失为空）或与 columns 等长的序列。
+    返回定位到开头的文件对象，可直接交给 send_file。
+    """
+    wb = Workbook(write_only=True)
+    for sheet_name, columns, rows in sheets:
+        columns = list(columns)
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append(_header_row(ws, columns))
+        for row in rows:
+            if isinstance(row, dict):
+                ws.append([row.get(col) for col in columns])
+            else:
+                ws.append(list(row))
+
+    output = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX_SIZE)
+    wb.save(output)
+    output.seek(0)
+    return output
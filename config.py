@@ -33,18 +33,68 @@ class Config:
     }
 
     # SQLite PRAGMA 开关（直接在代码中控制，适合打包 exe 使用）
-    # 可选: "conservative" / "performance"
-    SQLITE_MODE_PROFILE = "conservative"
+    # 可选: "conservative" / "performance" / "reporting"
+    # 以下 PRAGMA 在每个新建的数据库连接上统一设置（见 app/__init__.py）
+    SQLITE_MODE_PROFILE = os.environ.get("SQLITE_MODE_PROFILE", "conservative")
+
+    # 通用项：写锁等待毫秒数、WAL 自动检查点页数
+    SQLITE_BUSY_TIMEOUT = 30000
+    SQLITE_WAL_AUTOCHECKPOINT = 1000
 
     if SQLITE_MODE_PROFILE == "performance":
         SQLITE_JOURNAL_MODE = "WAL"
         SQLITE_SYNCHRONOUS = "NORMAL"
+        SQLITE_CACHE_SIZE = -16384  # 负数单位为 KiB，即 16MB
+        SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+    elif SQLITE_MODE_PROFILE == "reporting":
+        # 读多写少的统计报表场景：加大页缓存与内存映射，检查点间隔放宽
+        SQLITE_JOURNAL_MODE = "WAL"
+        SQLITE_SYNCHRONOUS = "NORMAL"
+        SQLITE_CACHE_SIZE = -65536  # 64MB
+        SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+        SQLITE_WAL_AUTOCHECKPOINT = 4000
     else:
         # 默认保守模式：更适合担心异常关机/断电场景
-        SQLITE_JOURNAL_MODE = "DELETE"
+        # WAL 让报表读取不阻塞成绩写入；synchronous=FULL 下每次提交都同步 WAL 文件，
+        # 断电安全性与原 DELETE 模式相同
+        SQLITE_JOURNAL_MODE = "WAL"
         SQLITE_SYNCHRONOUS = "FULL"
+        SQLITE_CACHE_SIZE = -8192  # 8MB
+        SQLITE_MMAP_SIZE = 0
+
+    # 统计报表、导出与日志查询使用只读连接（mode=ro），仅在 WAL 模式下生效。
+    # 三种模式均为 WAL；若数据库所在位置不支持 WAL（如网络共享目录），
+    # SQLite 会保持原日志模式，此开关不起作用（启动时会提示）
+    SQLITE_READ_REPLICA = True
+
+    # 综合成绩排名引擎
+    # 可选: "vectorized"（NumPy 向量化，默认）/ "reference"（纯 Python 参考实现，用于交叉核对）
+    STATS_RANK_ENGINE = os.environ.get("STATS_RANK_ENGINE", "vectorized")
+
+    # 统计排名进程池：综合排名、成绩趋势的矩阵构建与排名放到子进程，
+    # 避免长时间占用 GIL 阻塞其他请求
+    # 进程数为 0 时关闭；成绩行数低于阈值时仍在本线程计算
+    # （一个年级 1500 人、9 科约 1.3 万行，6 次考试的趋势约 8 万行，单个班级的趋势在阈值以下）
+    STATS_PROCESS_POOL_SIZE = int(os.environ.get("STATS_PROCESS_POOL_SIZE", 1))
+    STATS_PROCESS_POOL_MIN_ROWS = int(os.environ.get("STATS_PROCESS_POOL_MIN_ROWS", 5000))
+
+    # 统计排名结果缓存（翻页/关键字筛选复用，成绩变化比较按考试复用），TTL 为 0 时关闭缓存
+    STATS_RESULT_CACHE_SIZE = int(os.environ.get("STATS_RESULT_CACHE_SIZE", 64))
+    STATS_RESULT_CACHE_TTL = int(os.environ.get("STATS_RESULT_CACHE_TTL", 600))
 
     # JWT 或 Session 过期时间设置（可选）
     AUTH_TOKEN_EXPIRES_SECONDS = int(
         os.environ.get("AUTH_TOKEN_EXPIRES_SECONDS", 12 * 60 * 60)
     )
+
+    # 登录身份缓存（按 token 缓存账号、教师档案与密码签名校验结果），TTL 为 0 时关闭
+    # 改密、角色/审核状态变化时显式失效，TTL 仅作兜底
+    AUTH_IDENTITY_CACHE_SIZE = int(os.environ.get("AUTH_IDENTITY_CACHE_SIZE", 1024))
+    AUTH_IDENTITY_CACHE_TTL = int(os.environ.get("AUTH_IDENTITY_CACHE_TTL", 60))
+
+    # 教师保存成绩耗时超过该毫秒数时在控制台输出各阶段耗时，0 为不输出
+    # （各阶段耗时始终通过 Server-Timing 响应头返回）
+    SCORE_SAVE_SLOW_LOG_MS = int(os.environ.get("SCORE_SAVE_SLOW_LOG_MS", 1000))
+
+    # 后台任务（Excel 导入）线程数；SQLite 同一时间只允许一个写事务，默认 1 个即可
+    BACKGROUND_JOB_WORKERS = int(os.environ.get("BACKGROUND_JOB_WORKERS", 1))
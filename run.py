@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 from waitress import serve
@@ -15,10 +16,8 @@ except ModuleNotFoundError as e:
     input(f"导入错误: {e}\n按回车键退出...")  # 防止闪退
     sys.exit(1)
 
-app = create_app()
 
-
-def initialize_system():
+def initialize_system(app):
     """
     冷启动初始化：
     1) 自动创建数据库表
@@ -57,9 +56,13 @@ def initialize_system():
 
 
 if __name__ == "__main__":
+    # 统计进程池以 spawn 方式启动子进程：打包 exe 需要 freeze_support，
+    # 且应用只在主进程创建，子进程导入本模块时不会重复初始化
+    multiprocessing.freeze_support()
+    app = create_app()
 
     try:
-        initialize_system()
+        initialize_system(app)
 
         cpu_count = os.cpu_count() or 2
         default_threads = max(2, min(cpu_count, 4))
@@ -68,9 +71,10 @@ if __name__ == "__main__":
         print("系统启动中... 请访问 http://localhost:5173 进行调试")
         print(f"Waitress 线程数: {waitress_threads}")
         print(
-            "SQLite 模式: "
+            f"SQLite 模式: {app.config.get('SQLITE_MODE_PROFILE')}, "
             f"journal={app.config.get('SQLITE_JOURNAL_MODE')}, "
-            f"synchronous={app.config.get('SQLITE_SYNCHRONOUS')}"
+            f"synchronous={app.config.get('SQLITE_SYNCHRONOUS')}, "
+            f"只读连接={'已启用' if app.extensions.get('sqlite_read_engine') else '未启用'}"
         )
         print("注意：如需关闭服务器，请直接关闭此窗口")
         print("=" * 60)
@@ -16,6 +16,40 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// 后台任务轮询：导入/成绩回退接口返回 202 + job_id 后轮询任务状态，
+// 成功时以任务结果作为响应数据返回，失败时按普通接口错误抛出，调用方无需区分。
+const JOB_POLL_INTERVAL = 1000;
+// 轮询上限：任务因服务异常一直停在“执行中”时不再无限等待
+const JOB_POLL_TIMEOUT = 30 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export const getJob = (id) => api.get(`/jobs/${id}`);
+
+const waitForJob = async (res) => {
+  const jobId = res.data?.job_id;
+  if (res.status !== 202 || !jobId) return res;
+
+  const deadline = Date.now() + JOB_POLL_TIMEOUT;
+  while (Date.now() < deadline) {
+    await sleep(JOB_POLL_INTERVAL);
+    const { data: job } = await getJob(jobId);
+    if (job.status === "success") {
+      return { ...res, status: job.http_status, data: job.result };
+    }
+    if (job.status === "failed") {
+      const error = new Error(job.result?.msg || "导入失败");
+      error.response = { status: job.http_status, data: job.result };
+      throw error;
+    }
+  }
+
+  const error = new Error("后台任务等待超时，请稍后在导入记录中查看结果");
+  error.code = "ETIMEDOUT";
+  error.response = { status: 504, data: { msg: error.message, job_id: jobId } };
+  throw error;
+};
+
 // 用户与教师管理
 export const getPendingUsers = () => api.get("/pending_users");
 export const approveUser = (id) => api.post(`/approve_user/${id}`);
@@ -59,19 +93,23 @@ export const getSubjects = () => api.get("/subjects");
 
 // 学生导入
 export const importStudentsExcel = (formData) =>
-  api.post("/students/import", formData, {
-    headers: {
-      "Content-Type": "multipart/form-data",
-    },
-  });
+  api
+    .post("/students/import", formData, {
+      headers: {
+        "Content-Type": "multipart/form-data",
+      },
+    })
+    .then(waitForJob);
 
 // 教师导入
 export const importTeachersExcel = (formData) =>
-  api.post("/teachers/import", formData, {
-    headers: {
-      "Content-Type": "multipart/form-data",
-    },
-  });
+  api
+    .post("/teachers/import", formData, {
+      headers: {
+        "Content-Type": "multipart/form-data",
+      },
+    })
+    .then(waitForJob);
 
 // 教师密码重置
 export const resetTeacherPassword = (teacherId) =>
@@ -85,11 +123,13 @@ export const deleteExamTask = (id) => api.delete(`/exam_tasks/${id}`);
 
 // 任课分配导入导出
 export const importCourseAssignmentsExcel = (formData) =>
-  api.post("/assignments/import", formData, {
-    headers: {
-      "Content-Type": "multipart/form-data",
-    },
-  });
+  api
+    .post("/assignments/import", formData, {
+      headers: {
+        "Content-Type": "multipart/form-data",
+      },
+    })
+    .then(waitForJob);
 
 export const exportCourseAssignments = () =>
   api.get("/assignments/export", {
@@ -130,9 +170,11 @@ export const getScoreTemplate = (data) =>
 
 // 管理端成绩导入
 export const importAdminScores = (formData) =>
-  api.post("/stats/import_scores", formData, {
-    headers: { "Content-Type": "multipart/form-data" },
-  });
+  api
+    .post("/stats/import_scores", formData, {
+      headers: { "Content-Type": "multipart/form-data" },
+    })
+    .then(waitForJob);
 
 // 系统设置
 export const getSystemSettings = () => api.get("/system/settings");
@@ -141,7 +183,9 @@ export const updateSystemSettings = (data) =>
 
 // 导入历史与回退
 export const getImportHistory = (params) => api.get("/imports/history", { params });
-export const rollbackImportBatch = (id) => api.post(`/imports/${id}/rollback`);
+// 成绩批次回退在后台执行（202 + job_id），其他类型同步返回
+export const rollbackImportBatch = (id) =>
+  api.post(`/imports/${id}/rollback`).then(waitForJob);
 export const getAuditLogs = (params) => api.get("/audit_logs", { params });
 
 // 管理员成绩录入
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "test.db")
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def teacher_env(app):
+    """一名教师、一个班级（3 名学生）、该班的一门任课与一个进行中的考试任务。"""
+    from app.auth_utils import issue_access_token
+    from app.models import (
+        ClassInfo,
+        CourseAssignment,
+        ExamTask,
+        Student,
+        Subject,
+        Teacher,
+        User,
+        db,
+    )
+
+    with app.app_context():
+        subject = Subject.query.order_by(Subject.id).first()
+        user = User(username="t1", real_name="老师1", role="teacher", is_approved=True)
+        user.set_password("pw")
+        db.session.add(user)
+        db.session.flush()
+        teacher = Teacher(user_id=user.id, name="老师1")
+        cls = ClassInfo(entry_year=2024, class_num=1)
+        db.session.add_all([teacher, cls])
+        db.session.flush()
+        students = [
+            Student(student_id=f"S{i}", name=f"学生{i}", class_id=cls.id, status="在读")
+            for i in range(3)
+        ]
+        db.session.add_all(students)
+        db.session.add(
+            CourseAssignment(
+                teacher_id=teacher.id,
+                class_id=cls.id,
+                subject_id=subject.id,
+                academic_year=2024,
+            )
+        )
+        task = ExamTask(
+            name="期中",
+            entry_year=2024,
+            academic_year=2024,
+            subject_id=subject.id,
+            full_score=100,
+            is_active=True,
+        )
+        db.session.add(task)
+        db.session.commit()
+        return {
+            "headers": {"Authorization": f"Bearer {issue_access_token(user)}"},
+            "task_id": task.id,
+            "class_id": cls.id,
+            "subject_id": subject.id,
+            "student_ids": [s.id for s in students],
+        }
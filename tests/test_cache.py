@@ -0,0 +1,30 @@
+from app.utils.cache import TTLLRUCache
+
+
+def test_set_skipped_when_tag_invalidated_during_build():
+    cache = TTLLRUCache(maxsize=8, ttl=60)
+    generation = cache.generation()
+    # 计算期间写事务提交，按年级失效
+    cache.invalidate_tags({2024})
+    cache.set("rank", "stale", tags=(2024,), generation=generation)
+    assert cache.get("rank") is None
+    assert cache.stats()["stale_skips"] == 1
+
+
+def test_set_kept_when_other_tag_invalidated():
+    cache = TTLLRUCache(maxsize=8, ttl=60)
+    generation = cache.generation()
+    cache.invalidate_tags({2023})
+    cache.set("rank", "fresh", tags=(2024,), generation=generation)
+    assert cache.get("rank") == "fresh"
+
+
+def test_set_skipped_after_clear():
+    cache = TTLLRUCache(maxsize=8, ttl=60)
+    generation = cache.generation()
+    cache.clear()
+    cache.set("rank", "stale", tags=(2024,), generation=generation)
+    assert cache.get("rank") is None
+
+    cache.set("rank", "fresh", tags=(2024,), generation=cache.generation())
+    assert cache.get("rank") == "fresh"
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.services.compute_pool import run_compute_jobs
+from app.services.ranking_service import rank_trend_exam_rows
+
+
+def _trend_job():
+    # 3 名学生、2 科：学生 0 数学缺考，学生 2 无语文成绩；学生 1 的班级快照为 9
+    return (
+        3,
+        np.array([0, 0, 1, 1, 2]),
+        np.array([0, 1, 0, 1, 1]),
+        np.array([10, 11, 10, 11, 11]),
+        np.array([90.0, 0.0, 80.25, 70.0, 95.0]),
+        np.array([False, True, False, False, False]),
+        np.array([0, 0, 0, 9, 0]),
+        2,
+        [1, 0],
+        np.array([101.0, 102.0, 103.0]),
+        np.array([1, 1, 1]),
+    )
+
+
+def test_trend_exam_rows_in_thread():
+    ranks = rank_trend_exam_rows(*_trend_job())
+
+    assert ranks["display_rows"] == [[90.0, "缺考"], [80.2, 70.0], ["-", 95.0]]
+    assert ranks["display_totals"] == [90.0, 150.2, 95.0]
+    assert ranks["grade_rank_dense"].tolist() == [3, 1, 2]
+    # 学生 1 按快照班级单独排名
+    assert ranks["class_rank_dense"].tolist() == [2, 1, 1]
+
+
+def test_process_pool_matches_in_thread(app):
+    app.config.update(STATS_PROCESS_POOL_SIZE=1, STATS_PROCESS_POOL_MIN_ROWS=0)
+    job = _trend_job()
+
+    with app.app_context():
+        pooled = run_compute_jobs(rank_trend_exam_rows, [job], total_rows=5)[0]
+    local = rank_trend_exam_rows(*job)
+
+    assert pooled["display_rows"] == local["display_rows"]
+    for key in ("order", "totals", "grade_rank_dense", "class_rank_dense"):
+        assert np.array_equal(pooled[key], local[key])
@@ -0,0 +1,62 @@
+from app.models import ExamTask, db
+
+
+def _save_scores(client, env, value):
+    return client.post(
+        "/api/teacher/save_scores",
+        json={
+            "exam_task_id": env["task_id"],
+            "scores": [
+                {"student_id": sid, "score": value} for sid in env["student_ids"]
+            ],
+        },
+        headers=env["headers"],
+    )
+
+
+def test_score_save_keeps_my_courses_etag(app, client, teacher_env):
+    first = client.get("/api/teacher/my_courses", headers=teacher_env["headers"])
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    saved = _save_scores(client, teacher_env, 88)
+    assert saved.status_code == 200
+    with app.app_context():
+        assert db.session.get(ExamTask, teacher_env["task_id"]).score_version > 0
+
+    again = client.get(
+        "/api/teacher/my_courses",
+        headers={**teacher_env["headers"], "If-None-Match": etag},
+    )
+    assert again.status_code == 304
+
+
+def test_exam_task_change_refreshes_my_courses_etag(app, client, teacher_env):
+    etag = client.get(
+        "/api/teacher/my_courses", headers=teacher_env["headers"]
+    ).headers["ETag"]
+
+    with app.app_context():
+        db.session.get(ExamTask, teacher_env["task_id"]).full_score = 120
+        db.session.commit()
+
+    again = client.get(
+        "/api/teacher/my_courses",
+        headers={**teacher_env["headers"], "If-None-Match": etag},
+    )
+    assert again.status_code == 200
+
+
+def test_score_save_refreshes_dashboard_todos_etag(client, teacher_env):
+    first = client.get("/api/teacher/dashboard_todos", headers=teacher_env["headers"])
+    assert first.status_code == 200
+    assert first.get_json()["pending_items"]
+
+    assert _save_scores(client, teacher_env, 88).status_code == 200
+
+    again = client.get(
+        "/api/teacher/dashboard_todos",
+        headers={**teacher_env["headers"], "If-None-Match": first.headers["ETag"]},
+    )
+    assert again.status_code == 200
+    assert not again.get_json()["pending_items"]
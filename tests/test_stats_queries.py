@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.models import (
+    ClassInfo,
+    CourseAssignment,
+    ExamTask,
+    Score,
+    Student,
+    Subject,
+    Teacher,
+    User,
+    db,
+)
+from app.services.stats_service import build_teacher_score_stats
+
+
+@contextmanager
+def _count_queries():
+    counter = {"n": 0}
+
+    def before_cursor_execute(*args):
+        counter["n"] += 1
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _seed_grade(entry_year, n_classes, n_subjects, per_class=5):
+    subjects = Subject.query.order_by(Subject.id).limit(n_subjects).all()
+    user = User(username=f"t{entry_year}", role="teacher", is_approved=True)
+    user.set_password("pw")
+    db.session.add(user)
+    db.session.flush()
+    teacher = Teacher(user_id=user.id, name=f"老师{entry_year}")
+    db.session.add(teacher)
+
+    classes = [ClassInfo(entry_year=entry_year, class_num=n + 1) for n in range(n_classes)]
+    db.session.add_all(classes)
+    db.session.flush()
+
+    tasks = [
+        ExamTask(
+            name="期中",
+            entry_year=entry_year,
+            academic_year=2024,
+            subject_id=subject.id,
+            full_score=100,
+        )
+        for subject in subjects
+    ]
+    db.session.add_all(tasks)
+    db.session.flush()
+
+    for cls in classes:
+        for subject in subjects:
+            db.session.add(
+                CourseAssignment(
+                    teacher_id=teacher.id,
+                    class_id=cls.id,
+                    subject_id=subject.id,
+                    academic_year=2024,
+                )
+            )
+        for k in range(per_class):
+            student = Student(
+                student_id=f"{entry_year}{cls.class_num:02d}{k:02d}",
+                name=f"学生{k}",
+                class_id=cls.id,
+                status="在读",
+            )
+            db.session.add(student)
+            db.session.flush()
+            for task in tasks:
+                db.session.add(
+                    Score(
+                        student_id=student.id,
+                        exam_task_id=task.id,
+                        subject_id=task.subject_id,
+                        score=50 + 10 * k,
+                        class_id_snapshot=cls.id,
+                    )
+                )
+    db.session.commit()
+
+
+def _query_count(entry_year):
+    with _count_queries() as counter:
+        payload, err = build_teacher_score_stats(
+            {"entry_year": entry_year, "academic_year": 2024, "exam_name": "期中"}
+        )
+    assert err is None
+    assert payload
+    return counter["n"]
+
+
+def test_teacher_score_stats_query_count_is_fixed(app):
+    """查询次数与科目数、班级数无关（逐科目查询时随科目数线性增长）。"""
+    with app.app_context():
+        _seed_grade(2023, n_classes=1, n_subjects=1)
+        _seed_grade(2024, n_classes=4, n_subjects=6)
+
+        small = _query_count(2023)
+        large = _query_count(2024)
+
+    assert large == small
+    assert large <= 8